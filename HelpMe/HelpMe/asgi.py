@@ -1,13 +1,22 @@
 import os
-from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "HelpMe.settings")
+
+import django
+
+# Set up Django before importing anything that touches models
+django.setup(set_prefix=False)
+
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
-import ticket.routing  # 👈 make sure this works
+from ticket.db import BoundedASGIHandler
+import ticket.routing
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "chatproject.settings")
+# get_asgi_application(), with sync views capped at HTTP_THREADS
+django_asgi_app = BoundedASGIHandler()
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             ticket.routing.websocket_urlpatterns
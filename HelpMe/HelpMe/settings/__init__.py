@@ -0,0 +1,14 @@
+# Settings profile selected by HELPME_ENV: 'dev' (default) or 'prod'.
+# DJANGO_SETTINGS_MODULE stays HelpMe.settings either way.
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+_env = os.environ.get("HELPME_ENV", "dev")
+
+if _env == "prod":
+    from .prod import *  # noqa: F401,F403
+elif _env == "dev":
+    from .dev import *  # noqa: F401,F403
+else:
+    raise ImproperlyConfigured(f"Unknown HELPME_ENV {_env!r}; expected 'dev' or 'prod'")
@@ -0,0 +1,364 @@
+"""
+Django settings for HelpMe project: shared by every profile.
+
+Generated by 'django-admin startproject' using Django 5.2.6. The dev and prod
+profiles in this package extend it; HELPME_ENV picks one (see __init__.py).
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/5.2/ref/settings/
+"""
+
+import os
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+
+# Build paths inside the project like this: BASE_DIR / 'subdir'.
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+
+# Application definition
+
+INSTALLED_APPS = [
+    "daphne",
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'channels',
+    'ticket',
+]
+
+MIDDLEWARE = [
+    'ticket.middleware.InstrumentationMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'HelpMe.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'ticket.context_processors.roles',
+                'ticket.context_processors.notifications',
+            ],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'HelpMe.wsgi.application'
+ASGI_APPLICATION = 'HelpMe.asgi.application'
+
+# Channels Configuration
+# HELPME_CHANNEL_LAYER selects the layer:
+#   memory        - single process only (development)
+#   redis         - Redis pub/sub, lowest latency fan-out across workers
+#   redis-sharded - Redis lists sharded over every URL in HELPME_REDIS_URLS
+CHANNEL_LAYER_MODE = os.environ.get("HELPME_CHANNEL_LAYER", "memory")
+REDIS_URLS = [
+    url.strip()
+    for url in os.environ.get("HELPME_REDIS_URLS", "redis://localhost:6379/0").split(",")
+    if url.strip()
+]
+CHANNEL_CAPACITY = int(os.environ.get("HELPME_CHANNEL_CAPACITY", "1500"))
+
+if CHANNEL_LAYER_MODE == "memory":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {
+                "capacity": CHANNEL_CAPACITY,
+            },
+        },
+    }
+elif CHANNEL_LAYER_MODE == "redis":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {
+                "hosts": REDIS_URLS[:1],
+            },
+        },
+    }
+elif CHANNEL_LAYER_MODE == "redis-sharded":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": REDIS_URLS,
+                "capacity": CHANNEL_CAPACITY,
+                "expiry": 10,
+            },
+        },
+    }
+else:
+    raise ImproperlyConfigured(
+        f"Unknown HELPME_CHANNEL_LAYER {CHANNEL_LAYER_MODE!r}; "
+        "expected 'memory', 'redis' or 'redis-sharded'"
+    )
+
+ALLOWED_HOSTS = [
+    'localhost',
+    '127.0.0.1',
+]
+
+# WebSocket Config
+CSRF_TRUSTED_ORIGINS = [
+    'http://localhost:8000',
+    'http://127.0.0.1:8000',
+]
+
+
+
+# Database
+# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+
+# HELPME_DB_ENGINE is 'postgresql' (default, and required in production) or
+# 'sqlite' for a quick local setup. On SQLite, search falls back to icontains
+# matching (ticket/search.py) and blobs are not locked (ticket/storage.py).
+DB_ENGINE = os.environ.get("HELPME_DB_ENGINE", "postgresql")
+
+# HELPME_DB_CONNECTIONS selects how connections are reused:
+#   pool        - psycopg connection pool shared by all threads (PostgreSQL
+#                 default)
+#   persistent  - one connection per thread kept for HELPME_DB_CONN_MAX_AGE
+#   per-request - connect and disconnect around every request/consumer event
+#                 (SQLite default)
+# Under ASGI every request runs in a fresh thread, so only the pool actually
+# reuses connections there.
+DB_CONNECTION_MODE = os.environ.get(
+    "HELPME_DB_CONNECTIONS", "per-request" if DB_ENGINE == "sqlite" else "pool"
+)
+DB_POOL_MIN_SIZE = int(os.environ.get("HELPME_DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.environ.get("HELPME_DB_POOL_MAX_SIZE", "10"))
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("HELPME_DB_NAME", "helpme"),
+            "USER": os.environ.get("HELPME_DB_USER", "enddown"),
+            "PASSWORD": os.environ.get("HELPME_DB_PASSWORD", ""),
+            "HOST": os.environ.get("HELPME_DB_HOST", "localhost"),
+            "PORT": os.environ.get("HELPME_DB_PORT", "5432"),
+            "CONN_MAX_AGE": 0,
+            # Ping pooled or persistent connections before handing them out
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+    }
+elif DB_ENGINE == "sqlite":
+    if DB_CONNECTION_MODE == "pool":
+        raise ImproperlyConfigured("HELPME_DB_CONNECTIONS 'pool' needs PostgreSQL")
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("HELPME_DB_NAME", str(BASE_DIR / "db.sqlite3")),
+            "CONN_MAX_AGE": 0,
+            "OPTIONS": {},
+        }
+    }
+else:
+    raise ImproperlyConfigured(
+        f"Unknown HELPME_DB_ENGINE {DB_ENGINE!r}; expected 'postgresql' or 'sqlite'"
+    )
+
+if DB_CONNECTION_MODE == "pool":
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": DB_POOL_MIN_SIZE,
+        "max_size": DB_POOL_MAX_SIZE,
+        # Seconds a request waits for a free connection before erroring
+        "timeout": float(os.environ.get("HELPME_DB_POOL_TIMEOUT", "10")),
+        # Recycle connections so server-side memory doesn't creep up
+        "max_lifetime": 30 * 60,
+        "max_idle": 5 * 60,
+    }
+elif DB_CONNECTION_MODE == "persistent":
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("HELPME_DB_CONN_MAX_AGE", "60"))
+elif DB_CONNECTION_MODE != "per-request":
+    raise ImproperlyConfigured(
+        f"Unknown HELPME_DB_CONNECTIONS {DB_CONNECTION_MODE!r}; "
+        "expected 'pool', 'persistent' or 'per-request'"
+    )
+
+# Threads that can hold a pooled connection at once (see ticket/db.py):
+#   DB_THREADS   - consumer database work, one bounded executor
+#   HTTP_THREADS - HTTP requests inside Django's sync views at once (each
+#                  runs on a thread of its own under ASGI); 0 means no limit
+# By default the two split DB_POOL_MAX_SIZE between them, so sockets and
+# pages never wait on each other for a connection. Task runner threads
+# (TASK_THREADS) and management commands come on top and wait up to
+# HELPME_DB_POOL_TIMEOUT when the pool is busy; raise the pool to
+# DB_THREADS + HTTP_THREADS + TASK_THREADS to avoid that.
+DB_THREADS = int(os.environ.get("HELPME_DB_THREADS", str(max(1, DB_POOL_MAX_SIZE // 2))))
+HTTP_THREADS = int(os.environ.get("HELPME_HTTP_THREADS", str(max(1, DB_POOL_MAX_SIZE - DB_THREADS))))
+
+
+# Password validation
+# https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.CommonPasswordValidator',
+    },
+    {
+        'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
+    },
+]
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/5.2/topics/i18n/
+
+LANGUAGE_CODE = 'en-us'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.2/howto/static-files/
+
+STATIC_URL = 'static/'
+STATIC_ROOT = os.environ.get("HELPME_STATIC_ROOT", BASE_DIR / "staticfiles")
+
+STATICFILES_DIRS = [
+    BASE_DIR / "static",
+]
+
+# Media files (user uploads)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / "media"
+
+# How access-checked downloads are delivered: 'django', 'x-accel' (nginx)
+# or 'x-sendfile' (Apache/lighttpd). See ticket/media.py.
+MEDIA_SERVE_MODE = os.environ.get("HELPME_MEDIA_SERVE_MODE", "django")
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# The in-memory channel layer only delivers sends made on the server's own
+# event loop, so with it background work stays on the request's thread
+# instead of pool threads (TASK_MODE 'inline', CHAT_PREVIEW_WORKERS 0)
+IN_PROCESS_CHANNEL_LAYER = CHANNEL_LAYER_MODE == "memory"
+
+# Thumbnails of shared images and first pages of PDFs (see ticket/previews.py),
+# rendered by a process pool; 0 workers renders in the calling thread
+CHAT_PREVIEW_WORKERS = int(os.environ.get("HELPME_PREVIEW_WORKERS", "0" if IN_PROCESS_CHANNEL_LAYER else "2"))
+CHAT_PREVIEW_SIZE = 320
+CHAT_PREVIEW_QUALITY = 80
+
+
+# Default primary key field type
+# https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+LOGIN_URL = ''
+
+# Background tasks (see ticket/tasks.py). HELPME_TASK_MODE:
+#   thread - every web process drains the queue on TASK_THREADS threads
+#   worker - only `manage.py run_tasks` processes drain it
+#   inline - run right after the queuing transaction commits, no queue
+TASK_MODE = os.environ.get("HELPME_TASK_MODE", "inline" if IN_PROCESS_CHANNEL_LAYER else "thread")
+TASK_THREADS = int(os.environ.get("HELPME_TASK_THREADS", "2"))
+TASK_MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubled after every further failure
+TASK_RETRY_DELAY = 2
+# Seconds a claimed task is reserved; a worker that dies gives it up then
+TASK_LEASE = 300
+TASK_POLL_INTERVAL = 1.0
+
+# Write-behind chat persistence: broadcast first, then bulk insert in batches
+CHAT_WRITE_BEHIND = os.environ.get("HELPME_CHAT_WRITE_BEHIND", "0") == "1"
+CHAT_WRITE_BEHIND_BATCH = 100
+CHAT_WRITE_BEHIND_INTERVAL_MS = 20
+CHAT_WRITE_BEHIND_MAX_PENDING = 5000
+CHAT_WRITE_BEHIND_MAX_ATTEMPTS = 3
+
+# Chat presence and typing (see ticket/presence.py). Members are kept in this
+# process with the in-memory layer and in Redis otherwise; a member missing
+# CHAT_PRESENCE_TTL seconds of the client's 30s pings is gone.
+CHAT_PRESENCE_URL = os.environ.get("HELPME_PRESENCE_URL", "" if IN_PROCESS_CHANNEL_LAYER else REDIS_URLS[0])
+CHAT_PRESENCE_TTL = 75
+# At most one presence/typing broadcast per room per process per interval
+CHAT_TYPING_INTERVAL = 1.0
+
+# Chat backpressure (see ChatConsumer). Frames per second and burst allowed
+# per socket and per user (across the user's sockets in one process);
+# refused frames get one error, and a socket that keeps sending anyway is
+# closed after CHAT_MAX_REFUSED_FRAMES
+CHAT_MAX_FRAME_SIZE = 16 * 1024
+CHAT_SOCKET_RATE = 5
+CHAT_SOCKET_BURST = 20
+CHAT_USER_RATE = 10
+CHAT_USER_BURST = 40
+CHAT_MAX_REFUSED_FRAMES = 100
+# Messages being saved by one process before new ones are refused as busy
+CHAT_MAX_PENDING_WRITES = 200
+# Seconds a socket may fall behind its room: past the first it stops getting
+# presence/typing, past the second it is closed and the client reloads
+CHAT_DOWNGRADE_LAG = 2.0
+CHAT_MAX_LAG = 10.0
+
+# Seconds a user's group membership stays cached per process
+ROLE_CACHE_TTL = 300
+ROLE_CACHE_SIZE = 10000
+
+# Route new tickets to the least-loaded agent (see ticket/assignment.py)
+TICKET_AUTO_ASSIGN = os.environ.get("HELPME_AUTO_ASSIGN", "1") == "1"
+
+# Prometheus scrape endpoint (/metrics). Scrapers must send
+# "Authorization: Bearer <token>"; without a token the endpoint is off (404).
+METRICS_TOKEN = os.environ.get("HELPME_METRICS_TOKEN", "")
+
+# Logging: level-gated so debug chatter on the chat hot path is dropped
+# before any formatting or I/O happens
+LOG_LEVEL = os.environ.get("HELPME_LOG_LEVEL", "INFO")
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "structured": {
+            "format": "time=%(asctime)s level=%(levelname)s logger=%(name)s process=%(process)d msg=%(message)s",
+        },
+    },
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+            "formatter": "structured",
+        },
+    },
+    "loggers": {
+        "ticket": {
+            "handlers": ["console"],
+            "level": LOG_LEVEL,
+            "propagate": False,
+        },
+    },
+}
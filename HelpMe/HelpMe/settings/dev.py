@@ -0,0 +1,18 @@
+# Development profile: debug pages, per-process cache, Django serves static.
+from .base import *  # noqa: F401,F403
+
+HELPME_ENV = "dev"
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = os.environ.get(
+    "HELPME_SECRET_KEY",
+    'django-insecure-#47yo3vx@h783^)-hs$nz0f&!fdlx*u9&dg3h@y+5=j39nn%ew',
+)
+
+DEBUG = True
+
+CACHES = {
+    "default": {
+        "BACKEND": "ticket.cache_backends.InstrumentedLocMemCache",
+    }
+}
@@ -0,0 +1,59 @@
+# Production profile. Every setting here trades development convenience for
+# throughput; ticket/checks.py refuses to start if one of them is undone.
+from .base import *  # noqa: F401,F403
+
+HELPME_ENV = "prod"
+
+try:
+    SECRET_KEY = os.environ["HELPME_SECRET_KEY"]
+except KeyError:
+    raise ImproperlyConfigured("HELPME_SECRET_KEY must be set in production")
+
+DEBUG = False
+
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.environ.get("HELPME_ALLOWED_HOSTS", "").split(",")
+    if host.strip()
+]
+CSRF_TRUSTED_ORIGINS = [
+    origin.strip()
+    for origin in os.environ.get("HELPME_CSRF_TRUSTED_ORIGINS", "").split(",")
+    if origin.strip()
+]
+
+# Compress responses; the middleware pads output against BREACH
+MIDDLEWARE = ["django.middleware.gzip.GZipMiddleware"] + MIDDLEWARE
+
+# Parse each template once per process
+TEMPLATES[0]["APP_DIRS"] = False
+TEMPLATES[0]["OPTIONS"]["loaders"] = [
+    ("django.template.loaders.cached.Loader", [
+        "django.template.loaders.filesystem.Loader",
+        "django.template.loaders.app_directories.Loader",
+    ]),
+]
+
+# Hashed names so assets can be cached forever, with .gz (and .br when the
+# brotli package is installed) written next to them for the web server
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "ticket.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
+# Shared cache: FAQ pages, unread counters and file lookups must agree
+# across workers
+CACHES = {
+    "default": {
+        "BACKEND": "ticket.cache_backends.InstrumentedRedisCache",
+        "LOCATION": os.environ.get("HELPME_CACHE_URL", REDIS_URLS[0]),
+        "KEY_PREFIX": "helpme",
+        "TIMEOUT": 300,
+    }
+}
+
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.core.exceptions import ImproperlyConfigured
 
 
 class TicketConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ticket'
+
+    def ready(self):
+        from . import jobs, signals  # noqa: F401
+        from .checks import production_settings
+
+        # Refuse to start in production with a slow configuration
+        errors = [error for error in production_settings() if error.is_serious()]
+        if errors:
+            raise ImproperlyConfigured(
+                'Production settings check failed:\n' + '\n'.join(str(error) for error in errors)
+            )
@@ -0,0 +1,121 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Ticket
+from .roles import AGENTS
+
+
+# Auto-assignment of new tickets. Every agent has a load counter in the cache:
+# the weighted number of open tickets assigned to them, where a high-priority
+# ticket weighs more than a low one. A new ticket goes to the agent with the
+# lowest load; ties are broken round-robin so equally idle agents take turns.
+#
+# Counters move by O(1) cache increments when tickets are assigned,
+# unassigned, closed, reprioritized or deleted (signals.py), once the change
+# commits. A missing counter is rebuilt from the database with one aggregate
+# over the agents that need it, so a cold or evicted cache corrects itself.
+
+PRIORITY_WEIGHTS = {
+    Ticket.Priority.HIGH: 3,
+    Ticket.Priority.MEDIUM: 2,
+    Ticket.Priority.LOW: 1,
+}
+OPEN_STATUSES = (Ticket.Status.OPEN, Ticket.Status.IN_PROGRESS)
+
+LOAD_TIMEOUT = 60 * 60 * 24
+TURN_KEY = 'assignment:turn'
+
+
+def _load_key(user_id):
+    return f'agent_load:{user_id}'
+
+
+def weight(status, priority):
+    # Contribution of one ticket to each of its assignees' load
+    if status not in OPEN_STATUSES:
+        return 0
+    return PRIORITY_WEIGHTS.get(priority, PRIORITY_WEIGHTS[Ticket.Priority.MEDIUM])
+
+
+def _count_loads(user_ids):
+    rows = (
+        Ticket.assign.through.objects
+        .filter(user_id__in=user_ids, ticket__status__in=OPEN_STATUSES)
+        .values_list('user_id', 'ticket__priority')
+        .annotate(count=Count('id'))
+    )
+    counted = {}
+    for user_id, priority, count in rows:
+        counted[user_id] = counted.get(user_id, 0) + count * weight(Ticket.Status.OPEN, priority)
+    return counted
+
+
+def loads(user_ids):
+    # {user_id: load}; only agents without a cached counter touch the database
+    keys = {_load_key(user_id): user_id for user_id in user_ids}
+    cached = cache.get_many(keys)
+    result = {keys[key]: value for key, value in cached.items()}
+    missing = [user_id for user_id in user_ids if user_id not in result]
+    if missing:
+        counted = _count_loads(missing)
+        cache.set_many({_load_key(user_id): counted.get(user_id, 0) for user_id in missing}, LOAD_TIMEOUT)
+        for user_id in missing:
+            result[user_id] = counted.get(user_id, 0)
+    return result
+
+
+def adjust(user_ids, delta):
+    # Applied after commit, so a rolled back assignment never counts
+    if not delta or not user_ids:
+        return
+    user_ids = list(user_ids)
+
+    def apply():
+        for user_id in user_ids:
+            try:
+                cache.incr(_load_key(user_id), delta)
+            except ValueError:
+                # Not cached; the next read counts it from the database
+                pass
+
+    transaction.on_commit(apply)
+
+
+def forget(user_ids):
+    cache.delete_many([_load_key(user_id) for user_id in user_ids])
+
+
+def available_agents():
+    return list(
+        User.objects.filter(groups__name=AGENTS, is_active=True).order_by('id').values_list('id', flat=True)
+    )
+
+
+def _next_turn():
+    cache.add(TURN_KEY, 0, None)
+    try:
+        return cache.incr(TURN_KEY)
+    except ValueError:
+        return 0
+
+
+def choose_agent(exclude=()):
+    agents = [agent_id for agent_id in available_agents() if agent_id not in exclude]
+    if not agents:
+        return None
+    current = loads(agents)
+    lowest = min(current.values())
+    candidates = [agent_id for agent_id in agents if current[agent_id] == lowest]
+    return candidates[_next_turn() % len(candidates)]
+
+
+def assign(ticket):
+    # Give a new ticket to the least-loaded agent; returns the agent id, or
+    # None when there is no agent to give it to
+    agent_id = choose_agent(exclude={ticket.creator_id})
+    if agent_id is not None:
+        # The m2m_changed signal bumps the counter and notifies the agent
+        ticket.assign.add(agent_id)
+    return agent_id
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+
+# Production must not run with settings that are fine for development but
+# slow under load. These run with `manage.py check` and, in prod, at startup
+# (see TicketConfig.ready()), where any error stops the process.
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+    'ticket.cache_backends.InstrumentedLocMemCache',
+)
+
+
+def _uses_cached_loader():
+    template = settings.TEMPLATES[0]
+    loaders = template.get('OPTIONS', {}).get('loaders')
+    if loaders is None:
+        # Django wraps the default loaders in the cached loader itself
+        return True
+    first = loaders[0]
+    loader = first[0] if isinstance(first, (list, tuple)) else first
+    return loader == 'django.template.loaders.cached.Loader'
+
+
+@register('helpme')
+def production_settings(app_configs=None, **kwargs):
+    if getattr(settings, 'HELPME_ENV', 'dev') != 'prod':
+        return []
+
+    errors = []
+    if settings.DEBUG:
+        errors.append(Error(
+            'DEBUG is on in production.',
+            hint='DEBUG keeps every SQL query in memory and renders debug pages.',
+            id='helpme.E001',
+        ))
+    if settings.CACHES['default']['BACKEND'] in LOCAL_CACHES:
+        errors.append(Error(
+            'The default cache is local to each process.',
+            hint='FAQ pages, unread counters and file lookups need a shared cache (HELPME_CACHE_URL).',
+            id='helpme.E002',
+        ))
+    if getattr(settings, 'DB_ENGINE', 'postgresql') != 'postgresql':
+        errors.append(Error(
+            'Production runs on PostgreSQL only.',
+            hint="Unset HELPME_DB_ENGINE or set it to 'postgresql'.",
+            id='helpme.E010',
+        ))
+    if getattr(settings, 'DB_CONNECTION_MODE', None) == 'per-request':
+        errors.append(Error(
+            'Database connections are opened per request.',
+            hint="Set HELPME_DB_CONNECTIONS to 'pool'.",
+            id='helpme.E003',
+        ))
+    if not _uses_cached_loader():
+        errors.append(Error(
+            'Templates are not loaded through the cached loader.',
+            id='helpme.E004',
+        ))
+    staticfiles = settings.STORAGES.get('staticfiles', {}).get('BACKEND', '')
+    if 'Manifest' not in staticfiles:
+        errors.append(Error(
+            'Static files are not stored with hashed names.',
+            hint='Use ticket.storage.CompressedManifestStaticFilesStorage so assets can be cached forever.',
+            id='helpme.E005',
+        ))
+    if settings.CHANNEL_LAYERS['default']['BACKEND'] == 'channels.layers.InMemoryChannelLayer':
+        errors.append(Error(
+            'The in-memory channel layer only reaches sockets in the same process.',
+            hint="Set HELPME_CHANNEL_LAYER to 'redis' or 'redis-sharded'.",
+            id='helpme.E006',
+        ))
+    if getattr(settings, 'TASK_MODE', None) == 'inline':
+        errors.append(Error(
+            'Background tasks run inline.',
+            hint="Set HELPME_TASK_MODE to 'thread' or 'worker'.",
+            id='helpme.E007',
+        ))
+    if not getattr(settings, 'CHAT_PRESENCE_URL', ''):
+        errors.append(Error(
+            'Chat presence is kept in each process.',
+            hint='Set HELPME_PRESENCE_URL to a Redis URL shared by all workers.',
+            id='helpme.E008',
+        ))
+    if not getattr(settings, 'METRICS_TOKEN', ''):
+        errors.append(Error(
+            'The /metrics endpoint has no token.',
+            hint='Set HELPME_METRICS_TOKEN and have Prometheus send it as a Bearer token.',
+            id='helpme.E009',
+        ))
+    if settings.MEDIA_SERVE_MODE == 'django':
+        errors.append(Warning(
+            'Chat files are streamed through Django.',
+            hint="Set HELPME_MEDIA_SERVE_MODE to 'x-accel' or 'x-sendfile' behind a web server.",
+            id='helpme.W001',
+        ))
+    return errors
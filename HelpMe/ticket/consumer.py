@@ -1,60 +1,184 @@
+import asyncio
 import json
+import logging
+import time
+from collections import OrderedDict
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+from . import jobs, metrics, notifications, presence, ratelimit, tasks, unread
+from .db import database_sync_to_async
+from .dashboard import DASHBOARD_GROUP
+from .message_buffer import BufferFull, get_buffer, write_behind_enabled
 from .models import Ticket, Message
-from asgiref.sync import sync_to_async
+from .pagination import message_history
+from .roles import can_access_ticket, is_agent
+from .serializers import serialize_message
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedConsumerMixin:
+    # Per-event latency, query count/time and cache hits for /metrics
+    # (the consumer side of middleware.InstrumentationMiddleware)
+
+    async def dispatch(self, message):
+        stats = metrics.Stats()
+        token = metrics.current.set(stats)
+        started = time.perf_counter()
+        try:
+            await super().dispatch(message)
+        finally:
+            metrics.current.reset(token)
+            consumer = self.__class__.__name__
+            event = message.get('type', 'unknown')
+            metrics.WS_DURATION.observe(time.perf_counter() - started, consumer=consumer, event=event)
+            metrics.WS_QUERIES.observe(stats.queries, consumer=consumer, event=event)
+            metrics.WS_QUERY_TIME.observe(stats.query_time, consumer=consumer, event=event)
+            metrics.WS_CACHE_LOOKUPS.inc(stats.cache_hits, consumer=consumer, event=event, result='hit')
+            metrics.WS_CACHE_LOOKUPS.inc(stats.cache_misses, consumer=consumer, event=event, result='miss')
+
+
+class ChatConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
+    history_page_size = 50
+    # Room events a socket that is falling behind can do without
+    optional_events = {'chat_presence'}
+    # Messages this process's sockets are saving right now
+    pending_writes = 0
 
-class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        print("\n=== WebSocket Connection Attempt ===")
+        # Per-connection state, all set before the first await: disconnect(),
+        # dispatch() and receive() may run once connect() yields
+        self.ticket_id = None
+        self.room_group_name = None
+        self.ticket = None
+        self.present = False  # in the room's presence
+        self.closing = False
+        self.typed_at = 0
+        self.frames = ratelimit.socket_bucket()
+        self.refused = 0
         try:
             # Verify
             if not self.scope["user"].is_authenticated:
-                print("Connection rejected: User not authenticated")
+                logger.debug("Chat connection rejected: not authenticated")
                 await self.close()
                 return
 
-            self.ticket_id = self.scope['url_route']['kwargs']['ticket_id']
+            self.ticket_id = int(self.scope['url_route']['kwargs']['ticket_id'])
             self.room_group_name = f'chat_{self.ticket_id}'
-            print(f"Connection attempt - User: {self.scope['user'].username}, Ticket: {self.ticket_id}")
 
             # Check access
             ticket = await self.get_ticket()
             if not ticket:
-                print(f"Connection rejected: No access to ticket {self.ticket_id}")
+                logger.debug("Chat connection rejected: user %s has no access to ticket %s",
+                             self.scope['user'].id, self.ticket_id)
                 await self.close()
                 return
-            print(f"Access granted")
+            # Access is checked once per connection; frames reuse the ticket
+            self.ticket = ticket
 
             await self.accept()
-            print("WebSocket connection accepted")
 
             await self.channel_layer.group_add(
                 self.room_group_name,
                 self.channel_name
             )
-            print(f"Joined chat group: {self.room_group_name}")
+            await presence.join(self.room_group_name, self.scope['user'], self.channel_name)
+            self.present = True
+            logger.debug("User %s joined %s", self.scope['user'].id, self.room_group_name)
 
-        except Exception as e:
-            print(f"WebSocket connect error: {e}")
+        except Exception:
+            logger.exception("Chat connect failed")
             await self.close()
 
     async def disconnect(self, close_code):
         try:
-            if hasattr(self, 'room_group_name'):
+            if write_behind_enabled():
+                await get_buffer().flush()
+            if self.ticket is not None:
+                # Everything broadcast while connected has been seen
+                await self.mark_read()
+            if self.present:
+                await presence.leave(self.room_group_name, self.scope['user'], self.channel_name)
+            if self.room_group_name is not None:
                 await self.channel_layer.group_discard(
                     self.room_group_name,
                     self.channel_name
                 )
-        except Exception as e:
-            print(f"WebSocket disconnect error: {e}")
+        except Exception:
+            logger.exception("Chat disconnect failed")
+
+    async def dispatch(self, message):
+        # Backpressure towards slow sockets: room events carry the time they
+        # were sent, and a socket CHAT_DOWNGRADE_LAG behind skips optional
+        # ones while one CHAT_MAX_LAG behind is closed before its channel
+        # fills up and the layer starts dropping messages silently
+        sent_at = message.get('sent_at')
+        if sent_at is not None:
+            if self.closing:
+                return
+            lag = time.time() - sent_at
+            if lag > settings.CHAT_MAX_LAG:
+                metrics.CHAT_BACKPRESSURE.inc(reason='slow_socket')
+                logger.warning("Closing chat socket %s: %.1fs behind %s", self.channel_name, lag, self.room_group_name)
+                await self.shut(4008)
+                return
+            if lag > settings.CHAT_DOWNGRADE_LAG and message['type'] in self.optional_events:
+                metrics.CHAT_BACKPRESSURE.inc(reason='lagging')
+                return
+        await super().dispatch(message)
+
+    async def shut(self, code):
+        # Close once; frames and room events still in flight are ignored
+        self.closing = True
+        await self.close(code=code)
+
+    async def refuse(self, reason, error, retry_after):
+        # Tell the client once per run of refused frames; close the socket
+        # if it keeps sending anyway
+        metrics.CHAT_BACKPRESSURE.inc(reason=reason)
+        self.refused += 1
+        if self.refused > settings.CHAT_MAX_REFUSED_FRAMES:
+            logger.warning("Closing chat socket of user %s: too many refused frames", self.scope['user'].id)
+            await self.shut(4029)
+        elif self.refused == 1:
+            await self.send(text_data=json.dumps({'error': error, 'retry_after': round(retry_after, 1)}))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if self.closing:
+            return
+        if text_data is None or len(text_data) > settings.CHAT_MAX_FRAME_SIZE:
+            metrics.CHAT_BACKPRESSURE.inc(reason='frame_size')
+            await self.shut(1009)
+            return
+        # Per socket, then per user across this process's sockets
+        user_frames = ratelimit.user_bucket(self.scope['user'].id)
+        if not self.frames.take():
+            await self.refuse('rate_limited', 'Rate limit exceeded', self.frames.retry_after())
+            return
+        if not user_frames.take():
+            await self.refuse('rate_limited', 'Rate limit exceeded', user_frames.retry_after())
+            return
+        self.refused = 0
 
-    async def receive(self, text_data):
         try:
             data = json.loads(text_data)
             if data.get('type') == 'ping':
+                # The ping doubles as the presence heartbeat
+                await presence.join(self.room_group_name, self.scope['user'], self.channel_name)
                 await self.send(text_data=json.dumps({'type': 'pong'}))
                 return
+            if data.get('type') == 'history':
+                await self.send_history(data.get('before'))
+                return
+            if data.get('type') == 'typing':
+                # At most one typing frame per socket per interval; the room
+                # broadcast is coalesced further in presence.py
+                now = time.monotonic()
+                if now - self.typed_at >= settings.CHAT_TYPING_INTERVAL:
+                    self.typed_at = now
+                    presence.typing(self.room_group_name, self.scope['user'])
+                return
 
             message = data.get('message', '').strip()
             if not message:
@@ -64,26 +188,35 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if not user.is_authenticated:
                 return
 
-            # Save message
-            saved_message = await self.save_message(message)
-            if not saved_message:
-                return
+            # Save message, or queue it when write-behind is on
+            payload = self.buffer_message(message) if write_behind_enabled() else None
+            if payload is None:
+                if ChatConsumer.pending_writes >= settings.CHAT_MAX_PENDING_WRITES:
+                    # Refuse rather than queue behind a database that is
+                    # already not keeping up
+                    await self.refuse('busy', 'Server busy', 1.0)
+                    return
+                ChatConsumer.pending_writes += 1
+                try:
+                    saved_message = await self.save_message(message)
+                finally:
+                    ChatConsumer.pending_writes -= 1
+                if not saved_message:
+                    return
+                payload = serialize_message(saved_message)
 
             # Send message to room group
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'chat_message',
-                    'message': message,
-                    'username': user.username,
-                    'timestamp': saved_message.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    'is_file': saved_message.is_file_message,
-                    'file_name': saved_message.file_name if saved_message.is_file_message else None,
-                    'file_size': saved_message.file_size_mb if saved_message.is_file_message else None
+                    'sent_at': time.time(),
+                    **payload
                 }
             )
-        except Exception as e:
-            print(f"WebSocket receive error: {e}")
+            await self.notify_message(message)
+        except Exception:
+            logger.exception("Chat receive failed")
             await self.send(text_data=json.dumps({
                 'error': 'Failed to process message'
             }))
@@ -92,34 +225,237 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def chat_message(self, event):
         try:
             await self.send(text_data=json.dumps({
+                'id': event.get('id'),
                 'message': event['message'],
                 'username': event['username'],
                 'timestamp': event.get('timestamp'),
                 'is_file': event.get('is_file', False),
                 'file_name': event.get('file_name'),
-                'file_url': event.get('file_url')
+                'file_url': event.get('file_url'),
+                'thumbnail_url': event.get('thumbnail_url')
+            }))
+        except Exception:
+            logger.exception("Chat broadcast failed")
+
+    # A shared image or PDF has been rendered (previews.py)
+    async def chat_message_preview(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'preview',
+            'id': event['id'],
+            'thumbnail_url': event['thumbnail_url']
+        }))
+
+    # Who is online (when it changed) and who typed in the last interval
+    async def chat_presence(self, event):
+        if 'online' in event:
+            await self.send(text_data=json.dumps({
+                'type': 'presence',
+                'users': event['online']
             }))
-        except Exception as e:
-            print(f"WebSocket chat_message error: {e}")
+        typing = [user for user in event['typing'] if user['id'] != self.scope['user'].id]
+        if typing:
+            await self.send(text_data=json.dumps({
+                'type': 'typing',
+                'users': typing
+            }))
+
+    # Buffered messages have been written and now have real ids
+    async def chat_message_saved(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'saved',
+            'messages': event['messages']
+        }))
+
+    # Buffered messages that could not be written (message_buffer.py)
+    async def chat_message_failed(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'failed',
+            'messages': event['messages']
+        }))
 
-    @sync_to_async
+    async def send_history(self, before):
+        if before is not None and not str(before).isdigit():
+            await self.send(text_data=json.dumps({'error': 'Invalid message id'}))
+            return
+        history, has_more = await self.get_history(int(before) if before else None)
+        await self.send(text_data=json.dumps({
+            'type': 'history',
+            'messages': history,
+            'has_more': has_more
+        }))
+
+    @database_sync_to_async
+    def get_history(self, before):
+        history, has_more = message_history(self.ticket_id, before=before, limit=self.history_page_size)
+        return [serialize_message(message) for message in history], has_more
+
+    @database_sync_to_async
     def get_ticket(self):
         try:
-            ticket = Ticket.objects.get(id=self.ticket_id)
+            ticket = Ticket.objects.only('id', 'title', 'creator_id', 'status').get(id=self.ticket_id)
             user = self.scope['user']
 
-            if user.groups.filter(name='Agents').exists() or ticket.creator == user:
+            if can_access_ticket(user, ticket):
                 return ticket
             return None
         except Ticket.DoesNotExist:
             return None
 
-    @sync_to_async
+    @database_sync_to_async
+    def mark_read(self):
+        unread.mark_read(self.scope['user'], self.ticket_id)
+
+    @database_sync_to_async
+    def notify_message(self, content):
+        # Fan-out runs as a background task; the socket only queues it
+        try:
+            tasks.enqueue(jobs.message_posted, self.ticket_id, self.scope['user'].id, content)
+        except Exception:
+            logger.exception("Queuing notifications failed for ticket %s", self.ticket_id)
+
+    def buffer_message(self, content):
+        # Queue for the write-behind buffer and return a provisional payload,
+        # or None when the buffer is full and the caller should insert directly
+        message = Message(
+            user=self.scope['user'],
+            ticket_id=self.ticket_id,
+            msg=content,
+            created_at=timezone.now()
+        )
+        try:
+            provisional_id = get_buffer().add(message, self.room_group_name)
+        except BufferFull:
+            return None
+        return {**serialize_message(message), 'id': provisional_id}
+
+    @database_sync_to_async
     def save_message(self, content):
+        # One INSERT plus the ticket's counters: the ticket was authorized in
+        # connect(), so only its id is needed here. Not Message.objects.acreate:
+        # the async ORM runs every call on asgiref's one shared thread, and the
+        # insert and the counters have to share a transaction
         try:
-            user = self.scope['user']
-            ticket = Ticket.objects.get(id=self.ticket_id)
-            return Message.objects.create(user=user, ticket=ticket, msg=content)
-        except Exception as e:
-            print(f"Error saving message: {e}")
+            return unread.post_message(
+                user=self.scope['user'],
+                ticket_id=self.ticket_id,
+                msg=content
+            )
+        except Exception:
+            logger.exception("Saving message failed for ticket %s", self.ticket_id)
             return None
+
+
+class NotificationConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
+    # Per-user channel: every socket of a user joins user_<id>
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close()
+            return
+
+        self.group_name = notifications.user_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send_unread()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        if data.get('type') == 'ping':
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+        elif data.get('type') == 'mark_read':
+            ids = data.get('ids')
+            if ids is not None:
+                if not isinstance(ids, list):
+                    # Not "mark everything read" either; just ignore it
+                    return
+                ids = [int(i) for i in ids if str(i).isdigit()]
+            await database_sync_to_async(notifications.mark_read)(self.scope['user'], ids)
+            await self.send_unread()
+
+    async def send_unread(self):
+        count = await database_sync_to_async(notifications.unread_count)(self.scope['user'])
+        await self.send(text_data=json.dumps({'type': 'unread', 'count': count}))
+
+    async def notify(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'notification',
+            'id': event['id'],
+            'kind': event['kind'],
+            'ticket_id': event['ticket_id'],
+            'ticket_title': event['ticket_title'],
+            'message': event['message'],
+        }))
+
+
+class DashboardConsumer(InstrumentedConsumerMixin, AsyncWebsocketConsumer):
+    # Pushes ticket changes to the agent queue. Deltas arriving within
+    # `debounce` seconds are merged per ticket and sent as one frame, and
+    # fields this socket has already been sent are left out.
+    debounce = 0.5
+    max_tracked = 1000
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated or not await database_sync_to_async(is_agent)(user):
+            await self.close()
+            return
+
+        self.pending = {}
+        self.sent = OrderedDict()
+        self.flush_handle = None
+        await self.channel_layer.group_add(DASHBOARD_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'flush_handle', None):
+            self.flush_handle.cancel()
+        await self.channel_layer.group_discard(DASHBOARD_GROUP, self.channel_name)
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        if data.get('type') == 'ping':
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+
+    async def ticket_delta(self, event):
+        delta = event['delta']
+        self.pending.setdefault(delta['id'], {}).update(delta)
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(
+                self.debounce, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    async def flush(self):
+        self.flush_handle = None
+        pending, self.pending = self.pending, {}
+
+        changes = []
+        for ticket_id, delta in pending.items():
+            known = self.sent.get(ticket_id, {})
+            diff = {
+                key: value for key, value in delta.items()
+                if key == 'id' or known.get(key) != value
+            }
+            if len(diff) > 1:
+                changes.append(diff)
+            known.update({key: value for key, value in delta.items() if key != 'html'})
+            self.sent[ticket_id] = known
+            self.sent.move_to_end(ticket_id)
+        while len(self.sent) > self.max_tracked:
+            self.sent.popitem(last=False)
+
+        if changes:
+            await self.send(text_data=json.dumps({'type': 'tickets', 'changes': changes}))
@@ -0,0 +1,22 @@
+from functools import partial
+
+from .notifications import unread_count
+from .roles import is_admin, is_agent
+
+
+def roles(request):
+    # Templates call these lazily, so pages that never check a role pay nothing
+    user = getattr(request, 'user', None)
+    if user is None:
+        return {}
+    return {
+        'is_agent': partial(is_agent, user),
+        'is_admin': partial(is_admin, user),
+    }
+
+
+def notifications(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {'unread_notifications': partial(unread_count, user)}
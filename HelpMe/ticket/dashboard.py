@@ -0,0 +1,41 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.template.loader import render_to_string
+
+
+# Live agent dashboard: ticket changes are published once to a shared group
+# and each DashboardConsumer coalesces them per socket before sending.
+
+DASHBOARD_GROUP = 'agents_dashboard'
+
+
+def ticket_fields(ticket):
+    return {
+        'title': ticket.title,
+        'status': ticket.status,
+        'status_display': ticket.get_status_display(),
+        'priority': ticket.priority,
+        'priority_display': ticket.get_priority_display(),
+    }
+
+
+def publish(delta):
+    def send():
+        async_to_sync(get_channel_layer().group_send)(DASHBOARD_GROUP, {
+            'type': 'ticket_delta',
+            'delta': delta,
+        })
+    transaction.on_commit(send)
+
+
+def ticket_saved(ticket, created):
+    delta = {'id': ticket.id, **ticket_fields(ticket)}
+    if created:
+        # Rendered once here rather than once per connected agent
+        delta['html'] = render_to_string('_agent_ticket_rows.html', {'tickets': [ticket]})
+    publish(delta)
+
+
+def ticket_assignees_changed(ticket_id, assignee_ids):
+    publish({'id': ticket_id, 'assign': sorted(assignee_ids)})
@@ -0,0 +1,69 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+
+from .metrics import record_query
+
+
+# Consumer database work runs on one bounded thread pool sized to the
+# database connection pool (settings.DB_THREADS). asgiref's default for
+# consumers is a single shared thread, which serializes every socket's
+# queries. Each call closes or returns its connection afterwards, like
+# channels' database_sync_to_async, so with pooling a thread only holds a
+# connection while it is actually querying.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.DB_THREADS, thread_name_prefix='helpme-db'
+                )
+    return _executor
+
+
+def database_sync_to_async(func):
+    def instrumented(*args, **kwargs):
+        # Count the queries against the current consumer event (metrics.py)
+        with connection.execute_wrapper(record_query):
+            return func(*args, **kwargs)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not settings.DB_THREADS:
+            # Run on asgiref's thread-sensitive thread instead (tests use
+            # this to keep queries on the test's own connection)
+            call = DatabaseSyncToAsync(instrumented)
+        else:
+            call = DatabaseSyncToAsync(instrumented, thread_sensitive=False, executor=get_executor())
+        return await call(*args, **kwargs)
+    return wrapper
+
+
+class BoundedASGIHandler(ASGIHandler):
+    # Django runs each request's sync middleware and view on a thread of its
+    # own (asgiref gives every request's ThreadSensitiveContext a fresh one),
+    # so nothing else bounds those threads or the pooled connections they
+    # take. At most settings.HTTP_THREADS requests get past here at once; the
+    # rest wait on the event loop, after their body has been read.
+    def __init__(self):
+        super().__init__()
+        limit = settings.HTTP_THREADS
+        self.semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def run_get_response(self, request):
+        if self.semaphore is None:
+            return await super().run_get_response(request)
+        async with self.semaphore:
+            return await super().run_get_response(request)
@@ -0,0 +1,78 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+from .models import FAQ
+
+
+# FAQ content changes rarely and is read on every visit, so it is served from
+# a versioned cache. The version is the time of the last change (post_save/
+# post_delete on FAQ bump it); every key is derived from it, so stale entries
+# are simply never read again and expire on their own.
+
+FAQ_TIMEOUT = 60 * 60 * 24
+VERSION_KEY = 'faq:version'
+
+
+def version():
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        # Cold cache: treat now as the last change so clients revalidate once
+        current = time.time_ns() // 1000
+        if not cache.add(VERSION_KEY, current, None):
+            current = cache.get(VERSION_KEY, current)
+    return current
+
+
+def invalidate():
+    cache.set(VERSION_KEY, max(time.time_ns() // 1000, version() + 1), None)
+
+
+def last_modified():
+    return datetime.fromtimestamp(version() / 1e6, tz=timezone.utc)
+
+
+def etag(*parts):
+    raw = ':'.join(str(part) for part in (version(),) + parts)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def _build_index():
+    labels = dict(FAQ.CATEGORY_CHOICES)
+    rows = FAQ.objects.order_by('category', '-created_at').values(
+        'id', 'question', 'answer', 'category', 'created_at'
+    )
+    by_id = {}
+    categories = {}
+    for row in rows:
+        row['category_display'] = labels.get(row['category'], row['category'])
+        by_id[row['id']] = row
+        categories.setdefault(row['category'], []).append(row['id'])
+    return {'by_id': by_id, 'categories': categories}
+
+
+def faq_index():
+    # {'by_id': {id: faq}, 'categories': {category: [id, ...]}}; faqs are
+    # plain dicts so the index pickles small and renders like model rows
+    key = f'faq:index:{version()}'
+    index = cache.get(key)
+    if index is None:
+        index = _build_index()
+        cache.set(key, index, FAQ_TIMEOUT)
+    return index
+
+
+def categories():
+    # [(category, label, [faq, ...]), ...] in the page's display order
+    index = faq_index()
+    labels = dict(FAQ.CATEGORY_CHOICES)
+    return [
+        (category, labels.get(category, category), [index['by_id'][faq_id] for faq_id in ids])
+        for category, ids in sorted(index['categories'].items())
+    ]
+
+
+def get_faq(faq_id):
+    return faq_index()['by_id'].get(faq_id)
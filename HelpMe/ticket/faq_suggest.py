@@ -0,0 +1,178 @@
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from . import faq_cache
+
+
+# Typeahead FAQ suggestions for the new-ticket form. Each process keeps an
+# in-memory TF-IDF inverted index over FAQ questions and answers. Before a
+# query the index is synced against the versioned FAQ cache (faq_cache), and
+# only FAQs that were added, edited or deleted since the last sync are
+# re-indexed, so a change costs work proportional to that FAQ alone.
+#
+# Queries walk each term's "champion list" only: the CHAMPION_SIZE FAQs it
+# weighs most in, stored as (faq_id, weight) pairs. Rare terms are scored
+# exactly. Common terms have a low idf, and their long tail is dropped, so a
+# query costs at most terms x CHAMPION_SIZE additions no matter how many
+# FAQs contain its words.
+
+QUESTION_WEIGHT = 2.0
+MAX_PREFIX_TERMS = 20
+CHAMPION_SIZE = 100
+
+STOP_WORDS = frozenset("""
+    a an and are as at be but by can do does for from have how i if in is it
+    its me my no not of on or our so that the their then there this to was
+    we what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    terms = []
+    for word in re.findall(r'\w+', (text or '').lower()):
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        # Cheap plural folding so "passwords" matches "password"
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class SuggestionIndex:
+    def __init__(self):
+        self.postings = {}  # term -> {faq_id: weighted term frequency}
+        self.doc_terms = {}  # faq_id -> {term: weighted term frequency}
+        self.docs = {}  # faq_id -> (question, answer, category_display)
+        self.sorted_terms = None  # rebuilt lazily for prefix lookups
+        self.champions = {}  # term -> [(faq_id, weight), ...], rebuilt lazily
+        self.version = None
+        self.lock = threading.Lock()
+
+    def _weights(self, question, answer):
+        counts = Counter()
+        for term in tokenize(question):
+            counts[term] += QUESTION_WEIGHT
+        for term in tokenize(answer):
+            counts[term] += 1
+        # Sublinear tf so long answers don't drown short, precise questions
+        return {term: 1 + math.log(count) for term, count in counts.items()}
+
+    def _remove(self, faq_id):
+        for term in self.doc_terms.pop(faq_id, {}):
+            posting = self.postings[term]
+            del posting[faq_id]
+            self.champions.pop(term, None)
+            if not posting:
+                del self.postings[term]
+                self.sorted_terms = None
+        self.docs.pop(faq_id, None)
+
+    def _add(self, faq_id, question, answer, category_display):
+        weights = self._weights(question, answer)
+        for term, weight in weights.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self.sorted_terms = None
+            self.postings[term][faq_id] = weight
+            self.champions.pop(term, None)
+        self.doc_terms[faq_id] = weights
+        self.docs[faq_id] = (question, answer, category_display)
+
+    def apply(self, faqs, version=None):
+        # Bring the index in line with `faqs` ({id: faq dict}), touching only
+        # the entries that differ
+        with self.lock:
+            for faq_id in set(self.docs) - set(faqs):
+                self._remove(faq_id)
+            for faq_id, faq in faqs.items():
+                doc = (faq['question'], faq['answer'], faq['category_display'])
+                if self.docs.get(faq_id) != doc:
+                    self._remove(faq_id)
+                    self._add(faq_id, *doc)
+            self.version = version
+
+    def _expand(self, term):
+        # Terms starting with `term`, for the word still being typed
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(self.postings)
+        start = bisect_left(self.sorted_terms, term)
+        matches = []
+        for candidate in self.sorted_terms[start:start + MAX_PREFIX_TERMS]:
+            if not candidate.startswith(term):
+                break
+            matches.append(candidate)
+        return matches
+
+    def _champions(self, term):
+        champions = self.champions.get(term)
+        if champions is None:
+            posting = self.postings[term]
+            champions = heapq.nlargest(CHAMPION_SIZE, posting.items(), key=lambda item: item[1])
+            self.champions[term] = champions
+        return champions
+
+    def query(self, text, limit=5, prefix=True):
+        # [(score, faq_id), ...] best first. With `prefix`, the last word is
+        # treated as incomplete and matched against every term it starts.
+        terms = tokenize(text)
+        if not terms:
+            return []
+        with self.lock:
+            total = len(self.docs)
+            if not total:
+                return []
+            query_terms = {term: 1.0 for term in terms}
+            typing = re.search(r'\w+$', text) if prefix else None
+            if typing:
+                for last in tokenize(typing.group(0)):
+                    for candidate in self._expand(last):
+                        query_terms.setdefault(candidate, 0.5)
+
+            scores = {}
+            for term, boost in query_terms.items():
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = boost * math.log(1 + total / len(posting))
+                for faq_id, weight in self._champions(term):
+                    scores[faq_id] = scores.get(faq_id, 0) + idf * weight
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+            return [(score, faq_id) for faq_id, score in best]
+
+    def get(self, faq_id):
+        return self.docs.get(faq_id)
+
+
+_index = SuggestionIndex()
+
+
+def get_index():
+    # Cheap when nothing changed: one cache read for the FAQ version
+    version = faq_cache.version()
+    if _index.version != version:
+        _index.apply(faq_cache.faq_index()['by_id'], version)
+    return _index
+
+
+def suggest(text, limit=5):
+    index = get_index()
+    results = []
+    for score, faq_id in index.query(text, limit):
+        doc = index.get(faq_id)
+        if doc is None:
+            # Removed by a concurrent sync
+            continue
+        question, answer, category_display = doc
+        results.append({
+            'id': faq_id,
+            'question': question,
+            'category': category_display,
+            'score': round(score, 3),
+        })
+    return results
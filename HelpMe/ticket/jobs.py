@@ -0,0 +1,67 @@
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+
+from . import notifications, previews
+from .models import Message, Ticket
+from .serializers import serialize_message
+from .tasks import task
+
+
+# Follow-up work queued by views and consumers and run by tasks.py, so the
+# request or socket handler only pays for its own INSERT. Rows deleted before
+# the task runs leave nothing to do, which is not a failure worth retrying.
+
+@task
+def message_posted(ticket_id, sender_id, text):
+    ticket = Ticket.objects.only('id', 'title', 'creator_id').filter(id=ticket_id).first()
+    sender = User.objects.only('id', 'username').filter(id=sender_id).first()
+    if ticket and sender:
+        notifications.message_posted(ticket, sender, text)
+
+
+@task
+def ticket_created(ticket_id):
+    ticket = Ticket.objects.only('id', 'title', 'creator_id').filter(id=ticket_id).first()
+    if ticket:
+        notifications.ticket_created(ticket)
+
+
+@task
+def ticket_closed(ticket_id, closed_by_id):
+    ticket = Ticket.objects.only('id', 'title', 'creator_id').filter(id=ticket_id).first()
+    closed_by = User.objects.only('id').filter(id=closed_by_id).first()
+    if ticket and closed_by:
+        notifications.ticket_closed(ticket, closed_by)
+
+
+# A shared file queues one task per step, so retrying a failed step never
+# repeats the others (a second broadcast or notification)
+
+@task
+def file_shared(message_id):
+    message = Message.objects.select_related('user').filter(id=message_id).first()
+    if message is None:
+        return
+    async_to_sync(get_channel_layer().group_send)(f'chat_{message.ticket_id}', {
+        'type': 'chat_message',
+        'sent_at': time.time(),
+        **serialize_message(message)
+    })
+
+
+@task
+def file_notification(message_id):
+    message = Message.objects.select_related('user', 'ticket').filter(id=message_id).first()
+    if message is not None:
+        notifications.message_posted(message.ticket, message.user, message.msg)
+
+
+@task
+def file_preview(message_id):
+    message = Message.objects.filter(id=message_id).first()
+    if message is not None:
+        # Rendered in previews' process pool; announced to the room when done
+        previews.generate(message)
@@ -0,0 +1,122 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Fan-out benchmark across OS processes: every receiver process joins the same
+# group through its own channel layer instance, one sender process publishes,
+# and each receiver reports how many messages it got and how fast.
+
+def _get_layer(mode, redis_urls):
+    os.environ['HELPME_CHANNEL_LAYER'] = mode
+    os.environ['HELPME_REDIS_URLS'] = redis_urls
+
+    import django
+    django.setup()
+    from channels.layers import get_channel_layer
+    return get_channel_layer()
+
+
+def _receiver(mode, redis_urls, group, expected, timeout, ready, results):
+    layer = _get_layer(mode, redis_urls)
+
+    async def main():
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        ready.set()
+
+        received = 0
+        started = None
+        try:
+            while received < expected:
+                await asyncio.wait_for(layer.receive(channel), timeout)
+                if started is None:
+                    started = time.perf_counter()
+                received += 1
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - started if started else 0.0
+        results.put((os.getpid(), received, elapsed))
+
+    asyncio.run(main())
+
+
+def _sender(mode, redis_urls, group, count):
+    layer = _get_layer(mode, redis_urls)
+
+    async def main():
+        for i in range(count):
+            await layer.group_send(group, {'type': 'chat_message', 'message': f'bench {i}'})
+
+    asyncio.run(main())
+
+
+def run_fanout(mode, redis_urls, receivers=2, messages=500, timeout=10):
+    # Returns one (pid, received, seconds) tuple per receiver process
+    context = multiprocessing.get_context('spawn')
+    group = f'bench_{os.getpid()}_{time.monotonic_ns()}'
+    results = context.Queue()
+    ready = [context.Event() for _ in range(receivers)]
+
+    workers = [
+        context.Process(
+            target=_receiver,
+            args=(mode, redis_urls, group, messages, timeout, ready[i], results)
+        )
+        for i in range(receivers)
+    ]
+    for worker in workers:
+        worker.start()
+    for event in ready:
+        if not event.wait(timeout * 3):
+            for worker in workers:
+                worker.terminate()
+            raise RuntimeError('Receiver process did not join the group in time')
+
+    sender = context.Process(target=_sender, args=(mode, redis_urls, group, messages))
+    sender.start()
+    sender.join()
+
+    reports = []
+    for _ in workers:
+        try:
+            reports.append(results.get(timeout=timeout * 2))
+        except queue.Empty:
+            break
+    for worker in workers:
+        worker.join(timeout)
+    return reports
+
+
+class Command(BaseCommand):
+    help = 'Measure channel layer fan-out across worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', default=os.environ.get('HELPME_CHANNEL_LAYER', 'redis'),
+                            choices=['redis', 'redis-sharded'])
+        parser.add_argument('--redis-urls', default=os.environ.get('HELPME_REDIS_URLS', 'redis://localhost:6379/0'))
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+
+    def handle(self, *args, **options):
+        for receivers in options['workers']:
+            try:
+                reports = run_fanout(
+                    options['mode'], options['redis_urls'],
+                    receivers=receivers, messages=options['messages']
+                )
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+            delivered = sum(received for _, received, _ in reports)
+            slowest = max((elapsed for _, _, elapsed in reports), default=0.0)
+            rate = delivered / slowest if slowest else 0.0
+            self.stdout.write(
+                f"{options['mode']}: {receivers} worker(s), "
+                f"{delivered}/{receivers * options['messages']} delivered, "
+                f"{rate:,.0f} deliveries/sec"
+            )
@@ -0,0 +1,56 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ticket.db import database_sync_to_async
+
+
+# Connection churn under consumer-style load. Simulated sockets each run a
+# stream of small queries through ticket.db.database_sync_to_async, the way
+# ChatConsumer does. Every query also returns the PostgreSQL backend pid it
+# ran on, so the number of distinct pids is the number of physical
+# connections opened. Run it once per HELPME_DB_CONNECTIONS mode and compare.
+
+def ping():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_backend_pid()')
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = 'Measure database connections opened under concurrent consumer load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=200)
+        parser.add_argument('--events', type=int, default=50, help='queries per socket')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('This benchmark needs PostgreSQL (it counts backend pids)')
+
+        pids, latencies, elapsed = asyncio.run(self.run(options['sockets'], options['events']))
+
+        ms = sorted(latency * 1000 for latency in latencies)
+        self.stdout.write(f"mode:            {settings.DB_CONNECTION_MODE} ({settings.DB_THREADS} db threads)")
+        self.stdout.write(f"queries:         {len(ms):,} from {options['sockets']} sockets in {elapsed:.2f}s ({len(ms) / elapsed:,.0f}/s)")
+        self.stdout.write(f"connections:     {len(pids):,} opened ({len(pids) / len(ms):.3f} per query)")
+        self.stdout.write(f"latency (ms):    p50 {statistics.median(ms):.2f}  p99 {ms[int(len(ms) * 0.99)]:.2f}")
+
+    async def run(self, sockets, events):
+        query = database_sync_to_async(ping)
+        pids = set()
+        latencies = []
+
+        async def socket():
+            for _ in range(events):
+                started = time.perf_counter()
+                pids.add(await query())
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(socket() for _ in range(sockets)))
+        return pids, latencies, time.perf_counter() - started
@@ -0,0 +1,124 @@
+import random
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from ticket import faq_cache, faq_suggest
+from ticket.views import FAQSuggestView
+
+
+# Typeahead latency under concurrent typing. A synthetic FAQ corpus is loaded
+# into this process's suggestion index, then each simulated user "types" a
+# ticket draft and hits FAQSuggestView once per keystroke. Requests go
+# through the view (RequestFactory), so routing, JSON and cache lookups are
+# included; no rows are written to the database.
+
+VOCABULARY = """
+    account password reset login email invoice billing payment refund card
+    printer network wifi vpn laptop screen keyboard update install error crash
+    slow upload download file document report export import sync calendar
+    permission access admin team project folder share link mobile app browser
+    notification setting profile address phone order delivery shipping
+    subscription plan upgrade cancel license key backup restore server outage
+""".split()
+
+
+SYLLABLES = 'ka lo mi ne ru sa ti vo ze ba de fi go hu'.split()
+
+
+def build_vocabulary(size):
+    # The real words above plus made-up ones, drawn with Zipf-like weights
+    # so a few words are very common and most are rare, like real text
+    words = list(VOCABULARY)
+    rng = random.Random(0)
+    while len(words) < size:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in words:
+            words.append(word)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def sentence(rng, vocabulary, words):
+    return ' '.join(rng.choices(vocabulary[0], vocabulary[1], k=words))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Measure FAQ suggestion latency under concurrent typing load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faqs', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=32)
+        parser.add_argument('--drafts', type=int, default=5, help='drafts typed per user')
+        parser.add_argument(
+            '--keystroke-ms', type=int, default=150,
+            help='pause between requests per user (the form debounces at 150); 0 saturates the process'
+        )
+        parser.add_argument('--vocabulary', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = build_vocabulary(options['vocabulary'])
+        faqs = {
+            faq_id: {
+                'question': sentence(rng, vocabulary, 8) + '?',
+                'answer': sentence(rng, vocabulary, 60),
+                'category_display': 'Common Questions',
+            }
+            for faq_id in range(1, options['faqs'] + 1)
+        }
+        started = time.perf_counter()
+        faq_suggest._index.apply(faqs, faq_cache.version())
+        build = time.perf_counter() - started
+
+        view = FAQSuggestView.as_view()
+        factory = RequestFactory()
+        user = User(username='bench_faq_suggest')
+        latencies = []
+        lock = threading.Lock()
+        pause = options['keystroke_ms'] / 1000
+
+        def typist(seed):
+            local_rng = random.Random(seed)
+            samples = []
+            for _ in range(options['drafts']):
+                draft = sentence(local_rng, vocabulary, 12)
+                # One request per keystroke: the worst case for the
+                # debounced form, a user typing at exactly the debounce rate
+                for end in range(3, len(draft) + 1):
+                    time.sleep(pause)
+                    request = factory.get('/faq/suggest/', {'q': draft[:end]})
+                    request.user = user
+                    t0 = time.perf_counter()
+                    response = view(request)
+                    samples.append(time.perf_counter() - t0)
+                    assert response.status_code == 200
+            with lock:
+                latencies.extend(samples)
+
+        threads = [
+            threading.Thread(target=typist, args=(options['seed'] + i,))
+            for i in range(options['users'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        ms = [latency * 1000 for latency in latencies]
+        self.stdout.write(f"index build:  {options['faqs']} faqs in {build * 1000:.0f} ms, {len(faq_suggest._index.postings)} terms")
+        self.stdout.write(f"requests:     {len(ms):,} from {options['users']} concurrent typists")
+        self.stdout.write(f"throughput:   {len(ms) / elapsed:,.0f} requests/sec")
+        self.stdout.write(f"latency (ms): p50 {statistics.median(ms):.2f}  p95 {percentile(ms, 95):.2f}  p99 {percentile(ms, 99):.2f}  max {max(ms):.2f}")
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from ticket import unread
+from ticket.db import database_sync_to_async
+from ticket.message_buffer import MessageWriteBuffer
+from ticket.models import Message, Ticket
+
+
+# Compare the two ways ChatConsumer persists messages, against the configured
+# database: unread.post_message per message on the bounded DB pool
+# (save_message, used when CHAT_WRITE_BEHIND is off) versus the write-behind
+# buffer. Rows are written to a throwaway ticket that is deleted afterwards.
+
+class Command(BaseCommand):
+    help = 'Benchmark per-message inserts against write-behind batching'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=100)
+        parser.add_argument('--interval-ms', type=int, default=20)
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username='bench_message_writes')
+        ticket = Ticket.objects.create(title='Write benchmark', description='Temporary', creator=user)
+        try:
+            count = options['messages']
+            per_message = asyncio.run(self.per_message(user, ticket, count))
+            buffered = asyncio.run(self.write_behind(
+                user, ticket, count, options['batch'], options['interval_ms'] / 1000
+            ))
+        finally:
+            ticket.delete()
+
+        self.stdout.write(f"per-message insert: {count / per_message:,.0f} messages/sec")
+        self.stdout.write(f"write-behind:       {count / buffered:,.0f} messages/sec")
+        self.stdout.write(f"speedup:            {per_message / buffered:.1f}x")
+
+    async def per_message(self, user, ticket, count):
+        started = time.perf_counter()
+        post_message = database_sync_to_async(unread.post_message)
+        for i in range(count):
+            await post_message(user=user, ticket_id=ticket.id, msg=f'bench {i}')
+        return time.perf_counter() - started
+
+    async def write_behind(self, user, ticket, count, batch_size, interval):
+        buffer = MessageWriteBuffer(batch_size=batch_size, interval=interval, max_pending=count)
+        started = time.perf_counter()
+        for i in range(count):
+            buffer.add(Message(user=user, ticket_id=ticket.id, msg=f'bench {i}'))
+            # Yield like a consumer between frames so timed flushes can run
+            await asyncio.sleep(0)
+        await buffer.drain()
+        return time.perf_counter() - started
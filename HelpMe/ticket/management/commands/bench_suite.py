@@ -0,0 +1,392 @@
+import asyncio
+import copy
+import json
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import resolve, reverse
+
+from ticket import metrics, roles
+from ticket.db import get_executor
+from ticket.models import Message, Ticket
+from ticket.routing import websocket_urlpatterns
+
+from .seed_bench_data import SCALES, SEED_PREFIX, seeded_tickets, seeded_users
+
+
+# Benchmark suite over data from seed_bench_data: HTTP views through the full
+# middleware stack (django.test.Client) and ChatConsumer through
+# WebsocketCommunicator, in this process against the configured database and
+# channel layer. Each scenario reports throughput, p50/p99 latency and
+# database queries per operation, the latter read from the /metrics
+# histograms (metrics.py), so queries made in consumer threads are counted.
+#
+# Results are compared with bench_baseline.json, keyed by database vendor and
+# scale. Timings only mean something on the machine that recorded them, so
+# the file is not committed: record it locally with --save-baseline before
+# comparing. More queries per operation fail the command; latency and
+# throughput drifting beyond --tolerance is reported as a warning, or fails
+# too with --strict.
+
+BASELINE_PATH = Path(__file__).resolve().parents[2] / 'bench_baseline.json'
+
+HTTP_SCENARIOS = ('http_agent', 'http_main', 'http_chat', 'http_faq')
+WS_SCENARIOS = ('ws_connect', 'ws_fanout', 'ws_upload')
+SCENARIOS = HTTP_SCENARIOS + WS_SCENARIOS
+
+RECEIVE_TIMEOUT = 10
+ROOM_TITLE = 'Benchmark room'
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies, elapsed, queries):
+    ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        'ops': len(ms),
+        'throughput': round(len(ms) / elapsed, 1),
+        'p50_ms': round(percentile(ms, 50), 2),
+        'p99_ms': round(percentile(ms, 99), 2),
+        'queries': round(queries / len(ms), 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # (regressions, drift): query counts that grew, and timings beyond tolerance
+    regressions = []
+    drift = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['queries'] > expected['queries']:
+            regressions.append(f"{name}: {result['queries']} queries/op, baseline {expected['queries']}")
+        if result['p99_ms'] > expected['p99_ms'] * (1 + tolerance):
+            drift.append(f"{name}: p99 {result['p99_ms']} ms, baseline {expected['p99_ms']} ms")
+        if result['throughput'] < expected['throughput'] / (1 + tolerance):
+            drift.append(f"{name}: {result['throughput']} ops/s, baseline {expected['throughput']} ops/s")
+    return regressions, drift
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def http_queries(url):
+    return metrics.HTTP_QUERIES.total(view=resolve(url).view_name)[1]
+
+
+def ws_queries(event):
+    return metrics.WS_QUERIES.total(consumer='ChatConsumer', event=event)[1]
+
+
+def in_thread(func):
+    # Run `func` in a worker thread and hand its connection back afterwards,
+    # so the thread doesn't keep a pool slot the consumers need
+    def wrapper(*args):
+        try:
+            return func(*args)
+        finally:
+            connection.close()
+    return sync_to_async(wrapper, thread_sensitive=False)
+
+
+def release_consumer_connections():
+    # WebsocketCommunicator stubs out channels' close_old_connections, so
+    # consumer threads (ticket.db) keep their pooled connection after each
+    # event. Hand them back between scenarios, or the view and main threads
+    # can't get one. The barrier makes every worker thread run one close().
+    workers = settings.DB_THREADS
+    if not workers:
+        return
+    barrier = threading.Barrier(workers)
+
+    def close():
+        connection.close()
+        barrier.wait()
+
+    for future in [get_executor().submit(close) for _ in range(workers)]:
+        future.result()
+
+
+def bench_http(user, url, requests, concurrency):
+    clients = []
+    for _ in range(concurrency):
+        client = Client()
+        client.force_login(user)
+        # Warm per-process caches (roles, templates) outside the timing
+        client.get(url)
+        clients.append(client)
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(client, count):
+        samples = []
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                response = client.get(url)
+                samples.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors.append(f'{url} returned {response.status_code}')
+                    return
+        finally:
+            connection.close()
+            with lock:
+                latencies.extend(samples)
+
+    per_client = max(1, requests // concurrency)
+    threads = [threading.Thread(target=worker, args=(client, per_client)) for client in clients]
+    queries = http_queries(url)
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise CommandError(errors[0])
+    return summarize(latencies, elapsed, http_queries(url) - queries)
+
+
+async def receive_chat(communicator):
+    # Skip write-behind 'saved' acknowledgements; chat frames have no type
+    while True:
+        frame = await communicator.receive_json_from(RECEIVE_TIMEOUT)
+        if 'type' not in frame:
+            return frame
+
+
+async def open_socket(application, ticket_id, user):
+    communicator = WebsocketCommunicator(application, f'/ws/chat/{ticket_id}/')
+    communicator.scope['user'] = user
+    connected, _ = await communicator.connect(RECEIVE_TIMEOUT)
+    if not connected:
+        raise CommandError(f'{user.username} could not join ticket {ticket_id}')
+    return communicator
+
+
+async def bench_ws_connect(application, ticket, agents, sockets):
+    # Role lookups are cached per process, like in a long-running worker;
+    # every socket still gets its own user object, as the session would give it
+    await in_thread(lambda: [roles.get_roles(copy.copy(agent)) for agent in agents])()
+    latencies = []
+
+    async def join(user):
+        started = time.perf_counter()
+        communicator = await open_socket(application, ticket.id, copy.copy(user))
+        latencies.append(time.perf_counter() - started)
+        return communicator
+
+    queries = ws_queries('websocket.connect')
+    started = time.perf_counter()
+    communicators = await asyncio.gather(*(join(agents[i % len(agents)]) for i in range(sockets)))
+    elapsed = time.perf_counter() - started
+    result = summarize(latencies, elapsed, ws_queries('websocket.connect') - queries)
+    await asyncio.gather(*(communicator.disconnect() for communicator in communicators))
+    return result
+
+
+async def bench_ws_fanout(listeners, sender, messages):
+    # One customer talks into a room of agents; latency is send until the
+    # last socket has the message
+    latencies = []
+    queries = ws_queries('websocket.receive')
+    started = time.perf_counter()
+    for i in range(messages):
+        sent = time.perf_counter()
+        await sender.send_json_to({'message': f'fan-out {i}'})
+        await asyncio.gather(*(receive_chat(communicator) for communicator in listeners))
+        latencies.append(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, ws_queries('websocket.receive') - queries)
+
+
+async def bench_ws_upload(listeners, user, ticket, uploads):
+    # Files go through FileUploadView and reach the room via the channel layer
+    client = Client()
+    await in_thread(client.force_login)(user)
+    url = reverse('file_upload', args=[ticket.id])
+
+    def post(i):
+        upload = ContentFile(f'upload {i}\n'.encode() * 1024, name=f'bench-{i}.txt')
+        return client.post(url, {'file': upload})
+
+    latencies = []
+    queries = http_queries(url)
+    started = time.perf_counter()
+    for i in range(uploads):
+        sent = time.perf_counter()
+        response = await in_thread(post)(i)
+        if response.status_code != 200:
+            raise CommandError(f'{url} returned {response.status_code}')
+        await asyncio.gather(*(receive_chat(communicator) for communicator in listeners))
+        latencies.append(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, elapsed, http_queries(url) - queries)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark HTTP views and chat WebSockets against seeded data and a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='10k', help='scale passed to seed_bench_data')
+        parser.add_argument('--only', nargs='+', choices=SCENARIOS, help='run only these scenarios')
+        parser.add_argument('--requests', type=int, default=200, help='requests per HTTP scenario')
+        parser.add_argument('--concurrency', type=int, default=4, help='concurrent HTTP clients')
+        parser.add_argument('--sockets', type=int, default=100, help='WebSockets per WS scenario')
+        parser.add_argument('--messages', type=int, default=50, help='chat messages in the fan-out scenario')
+        parser.add_argument('--uploads', type=int, default=10, help='files in the upload scenario')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='allowed latency/throughput drift (0.5 = 50%%)')
+        parser.add_argument('--baseline', default=str(BASELINE_PATH))
+        parser.add_argument('--save-baseline', action='store_true', help='record these results as the local baseline')
+        parser.add_argument('--strict', action='store_true', help='fail on latency/throughput drift as well')
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        # Left behind if a previous run was killed
+        seeded_tickets().filter(title=ROOM_TITLE).delete()
+        seeded = seeded_tickets().count()
+        if seeded != SCALES[scale]['tickets']:
+            raise CommandError(
+                f"Found {seeded:,} seeded tickets, scale {scale} has {SCALES[scale]['tickets']:,}; "
+                f"run `manage.py seed_bench_data --flush --scale {scale}` first"
+            )
+
+        params = {
+            name: options[name] for name in ('requests', 'concurrency', 'sockets', 'messages', 'uploads')
+        }
+        scenarios = options['only'] or SCENARIOS
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            results = self.run(scenarios, params)
+
+        self.stdout.write(f"{'scenario':<12} {'ops':>6} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'queries/op':>11}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<12} {result['ops']:>6} {result['throughput']:>10,.1f} "
+                f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['queries']:>11.2f}"
+            )
+
+        baselines = load_baseline(options['baseline'])
+        entry = baselines.get(connection.vendor, {}).get(scale)
+        if options['save_baseline']:
+            recorded = entry['results'] if entry and entry['params'] == params else {}
+            baselines.setdefault(connection.vendor, {})[scale] = {
+                'params': params, 'results': {**recorded, **results}
+            }
+            with open(options['baseline'], 'w') as f:
+                json.dump(baselines, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f"baseline saved for {connection.vendor}/{scale}")
+            return
+
+        if entry is None:
+            self.stdout.write(self.style.WARNING(f"no baseline for {connection.vendor}/{scale}; record one with --save-baseline"))
+            return
+        if entry['params'] != params:
+            self.stdout.write(self.style.WARNING(
+                f"baseline was recorded with {entry['params']}; nothing compared"
+            ))
+            return
+        regressions, drift = compare(results, entry['results'], options['tolerance'])
+        baseline = f"the {connection.vendor}/{scale} baseline"
+        if options['strict']:
+            regressions += drift
+        elif drift:
+            self.stdout.write(self.style.WARNING(
+                f"{len(drift)} timing(s) drifted from {baseline}:\n  " + '\n  '.join(drift)
+            ))
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} regression(s) against {baseline}:\n  " + '\n  '.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS(f"no regressions against {baseline}"))
+
+    def run(self, scenarios, params):
+        users = seeded_users()
+        agents = list(users.filter(username__startswith=f'{SEED_PREFIX}agent_').order_by('id'))
+        busiest_customer = (
+            seeded_tickets().values('creator').annotate(n=Count('id')).order_by('-n', 'creator')[0]['creator']
+        )
+        customer = users.get(id=busiest_customer)
+        busiest_ticket = (
+            Message.objects.filter(ticket__in=seeded_tickets())
+            .values('ticket').annotate(n=Count('id')).order_by('-n', 'ticket')[0]['ticket']
+        )
+
+        urls = {
+            'http_agent': (agents[0], reverse('main_agent')),
+            'http_main': (customer, reverse('main_user')),
+            'http_chat': (agents[0], reverse('chat', args=[busiest_ticket])),
+            'http_faq': (customer, reverse('faq')),
+        }
+        results = {}
+        for name in HTTP_SCENARIOS:
+            if name in scenarios:
+                user, url = urls[name]
+                results[name] = bench_http(user, url, params['requests'], params['concurrency'])
+
+        if any(name in scenarios for name in WS_SCENARIOS):
+            # Chat traffic goes to a throwaway ticket, removed with its
+            # messages, notifications and uploaded blobs afterwards
+            ticket = Ticket.objects.create(title=ROOM_TITLE, description='Temporary', creator=customer)
+            # Consumer threads are sized to the connection pool; don't sit on
+            # a slot while they run
+            connection.close()
+            # The sender talks far faster than a person would; measure the
+            # handlers, not the per-socket rate limits
+            unlimited = override_settings(
+                CHAT_SOCKET_RATE=10 ** 6, CHAT_SOCKET_BURST=10 ** 6, CHAT_USER_RATE=10 ** 6, CHAT_USER_BURST=10 ** 6,
+            )
+            try:
+                with unlimited:
+                    results.update(asyncio.run(self.run_ws(scenarios, params, ticket, customer, agents)))
+            finally:
+                ticket.delete()
+        return results
+
+    async def run_ws(self, scenarios, params, ticket, customer, agents):
+        application = URLRouter(websocket_urlpatterns)
+        results = {}
+        try:
+            if 'ws_connect' in scenarios:
+                results['ws_connect'] = await bench_ws_connect(application, ticket, agents, params['sockets'])
+                release_consumer_connections()
+
+            if 'ws_fanout' in scenarios or 'ws_upload' in scenarios:
+                listeners = [
+                    await open_socket(application, ticket.id, agents[i % len(agents)])
+                    for i in range(params['sockets'] - 1)
+                ]
+                sender = await open_socket(application, ticket.id, customer)
+                listeners.append(sender)
+                release_consumer_connections()
+                try:
+                    if 'ws_fanout' in scenarios:
+                        results['ws_fanout'] = await bench_ws_fanout(listeners, sender, params['messages'])
+                        release_consumer_connections()
+                    if 'ws_upload' in scenarios:
+                        results['ws_upload'] = await bench_ws_upload(listeners, customer, ticket, params['uploads'])
+                finally:
+                    await asyncio.gather(*(communicator.disconnect() for communicator in listeners))
+        finally:
+            release_consumer_connections()
+        return results
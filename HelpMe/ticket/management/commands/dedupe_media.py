@@ -0,0 +1,69 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ticket.models import Attachment, Message
+from ticket.storage import blob_name, content_addressed_storage, file_digest
+
+
+# Move existing chat files and attachments into content-addressed storage.
+# Every distinct file is hashed once; rows sharing content are repointed at a
+# single blob and the now-unreferenced originals are removed.
+
+class Command(BaseCommand):
+    help = 'Deduplicate existing media files into content-addressed storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = content_addressed_storage()
+        dry_run = options['dry_run']
+        moved = reused = freed = 0
+        blobs = {}
+
+        for model in (Message, Attachment):
+            names = (
+                model.objects.exclude(file='').exclude(file__isnull=True)
+                .values_list('file', flat=True).distinct()
+            )
+            for name in names.iterator():
+                if not storage.exists(name):
+                    self.stderr.write(f"Missing file, skipped: {name}")
+                    continue
+
+                with storage.open(name, 'rb') as handle:
+                    digest = file_digest(File(handle))
+                target = blob_name(name, digest)
+                if target == name:
+                    blobs.setdefault(target, name)
+                    continue
+
+                size = storage.size(name)
+                if target in blobs or storage.exists(target):
+                    reused += 1
+                    freed += size
+                else:
+                    moved += 1
+                blobs.setdefault(target, name)
+
+                if dry_run:
+                    self.stdout.write(f"{name} -> {target}")
+                    continue
+
+                if not storage.exists(target):
+                    os.makedirs(os.path.dirname(storage.path(target)), exist_ok=True)
+                    os.replace(storage.path(name), storage.path(target))
+                with transaction.atomic():
+                    Message.objects.filter(file=name).update(file=target)
+                    Attachment.objects.filter(file=name).update(file=target)
+                if storage.exists(name):
+                    storage.delete(name)
+
+        verb = 'Would move' if dry_run else 'Moved'
+        self.stdout.write(
+            f"{verb} {moved} file(s) into content-addressed storage, "
+            f"merged {reused} duplicate(s), {freed / (1024 * 1024):.1f} MB reclaimed"
+        )
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ticket.models import ChunkedUpload
+from ticket.uploads import discard
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked uploads that have not received data for a while'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = ChunkedUpload.objects.filter(updated_at__lt=cutoff)
+        count = 0
+        for upload in stale.iterator():
+            discard(upload)
+            upload.delete()
+            count += 1
+        self.stdout.write(f"Removed {count} stale upload(s)")
@@ -0,0 +1,33 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from ticket import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (for HELPME_TASK_MODE=worker, or to drain a backlog)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.TASK_THREADS,
+                            help='tasks run at once by this process')
+        parser.add_argument('--once', action='store_true',
+                            help='exit when no task is due instead of polling')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            count = tasks.drain()
+            connection.close()
+            self.stdout.write(f"Ran {count} task(s)")
+            return
+
+        self.stdout.write(f"Running tasks on {options['threads']} thread(s)")
+        runner = tasks.TaskRunner(options['threads'], settings.TASK_POLL_INTERVAL)
+        runner.start()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            self.stdout.write("Finishing running tasks")
+            runner.stop()
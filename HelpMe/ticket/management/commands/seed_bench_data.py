@@ -0,0 +1,179 @@
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ticket import faq_cache, unread
+from ticket.models import FAQ, Message, Organization, Profile, Ticket
+from ticket.roles import AGENTS
+
+
+# Deterministic synthetic data for bench_suite. Every seeded row hangs off a
+# `seed_` user or organization, so --flush removes exactly what was added.
+# Ticket creators and message threads follow Zipf-like weights: a few
+# customers and tickets are very busy and most are quiet, like real traffic.
+
+SEED_PREFIX = 'seed_'
+SEED_PASSWORD = 'bench'
+
+SCALES = {
+    '10k': {'orgs': 10, 'customers': 200, 'agents': 10, 'tickets': 1_000, 'messages': 10_000, 'faqs': 100},
+    '100k': {'orgs': 50, 'customers': 2_000, 'agents': 50, 'tickets': 10_000, 'messages': 100_000, 'faqs': 500},
+    '1m': {'orgs': 200, 'customers': 20_000, 'agents': 200, 'tickets': 100_000, 'messages': 1_000_000, 'faqs': 2_000},
+}
+
+WORDS = """
+    account password reset login email invoice billing payment refund card
+    printer network wifi vpn laptop screen keyboard update install error crash
+    slow upload download file document report export import sync calendar
+    permission access admin team project folder share link mobile app browser
+    notification setting profile address phone order delivery shipping
+    subscription plan upgrade cancel license key backup restore server outage
+""".split()
+
+
+def zipf_weights(count):
+    return [1 / (rank + 1) for rank in range(count)]
+
+
+def text(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words))
+
+
+def seeded_users():
+    return User.objects.filter(username__startswith=SEED_PREFIX)
+
+
+def seeded_tickets():
+    return Ticket.objects.filter(creator__username__startswith=SEED_PREFIX)
+
+
+def flush():
+    seeded_users().delete()
+    Organization.objects.filter(name__startswith=SEED_PREFIX).delete()
+    faq_cache.invalidate()
+
+
+def seed(counts, seed=1, batch_size=5000, log=None):
+    # Bulk inserts only: no per-row signals, so caches that depend on them
+    # (FAQ version) are bumped by hand at the end
+    rng = random.Random(seed)
+    log = log or (lambda line: None)
+    password = make_password(SEED_PASSWORD)
+
+    with transaction.atomic():
+        orgs = Organization.objects.bulk_create(
+            [Organization(name=f'{SEED_PREFIX}org_{i}') for i in range(counts['orgs'])],
+            batch_size=batch_size
+        )
+        customers = User.objects.bulk_create(
+            [User(username=f'{SEED_PREFIX}customer_{i}', password=password) for i in range(counts['customers'])],
+            batch_size=batch_size
+        )
+        agents = User.objects.bulk_create(
+            [User(username=f'{SEED_PREFIX}agent_{i}', password=password, is_staff=True) for i in range(counts['agents'])],
+            batch_size=batch_size
+        )
+        group, _ = Group.objects.get_or_create(name=AGENTS)
+        group.user_set.add(*agents)
+
+        profiles = Profile.objects.bulk_create(
+            [Profile(user=user) for user in customers + agents], batch_size=batch_size
+        )
+        Membership = Profile.organization.through
+        Membership.objects.bulk_create(
+            [
+                Membership(profile_id=profile.id, organization_id=orgs[i % len(orgs)].id)
+                for i, profile in enumerate(profiles)
+            ],
+            batch_size=batch_size
+        )
+        log(f"users:     {len(customers):,} customers, {len(agents):,} agents in {len(orgs):,} orgs")
+
+        FAQ.objects.bulk_create(
+            [
+                FAQ(
+                    question=text(rng, 8).capitalize() + '?',
+                    answer=text(rng, 60),
+                    category=FAQ.CATEGORY_CHOICES[i % len(FAQ.CATEGORY_CHOICES)][0],
+                    creator=agents[i % len(agents)],
+                )
+                for i in range(counts['faqs'])
+            ],
+            batch_size=batch_size
+        )
+        log(f"faqs:      {counts['faqs']:,}")
+
+        creators = rng.choices(customers, zipf_weights(len(customers)), k=counts['tickets'])
+        tickets = Ticket.objects.bulk_create(
+            [
+                Ticket(
+                    title=text(rng, 6).capitalize(),
+                    description=text(rng, 40),
+                    status=rng.choice(Ticket.Status.values),
+                    priority=rng.choice(Ticket.Priority.values),
+                    creator=creator,
+                )
+                for creator in creators
+            ],
+            batch_size=batch_size
+        )
+        # Most tickets have one assigned agent, some are still unassigned
+        assignees = {}
+        Assignment = Ticket.assign.through
+        rows = []
+        for ticket in tickets:
+            if rng.random() < 0.8:
+                agent = rng.choice(agents)
+                assignees[ticket.id] = agent
+                rows.append(Assignment(ticket_id=ticket.id, user_id=agent.id))
+        Assignment.objects.bulk_create(rows, batch_size=batch_size)
+        log(f"tickets:   {len(tickets):,} ({len(rows):,} assigned)")
+
+    # Messages go in their own transactions so 1M rows don't sit in one
+    weights = zipf_weights(len(tickets))
+    remaining = counts['messages']
+    while remaining:
+        size = min(batch_size, remaining)
+        batch = []
+        for ticket in rng.choices(tickets, weights, k=size):
+            # Customer and agent take turns in the thread
+            agent = assignees.get(ticket.id)
+            author = agent if agent and rng.random() < 0.5 else ticket.creator
+            batch.append(Message(user=author, ticket=ticket, msg=text(rng, rng.randint(3, 30))))
+        Message.objects.bulk_create(batch)
+        remaining -= size
+    unread.recount(seeded_tickets())
+    log(f"messages:  {counts['messages']:,}")
+
+    faq_cache.invalidate()
+
+
+class Command(BaseCommand):
+    help = 'Seed users, organizations, tickets, messages and FAQs for bench_suite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='10k', help='number of messages to seed')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--flush', action='store_true', help='remove previously seeded data first')
+        parser.add_argument('--force', action='store_true', help='allow seeding with HELPME_ENV=prod')
+
+    def handle(self, *args, **options):
+        if settings.HELPME_ENV == 'prod' and not options['force']:
+            raise CommandError('Refusing to seed a production database; pass --force if you mean it')
+
+        if options['flush']:
+            started = time.perf_counter()
+            flush()
+            self.stdout.write(f"flushed previous seed data in {time.perf_counter() - started:.1f}s")
+        elif seeded_users().exists():
+            raise CommandError('Seed data already exists; pass --flush to replace it')
+
+        started = time.perf_counter()
+        seed(SCALES[options['scale']], options['seed'], options['batch_size'], self.stdout.write)
+        self.stdout.write(f"seeded scale {options['scale']} in {time.perf_counter() - started:.1f}s")
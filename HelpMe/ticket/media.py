@@ -0,0 +1,131 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+
+# Serving protected media once access has been checked.
+#
+# MEDIA_SERVE_MODE picks who moves the bytes:
+#   x-accel    - nginx, via an internal location mapped to MEDIA_ROOT:
+#                    location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+#   x-sendfile - Apache mod_xsendfile / lighttpd, given the absolute path
+#   django     - FileResponse with ETag, If-None-Match and single Range support
+# The first two hand the transfer to the web server (sendfile, zero-copy);
+# the last is for development or deployments without a front proxy.
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    # File-like view of bytes [start, start + length) of an open file
+    def __init__(self, handle, start, length):
+        handle.seek(start)
+        self.handle = handle
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.handle.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.handle.close()
+
+
+def file_etag(name, stat):
+    # Content-addressed names are already a hash of the bytes
+    name = os.path.splitext(os.path.basename(name))[0]
+    if len(name) == 64:
+        return quote_etag(name)
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def parse_range(header, size):
+    # Returns (start, end) inclusive, None for "whole file", or False if unsatisfiable
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = min(int(last), size)
+        if length == 0:
+            return False
+        return size - length, size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def serve_file(request, storage, name, download_name):
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+    content_type = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(False, download_name)
+
+    if mode == 'x-accel':
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + name
+        response['Content-Disposition'] = disposition
+        return response
+
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = storage.path(name)
+        response['Content-Disposition'] = disposition
+        return response
+
+    path = storage.path(name)
+    stat = os.stat(path)
+    etag = file_etag(name, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=86400',
+    }
+
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+        response = HttpResponseNotModified()
+        for key, value in headers.items():
+            response[key] = value
+        return response
+
+    byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    handle = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(handle, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangeFile(handle, start, length), content_type=content_type, status=206)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Content-Disposition'] = disposition
+    # Keeps GZipMiddleware (prod) off the file: compressing it would drop the
+    # Content-Length and turn byte ranges into ranges of the gzip stream
+    response['Content-Encoding'] = 'identity'
+    for key, value in headers.items():
+        response[key] = value
+    return response
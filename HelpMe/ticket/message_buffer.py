@@ -0,0 +1,204 @@
+import asyncio
+import atexit
+import logging
+import threading
+import uuid
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import unread
+from .db import database_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+# Write-behind persistence for chat messages.
+#
+# Messages are broadcast as soon as they arrive with a provisional id, queued
+# here and written with one bulk_create per batch. A batch is flushed when it
+# reaches CHAT_WRITE_BEHIND_BATCH messages or CHAT_WRITE_BEHIND_INTERVAL_MS
+# after its first message, whichever comes first. Consumers flush on
+# disconnect and the process flushes synchronously at exit, so a clean
+# shutdown loses nothing; a hard crash can lose at most one interval.
+#
+# When a batch fails, its messages are written one by one so a bad row (say,
+# for a ticket deleted meanwhile) cannot hold back the rest. Messages that
+# still fail are retried with later batches up to CHAT_WRITE_BEHIND_MAX_ATTEMPTS
+# times, then dropped and their rooms told (chat_message_failed).
+
+class BufferFull(Exception):
+    pass
+
+
+class MessageWriteBuffer:
+    def __init__(self, batch_size=100, interval=0.02, max_pending=5000, max_attempts=3):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.pending = []
+        self._attempts = {}  # provisional id -> failed writes so far
+        self._timer = None
+        self._tasks = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, message, group=None):
+        # Must be called from the event loop; returns the provisional id
+        provisional_id = f"tmp-{uuid.uuid4().hex}"
+        with self._lock:
+            if len(self.pending) >= self.max_pending:
+                raise BufferFull()
+            self.pending.append((provisional_id, group, message))
+
+        loop = asyncio.get_running_loop()
+        if len(self.pending) >= self.batch_size:
+            self._start_flush(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.interval, self._start_flush, loop)
+        return provisional_id
+
+    def _start_flush(self, loop):
+        task = loop.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _take_batch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        with self._lock:
+            batch, self.pending = self.pending, []
+        return batch
+
+    async def flush(self):
+        batch = self._take_batch()
+        if not batch:
+            return 0
+
+        try:
+            # On the bounded pool rather than abulk_create, for the same reasons
+            # as ChatConsumer.save_message
+            await database_sync_to_async(unread.post_messages)([message for _, _, message in batch])
+            saved = batch
+        except Exception:
+            logger.exception("Failed to write %d buffered chat messages; writing them one by one", len(batch))
+            saved, failed = await database_sync_to_async(self._write_separately)(batch)
+            await self._retry_or_drop(failed)
+
+        for provisional_id, _, _ in saved:
+            self._attempts.pop(provisional_id, None)
+        await self._announce('chat_message_saved', [
+            (group, {'provisional_id': provisional_id, 'id': message.id})
+            for provisional_id, group, message in saved
+        ])
+        return len(saved)
+
+    def _write_separately(self, batch):
+        # (saved, failed) entries of `batch`, each message in its own transaction
+        saved, failed = [], []
+        for entry in batch:
+            message = entry[2]
+            # The failed batch may have assigned ids before rolling back
+            message.pk = None
+            try:
+                unread.post_messages([message])
+            except Exception:
+                logger.exception("Failed to write buffered chat message %s", entry[0])
+                message.pk = None
+                failed.append(entry)
+            else:
+                saved.append(entry)
+        return saved, failed
+
+    async def _retry_or_drop(self, failed):
+        retry, dropped = [], []
+        for entry in failed:
+            attempts = self._attempts.get(entry[0], 0) + 1
+            self._attempts[entry[0]] = attempts
+            (retry if attempts < self.max_attempts else dropped).append(entry)
+
+        with self._lock:
+            # Never past max_pending, whatever is already queued again
+            room = max(0, self.max_pending - len(self.pending))
+            dropped += retry[room:]
+            retry = retry[:room]
+            self.pending[:0] = retry
+        if retry and self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.interval, self._start_flush, loop)
+
+        if dropped:
+            logger.error("Dropped %d buffered chat messages that could not be written", len(dropped))
+            for provisional_id, _, _ in dropped:
+                self._attempts.pop(provisional_id, None)
+            await self._announce('chat_message_failed', [
+                (group, provisional_id) for provisional_id, group, _ in dropped
+            ])
+
+    async def _announce(self, event_type, items):
+        # One event per room with that room's items: real ids for provisional
+        # ones (saved) or the provisional ids that were dropped (failed)
+        by_group = {}
+        for group, item in items:
+            if group:
+                by_group.setdefault(group, []).append(item)
+        channel_layer = get_channel_layer()
+        for group, messages in by_group.items():
+            await channel_layer.group_send(group, {
+                'type': event_type,
+                'messages': messages,
+            })
+
+    async def drain(self):
+        # Flush and wait for any flushes already in flight
+        await self.flush()
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    def flush_sync(self):
+        # Last-chance flush when the event loop is already gone
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        try:
+            unread.post_messages([message for _, _, message in batch])
+        except Exception:
+            logger.exception("Failed to write %d buffered chat messages; writing them one by one", len(batch))
+            saved, failed = self._write_separately(batch)
+            if failed:
+                logger.error("Dropped %d buffered chat messages that could not be written", len(failed))
+            return len(saved)
+        return len(batch)
+
+
+_buffer = None
+
+
+def write_behind_enabled():
+    return getattr(settings, 'CHAT_WRITE_BEHIND', False)
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = MessageWriteBuffer(
+            batch_size=getattr(settings, 'CHAT_WRITE_BEHIND_BATCH', 100),
+            interval=getattr(settings, 'CHAT_WRITE_BEHIND_INTERVAL_MS', 20) / 1000,
+            max_pending=getattr(settings, 'CHAT_WRITE_BEHIND_MAX_PENDING', 5000),
+            max_attempts=getattr(settings, 'CHAT_WRITE_BEHIND_MAX_ATTEMPTS', 3),
+        )
+        atexit.register(_flush_at_exit)
+    return _buffer
+
+
+def _flush_at_exit():
+    if _buffer is not None and len(_buffer):
+        try:
+            count = _buffer.flush_sync()
+            logger.info("Flushed %d buffered chat messages at shutdown", count)
+        except Exception:
+            logger.exception("Lost %d buffered chat messages at shutdown", len(_buffer))
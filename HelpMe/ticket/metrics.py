@@ -0,0 +1,178 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+
+# In-process metrics in the Prometheus text format, served at /metrics.
+#
+# Each HTTP request (InstrumentationMiddleware) and each consumer event
+# (InstrumentedConsumerMixin) gets a Stats object in a context variable.
+# Database queries are counted by an execute wrapper (record_query) and
+# cache lookups by the instrumented cache backends (cache_backends.py);
+# asgiref copies the context into sync_to_async threads, so work done there
+# lands on the right Stats. Every process keeps its own numbers, and
+# Prometheus scrapes each worker.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Stats:
+    __slots__ = ('queries', 'query_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+current = ContextVar('helpme_metrics_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    # connection.execute_wrapper() hook
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+def record_cache(hits, misses):
+    stats = current.get()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+    CACHE_LOOKUPS.inc(hits, result='hit')
+    CACHE_LOOKUPS.inc(misses, result='miss')
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        if not amount:
+            return
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_labels(zip(self.labelnames, key))} {value}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def total(self, **labels):
+        # (count, sum) over every series matching `labels`
+        count = total = 0
+        with self.lock:
+            for key, values in self.series.items():
+                if all(dict(zip(self.labelnames, key)).get(name) == value for name, value in labels.items()):
+                    count += sum(values[:-1])
+                    total += values[-1]
+        return count, total
+
+    def samples(self):
+        with self.lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for key, values in sorted(series.items()):
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(pairs + [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_labels(pairs)} {values[-1]}'
+            yield f'{self.name}_count{_labels(pairs)} {cumulative}'
+
+
+REGISTRY = []
+
+HTTP_DURATION = Histogram(
+    'helpme_http_request_duration_seconds', 'Time spent handling HTTP requests',
+    ('view', 'method', 'status'),
+)
+HTTP_QUERIES = Histogram(
+    'helpme_http_db_queries', 'Database queries per HTTP request', ('view',), QUERY_BUCKETS,
+)
+HTTP_QUERY_TIME = Histogram(
+    'helpme_http_db_duration_seconds', 'Database time per HTTP request', ('view',),
+)
+WS_DURATION = Histogram(
+    'helpme_ws_event_duration_seconds', 'Time spent handling consumer events',
+    ('consumer', 'event'),
+)
+WS_QUERIES = Histogram(
+    'helpme_ws_db_queries', 'Database queries per consumer event', ('consumer', 'event'), QUERY_BUCKETS,
+)
+WS_QUERY_TIME = Histogram(
+    'helpme_ws_db_duration_seconds', 'Database time per consumer event', ('consumer', 'event'),
+)
+HTTP_CACHE_LOOKUPS = Counter(
+    'helpme_http_cache_lookups_total', 'Cache lookups made by HTTP requests', ('view', 'result'),
+)
+WS_CACHE_LOOKUPS = Counter(
+    'helpme_ws_cache_lookups_total', 'Cache lookups made by consumer events', ('consumer', 'event', 'result'),
+)
+CACHE_LOOKUPS = Counter(
+    'helpme_cache_lookups_total', 'Cache lookups by result', ('result',),
+)
+CHAT_BACKPRESSURE = Counter(
+    'helpme_chat_backpressure_total', 'Chat frames refused and room events dropped, by reason', ('reason',),
+)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
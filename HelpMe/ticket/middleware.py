@@ -0,0 +1,34 @@
+import time
+
+from django.db import connection
+
+from . import metrics
+
+
+class InstrumentationMiddleware:
+    # Per-view latency, query count/time and cache hits for /metrics.
+    # Goes first in MIDDLEWARE so the whole stack is timed.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = metrics.Stats()
+        token = metrics.current.set(stats)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(metrics.record_query):
+                response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        metrics.HTTP_DURATION.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        metrics.HTTP_QUERIES.observe(stats.queries, view=view)
+        metrics.HTTP_QUERY_TIME.observe(stats.query_time, view=view)
+        metrics.HTTP_CACHE_LOOKUPS.inc(stats.cache_hits, view=view, result='hit')
+        metrics.HTTP_CACHE_LOOKUPS.inc(stats.cache_misses, view=view, result='miss')
+        return response
+
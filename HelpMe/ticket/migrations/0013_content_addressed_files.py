@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:16
+
+import ticket.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket', '0012_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(db_index=True, storage=ticket.storage.content_addressed_storage, upload_to='attachments/'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='file',
+            field=models.FileField(blank=True, db_index=True, null=True, storage=ticket.storage.content_addressed_storage, upload_to='chat_files/'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:24
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# (table, {column: weight}) for each searchable model
+SEARCH_TABLES = [
+    ('ticket_ticket', {'title': 'A', 'description': 'B'}),
+    ('ticket_message', {'msg': 'A'}),
+    ('ticket_faq', {'question': 'A', 'answer': 'B'}),
+]
+
+
+def vector_sql(columns, row=''):
+    return ' || '.join(
+        f"setweight(to_tsvector('english', coalesce({row}{column}, '')), '{weight}')"
+        for column, weight in columns.items()
+    )
+
+
+def create_search_triggers(apps, schema_editor):
+    # Triggers rather than signals so bulk_create (write-behind chat
+    # messages) and queryset.update() keep the vectors current too
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, columns in SEARCH_TABLES:
+        schema_editor.execute(f"""
+            CREATE FUNCTION {table}_search_update() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := {vector_sql(columns, 'NEW.')};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        schema_editor.execute(f"""
+            CREATE TRIGGER {table}_search_trigger
+            BEFORE INSERT OR UPDATE OF {', '.join(columns)} ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}_search_update()
+        """)
+        schema_editor.execute(f"UPDATE {table} SET search_vector = {vector_sql(columns)}")
+        schema_editor.execute(
+            f"CREATE INDEX {table}_search_idx ON {table} USING gin (search_vector)"
+        )
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, columns in SEARCH_TABLES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {table}_search_idx")
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_search_trigger ON {table}")
+        schema_editor.execute(f"DROP FUNCTION IF EXISTS {table}_search_update()")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket', '0014_notification_unread_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faq',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
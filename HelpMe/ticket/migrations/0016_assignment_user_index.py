@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket', '0015_search_vectors'),
+    ]
+
+    # The implicit Ticket.assign table only has (ticket_id, user_id) unique and
+    # single-column indexes. "Assigned to me" starts from the agent, so this
+    # covers the lookup of an agent's ticket ids without touching the table.
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX ticket_assign_user_ticket_idx ON ticket_ticket_assign (user_id, ticket_id)',
+            'DROP INDEX ticket_assign_user_ticket_idx',
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_messages(apps, schema_editor):
+    Message = apps.get_model('ticket', 'Message')
+    Ticket = apps.get_model('ticket', 'Ticket')
+    messages = Message.objects.filter(ticket=models.OuterRef('pk')).order_by().values('ticket')
+    Ticket.objects.update(
+        message_count=Coalesce(
+            models.Subquery(messages.annotate(count=models.Count('id')).values('count')), 0
+        ),
+        last_message_at=models.Subquery(messages.annotate(last=models.Max('created_at')).values('last')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket', '0016_assignment_user_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0)),
+                ('read_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['-last_message_at', '-id'], name='ticket_last_message_idx'),
+        ),
+        migrations.AddField(
+            model_name='ticketreadcursor',
+            name='ticket',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='ticket.ticket'),
+        ),
+        migrations.AddField(
+            model_name='ticketreadcursor',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='ticketreadcursor',
+            constraint=models.UniqueConstraint(fields=('user', 'ticket'), name='read_cursor_user_ticket_uniq'),
+        ),
+        migrations.RunPython(count_messages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+STATUSES = ('OPEN', 'IN_PROGRESS', 'CLOSED')
+
+
+def normalize_status(apps, schema_editor):
+    # CloseTicketView used to write 'closed', which matches no Ticket.Status
+    Ticket = apps.get_model('ticket', 'Ticket')
+    for status in STATUSES:
+        Ticket.objects.filter(status__iexact=status).exclude(status=status).update(status=status)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ticket', '0018_task_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_status, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,14 @@
+import uuid
+
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+
+from . import previews
+from .storage import content_addressed_storage
 
 
 # Organization
@@ -25,6 +34,51 @@ class Profile(models.Model):
         return self.user.get_full_name() or self.user.username
 
 
+# Query shaping for list views: pull related users in the same query and
+# load only the columns the templates actually render.
+class TicketQuerySet(models.QuerySet):
+    LIST_FIELDS = (
+        "id", "title", "description", "status", "priority", "created_at",
+        "last_message_at", "message_count",
+        "creator__id", "creator__username", "creator__first_name", "creator__last_name",
+    )
+
+    def with_creator(self):
+        return self.select_related("creator")
+
+    def for_list(self):
+        return self.with_creator().only(*self.LIST_FIELDS)
+
+    def with_unread(self, user):
+        # unread_count = messages posted since `user` last read the ticket;
+        # one lookup per row on the (user, ticket) unique index
+        read = TicketReadCursor.objects.filter(user=user, ticket=models.OuterRef("pk")).values("read_count")[:1]
+        return self.annotate(
+            unread_count=models.F("message_count") - Coalesce(models.Subquery(read), 0)
+        )
+
+
+class MessageQuerySet(models.QuerySet):
+    LIST_FIELDS = (
+        "id", "ticket_id", "msg", "file", "file_name", "created_at",
+        "user__id", "user__username", "user__first_name", "user__last_name",
+    )
+
+    def with_author(self):
+        return self.select_related("user")
+
+    def for_chat(self):
+        return self.with_author().only(*self.LIST_FIELDS)
+
+    def older_than(self, message_id):
+        # Keyset on (created_at, id); the anchor row is resolved in a subquery
+        anchor = Message.objects.filter(id=message_id).values("created_at")[:1]
+        return self.filter(
+            models.Q(created_at__lt=models.Subquery(anchor))
+            | models.Q(created_at=models.Subquery(anchor), id__lt=message_id)
+        )
+
+
 # Ticket
 class Ticket(models.Model):
     class Status(models.TextChoices):
@@ -49,6 +103,24 @@ class Ticket(models.Model):
     assign = models.ManyToManyField(
         User, blank=True, related_name="assigned_tickets"
     )
+    # Maintained by a database trigger on PostgreSQL (see search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Denormalized from Message, updated with every insert (see unread.py)
+    last_message_at = models.DateTimeField(null=True, blank=True, editable=False)
+    message_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = TicketQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination for the agent queue, with and without filters
+            models.Index(fields=["-created_at", "-id"], name="ticket_created_id_idx"),
+            models.Index(fields=["status", "-created_at", "-id"], name="ticket_status_created_idx"),
+            models.Index(fields=["priority", "-created_at", "-id"], name="ticket_priority_created_idx"),
+            models.Index(fields=["creator", "-created_at", "-id"], name="ticket_creator_created_idx"),
+            # Agent queue sorted by latest message
+            models.Index(fields=["-last_message_at", "-id"], name="ticket_last_message_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.status})"
@@ -59,7 +131,7 @@ class Attachment(models.Model):
     ticket = models.ForeignKey(
         Ticket, on_delete=models.CASCADE, related_name="attachments"
     )
-    file = models.FileField(upload_to="attachments/")
+    file = models.FileField(upload_to="attachments/", storage=content_addressed_storage, db_index=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -75,12 +147,21 @@ class Message(models.Model):
         Ticket, on_delete=models.CASCADE, related_name="messages"
     )
     msg = models.TextField(blank=True, null=True)
-    file = models.FileField(upload_to="chat_files/", blank=True, null=True)
+    file = models.FileField(
+        upload_to="chat_files/", storage=content_addressed_storage, blank=True, null=True, db_index=True
+    )
     file_name = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = MessageQuerySet.as_manager()
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # Chat history pages are range scans on this index
+            models.Index(fields=["ticket", "created_at", "id"], name="message_ticket_created_idx"),
+        ]
 
     def __str__(self):
         return f"Message by {self.user.username} on {self.ticket.title}"
@@ -89,6 +170,79 @@ class Message(models.Model):
     def is_file_message(self):
         return bool(self.file)
 
+    @property
+    def file_url(self):
+        # Files are only served through the access-checked download view
+        if not self.file:
+            return None
+        return reverse("message_file", args=[self.ticket_id, self.id])
+
+    @property
+    def thumbnail_url(self):
+        return previews.preview_url(self)
+
+
+# How far a user has read a ticket's chat (see unread.py)
+class TicketReadCursor(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="read_cursors"
+    )
+    ticket = models.ForeignKey(
+        Ticket, on_delete=models.CASCADE, related_name="read_cursors"
+    )
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    # Ticket.message_count when the user last read it
+    read_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "ticket"], name="read_cursor_user_ticket_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} read {self.ticket_id} up to {self.last_read_message_id}"
+
+
+# Chunked upload in progress (see uploads.py)
+class ChunkedUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="chunked_uploads"
+    )
+    ticket = models.ForeignKey(
+        Ticket, on_delete=models.CASCADE, related_name="chunked_uploads"
+    )
+    file_name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload of {self.file_name} ({self.offset}/{self.size})"
+
+
+# Queued background work (see tasks.py)
+class Task(models.Model):
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Due time; a claimed task is leased by pushing it into the future
+    run_at = models.DateTimeField(default=timezone.now)
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers only ever look for due, unfailed tasks
+            models.Index(fields=["run_at"], condition=models.Q(failed=False), name="task_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} (attempt {self.attempts})"
+
 
 # Notification
 class Notification(models.Model):
@@ -104,6 +258,9 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=["recipient", "read", "-created_at"], name="notification_unread_idx"),
+        ]
 
     def __str__(self):
         return f"Notification for {self.recipient.username}"
@@ -126,6 +283,7 @@ class FAQ(models.Model):
     creator = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="faqs"
     )
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.question[:50]
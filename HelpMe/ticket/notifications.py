@@ -0,0 +1,113 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Notification
+from .roles import AGENTS
+
+
+# Notifications: rows are written with one bulk_create per event, pushed to
+# each recipient's `user_<id>` group and counted in a cached per-user unread
+# counter, so showing the badge never runs COUNT(*).
+
+UNREAD_TIMEOUT = 60 * 60 * 24
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def _unread_key(user_id):
+    return f'unread_notifications:{user_id}'
+
+
+def unread_count(user):
+    key = _unread_key(user.id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user.id, read=False).count()
+        cache.set(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+def _bump_unread(user_ids):
+    for user_id in user_ids:
+        try:
+            cache.incr(_unread_key(user_id))
+        except ValueError:
+            # Not cached yet; the next read counts once and caches
+            pass
+
+
+def mark_read(user, ids=None):
+    notifications = Notification.objects.filter(recipient_id=user.id, read=False)
+    if ids is not None:
+        notifications = notifications.filter(id__in=ids)
+    updated = notifications.update(read=True)
+    if ids is None:
+        cache.set(_unread_key(user.id), 0, UNREAD_TIMEOUT)
+    elif updated:
+        cache.delete(_unread_key(user.id))
+    return updated
+
+
+def agent_ids():
+    return set(User.objects.filter(groups__name=AGENTS).values_list('id', flat=True))
+
+
+def assigned_ids(ticket):
+    return set(ticket.assign.values_list('id', flat=True))
+
+
+def notify(recipient_ids, ticket, msg, kind):
+    recipient_ids = set(recipient_ids)
+    if not recipient_ids:
+        return []
+
+    notifications = Notification.objects.bulk_create([
+        Notification(recipient_id=user_id, ticket_id=ticket.id, msg=msg)
+        for user_id in recipient_ids
+    ])
+
+    def push():
+        _bump_unread(recipient_ids)
+        channel_layer = get_channel_layer()
+        for notification in notifications:
+            async_to_sync(channel_layer.group_send)(user_group(notification.recipient_id), {
+                'type': 'notify',
+                'id': notification.id,
+                'kind': kind,
+                'ticket_id': ticket.id,
+                'ticket_title': ticket.title,
+                'message': msg,
+            })
+
+    transaction.on_commit(push)
+    return notifications
+
+
+def ticket_created(ticket):
+    return notify(agent_ids() - {ticket.creator_id}, ticket, f'New ticket: {ticket.title}', 'ticket_created')
+
+
+def message_posted(ticket, sender, text):
+    assigned = assigned_ids(ticket)
+    recipients = assigned | {ticket.creator_id}
+    if not assigned:
+        # Nobody owns it yet, so every agent hears about it
+        recipients |= agent_ids()
+    recipients.discard(sender.id)
+    preview = text if len(text) <= 100 else text[:100] + '...'
+    return notify(recipients, ticket, f'{sender.username}: {preview}', 'message')
+
+
+def ticket_assigned(ticket, user_ids):
+    return notify(user_ids, ticket, f'You were assigned: {ticket.title}', 'assigned')
+
+
+def ticket_closed(ticket, closed_by):
+    recipients = assigned_ids(ticket) | {ticket.creator_id}
+    recipients.discard(closed_by.id)
+    return notify(recipients, ticket, f'Ticket closed: {ticket.title}', 'closed')
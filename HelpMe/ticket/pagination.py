@@ -0,0 +1,63 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import Message
+
+
+# Keyset (cursor) pagination on (created_at, id), or another non-null
+# timestamp column such as Ticket.last_message_at.
+# The cursor points at the last row already sent, so every page is an index
+# range scan no matter how deep the client has scrolled.
+
+def encode_cursor(obj, field='created_at'):
+    raw = f"{getattr(obj, field).isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def keyset_page(queryset, cursor=None, page_size=25, descending=True, field='created_at'):
+    if descending:
+        queryset = queryset.order_by(f'-{field}', '-id')
+    else:
+        queryset = queryset.order_by(field, 'id')
+
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        if descending:
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+            )
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk})
+            )
+
+    # Fetch one extra row to know whether another page exists
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = encode_cursor(rows[-1], field) if has_more else None
+    return rows, next_cursor
+
+
+def message_history(ticket_id, before=None, limit=50):
+    # Most recent `limit` messages older than `before`, returned oldest first
+    queryset = Message.objects.for_chat().filter(ticket_id=ticket_id)
+    if before:
+        queryset = queryset.older_than(before)
+
+    rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import time
+import weakref
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+# Who is in a chat room and who is typing.
+#
+# Presence: each socket is a member of its room (chat_<ticket_id>) with an
+# expiry. Joining adds it, the client's 30s ping pushes the expiry
+# CHAT_PRESENCE_TTL ahead again and leaving removes it; sockets of a process
+# that died without disconnecting simply expire. Members live in this process
+# when CHAT_PRESENCE_URL is empty (in-memory channel layer) and in one Redis
+# sorted set per room otherwise, so every worker sees the same room.
+#
+# Fan-out: roster changes and typing frames are not broadcast as they arrive.
+# Each process collects them per room and sends at most one chat_presence
+# event per room every CHAT_TYPING_INTERVAL, with the roster (when it
+# changed) and everyone who typed meanwhile. However many clients type, a
+# room costs each process one group_send per interval.
+
+
+def member(user, channel_name):
+    return f'{user.id}:{user.username}:{channel_name}'
+
+
+def online(members):
+    # Distinct users behind a room's members, by username
+    users = {}
+    for entry in members:
+        user_id, rest = entry.split(':', 1)
+        users[int(user_id)] = rest.rsplit(':', 1)[0]
+    return [
+        {'id': user_id, 'username': username}
+        for user_id, username in sorted(users.items(), key=lambda item: item[1])
+    ]
+
+
+class MemoryPresence:
+    def __init__(self):
+        self.rooms = {}
+
+    async def add(self, room, member, ttl):
+        # True when `member` was not (or no longer) present
+        members = self.rooms.setdefault(room, {})
+        now = time.time()
+        added = members.get(member, 0) <= now
+        members[member] = now + ttl
+        return added
+
+    async def remove(self, room, member):
+        members = self.rooms.get(room, {})
+        members.pop(member, None)
+        if not members:
+            self.rooms.pop(room, None)
+
+    async def members(self, room):
+        now = time.time()
+        members = self.rooms.get(room, {})
+        for entry, expires in list(members.items()):
+            if expires <= now:
+                del members[entry]
+        return list(members)
+
+
+class RedisPresence:
+    # Members scored by expiry time, so expired ones go with one
+    # ZREMRANGEBYSCORE. Clients are bound to the event loop that made them.
+
+    def __init__(self, url):
+        self.url = url
+        self._clients = weakref.WeakKeyDictionary()
+
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = aioredis.from_url(self.url, decode_responses=True)
+        return client
+
+    def key(self, room):
+        return f'helpme:presence:{room}'
+
+    async def add(self, room, member, ttl):
+        key = self.key(room)
+        async with self.client().pipeline(transaction=False) as pipe:
+            pipe.zadd(key, {member: time.time() + ttl})
+            # An abandoned room disappears on its own
+            pipe.expire(key, ttl)
+            added, _ = await pipe.execute()
+        return bool(added)
+
+    async def remove(self, room, member):
+        await self.client().zrem(self.key(room), member)
+
+    async def members(self, room):
+        key = self.key(room)
+        async with self.client().pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(key, '-inf', time.time())
+            pipe.zrange(key, 0, -1)
+            _, members = await pipe.execute()
+        return members
+
+
+_stores = {}
+
+
+def get_store():
+    url = getattr(settings, 'CHAT_PRESENCE_URL', '')
+    store = _stores.get(url)
+    if store is None:
+        if url and aioredis is None:
+            raise RuntimeError('CHAT_PRESENCE_URL is set but the redis package is not installed')
+        store = _stores[url] = RedisPresence(url) if url else MemoryPresence()
+    return store
+
+
+class RoomActivity:
+    # Per-process, per-event-loop collector behind the coalesced fan-out
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.typing = {}
+        self.changed = set()
+        self._timers = {}
+        self._tasks = set()
+
+    def roster_changed(self, room):
+        self.changed.add(room)
+        self._schedule(room)
+
+    def typed(self, room, user):
+        self.typing.setdefault(room, {})[user.id] = user.username
+        self._schedule(room)
+
+    def _schedule(self, room):
+        if room not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[room] = loop.call_later(self.interval, self._start_flush, loop, room)
+
+    def _start_flush(self, loop, room):
+        task = loop.create_task(self.flush(room))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, room):
+        self._timers.pop(room, None)
+        typing = self.typing.pop(room, {})
+        event = {
+            'type': 'chat_presence',
+            'sent_at': time.time(),
+            'typing': [{'id': user_id, 'username': username} for user_id, username in typing.items()],
+        }
+        try:
+            if room in self.changed:
+                self.changed.discard(room)
+                event['online'] = online(await get_store().members(room))
+            await get_channel_layer().group_send(room, event)
+        except Exception:
+            logger.exception("Presence update for %s failed", room)
+
+
+_activity = weakref.WeakKeyDictionary()
+
+
+def get_activity():
+    loop = asyncio.get_running_loop()
+    activity = _activity.get(loop)
+    if activity is None:
+        activity = _activity[loop] = RoomActivity(getattr(settings, 'CHAT_TYPING_INTERVAL', 1.0))
+    return activity
+
+
+async def join(room, user, channel_name):
+    # Also the heartbeat: re-joining only pushes the expiry ahead
+    try:
+        added = await get_store().add(room, member(user, channel_name), settings.CHAT_PRESENCE_TTL)
+    except Exception:
+        logger.exception("Joining presence of %s failed", room)
+        return
+    if added:
+        get_activity().roster_changed(room)
+
+
+async def leave(room, user, channel_name):
+    try:
+        await get_store().remove(room, member(user, channel_name))
+    except Exception:
+        logger.exception("Leaving presence of %s failed", room)
+        return
+    get_activity().roster_changed(room)
+
+
+def typing(room, user):
+    get_activity().typed(room, user)
@@ -0,0 +1,166 @@
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.urls import reverse
+
+from .storage import content_addressed_storage
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+
+# Thumbnails for shared images and first-page previews for PDFs.
+#
+# Chat files are content-addressed (storage.py), so a preview is keyed by the
+# blob's hash: chat_previews/<aa>/<sha256>.jpg. Re-sharing a file reuses its
+# preview, and the preview goes away with the blob (signals.py).
+#
+# Rendering is CPU-bound and runs in a process pool after the upload has
+# committed; the worker only gets file paths and sizes, never Django objects.
+# When the preview is written the room gets a chat_message_preview event with
+# its URL, the same URL serialize_message() includes from then on.
+
+PREVIEW_DIR = 'chat_previews'
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'}
+PDF_EXTENSIONS = {'.pdf'}
+
+
+def preview_kind(name):
+    extension = os.path.splitext(name)[1].lower()
+    if Image is None:
+        return None
+    if extension in IMAGE_EXTENSIONS:
+        return 'image'
+    if extension in PDF_EXTENSIONS and pdfium is not None:
+        return 'pdf'
+    return None
+
+
+def preview_name(name):
+    digest = os.path.splitext(os.path.basename(name))[0]
+    return os.path.join(PREVIEW_DIR, digest[:2], f'{digest}.jpg')
+
+
+def preview_url(message):
+    # None until the preview has been rendered
+    if not message.file or not preview_kind(message.file.name):
+        return None
+    if not content_addressed_storage().exists(preview_name(message.file.name)):
+        return None
+    return reverse('message_preview', args=[message.ticket_id, message.id])
+
+
+def render_preview(source, target, kind, size, quality):
+    # Runs in a worker process
+    if kind == 'pdf':
+        document = pdfium.PdfDocument(source)
+        try:
+            page = document[0]
+            # Page sizes are in points; render just big enough for `size`
+            scale = size / max(page.get_size())
+            image = page.render(scale=max(scale, 0.1)).to_pil()
+        finally:
+            document.close()
+    else:
+        image = Image.open(source)
+        # Let JPEG decode at a reduced scale instead of full resolution
+        image.draft('RGB', (size, size))
+
+    image.thumbnail((size, size))
+    if image.mode != 'RGB':
+        # Flatten transparency onto white rather than black
+        background = Image.new('RGB', image.size, 'white')
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = f'{target}.{uuid.uuid4().hex}.tmp'
+    image.save(temp, 'JPEG', quality=quality, optimize=True)
+    os.replace(temp, target)
+    return target
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Not forked from a web process: a fork would copy its event
+                # loop, database connections and lock states into the worker
+                _executor = ProcessPoolExecutor(
+                    max_workers=settings.CHAT_PREVIEW_WORKERS,
+                    mp_context=multiprocessing.get_context('forkserver'),
+                )
+    return _executor
+
+
+def announce(message):
+    async_to_sync(get_channel_layer().group_send)(f'chat_{message.ticket_id}', {
+        'type': 'chat_message_preview',
+        'id': message.id,
+        'thumbnail_url': reverse('message_preview', args=[message.ticket_id, message.id]),
+    })
+
+
+def _finished(message, future):
+    try:
+        future.result()
+        announce(message)
+    except Exception:
+        logger.exception("Preview of message %s failed", message.id)
+
+
+def generate(message):
+    # Queue a preview for a saved file message; call after commit. Returns
+    # the future, or None when there is nothing to render.
+    name = message.file.name if message.file else None
+    kind = preview_kind(name or '')
+    if kind is None:
+        return None
+
+    storage = content_addressed_storage()
+    target = storage.path(preview_name(name))
+    if os.path.exists(target):
+        # Already rendered for an earlier share of the same file
+        return None
+
+    args = (storage.path(name), target, kind, settings.CHAT_PREVIEW_SIZE, settings.CHAT_PREVIEW_QUALITY)
+
+    if not settings.CHAT_PREVIEW_WORKERS:
+        try:
+            render_preview(*args)
+            announce(message)
+        except Exception:
+            logger.exception("Preview of message %s failed", message.id)
+        return None
+
+    future = get_executor().submit(render_preview, *args)
+    future.add_done_callback(lambda future: _finished(message, future))
+    return future
+
+
+def discard(name):
+    # The blob `name` was deleted
+    if preview_kind(name):
+        content_addressed_storage().delete(preview_name(name))
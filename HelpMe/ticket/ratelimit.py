@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+# Token buckets for chat frames. A bucket holds up to `burst` tokens and
+# refills at `rate` per second; each frame takes one, and frames that find
+# the bucket empty are refused. ChatConsumer keeps one per socket, and this
+# module one per user for all of that user's sockets in the process.
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self):
+        # Seconds until the next token
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class BucketRegistry:
+    # Least recently used users beyond `size` are forgotten, which only ever
+    # hands them a full bucket again
+    def __init__(self, rate, burst, size=10000):
+        self.rate = rate
+        self.burst = burst
+        self.size = size
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.size:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+
+_registries = {}
+
+
+def socket_bucket():
+    return TokenBucket(settings.CHAT_SOCKET_RATE, settings.CHAT_SOCKET_BURST)
+
+
+def user_bucket(user_id):
+    limits = (settings.CHAT_USER_RATE, settings.CHAT_USER_BURST)
+    registry = _registries.get(limits)
+    if registry is None:
+        registry = _registries.setdefault(limits, BucketRegistry(*limits))
+    return registry.get(user_id)
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+# Role resolution with two cache levels:
+#   1. a memo on the user object, so one request asks at most once
+#   2. a process-wide TTL/LRU map of user id -> group names
+# Group membership changes invalidate level 2 through signals (see signals.py).
+
+AGENTS = 'Agents'
+ADMIN = 'Admin'
+
+_MEMO_ATTR = '_helpme_roles'
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _ttl():
+    return getattr(settings, 'ROLE_CACHE_TTL', 300)
+
+
+def _max_size():
+    return getattr(settings, 'ROLE_CACHE_SIZE', 10000)
+
+
+def get_roles(user):
+    if not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, _MEMO_ATTR, None)
+    if roles is not None:
+        return roles
+
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user.pk)
+        if entry and entry[0] > now:
+            _cache.move_to_end(user.pk)
+            roles = entry[1]
+
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        with _lock:
+            _cache[user.pk] = (now + _ttl(), roles)
+            _cache.move_to_end(user.pk)
+            while len(_cache) > _max_size():
+                _cache.popitem(last=False)
+
+    setattr(user, _MEMO_ATTR, roles)
+    return roles
+
+
+def is_agent(user):
+    return AGENTS in get_roles(user)
+
+
+def is_admin(user):
+    return ADMIN in get_roles(user)
+
+
+def can_access_ticket(user, ticket):
+    return is_agent(user) or ticket.creator_id == user.id
+
+
+def invalidate(user_ids=None):
+    # No ids means "anything may have changed", e.g. a group was renamed
+    with _lock:
+        if user_ids is None:
+            _cache.clear()
+        else:
+            for user_id in user_ids:
+                _cache.pop(user_id, None)
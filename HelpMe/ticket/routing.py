@@ -3,4 +3,6 @@ from . import consumer
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<ticket_id>\d+)/$', consumer.ChatConsumer.as_asgi()),
+    re_path(r'ws/notifications/$', consumer.NotificationConsumer.as_asgi()),
+    re_path(r'ws/dashboard/$', consumer.DashboardConsumer.as_asgi()),
 ]
@@ -0,0 +1,120 @@
+import re
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q
+from django.utils.html import escape
+
+from .models import FAQ, Message, Ticket
+
+
+# Full-text search. On PostgreSQL each searchable model carries a
+# `search_vector` column kept up to date by a database trigger (see migration
+# 0015) and indexed with GIN, so a query is an index lookup plus ranking of
+# the matching rows only. Other backends (SQLite in tests) fall back to
+# icontains matching with highlights built in Python.
+
+SEARCH_CONFIG = 'english'
+MAX_QUERY_LENGTH = 200
+HEADLINE_OPTIONS = {
+    'start_sel': '<mark>',
+    'stop_sel': '</mark>',
+    'max_words': 30,
+    'min_words': 10,
+    'max_fragments': 2,
+}
+
+# model -> (fields, field used for the highlight)
+SEARCH_FIELDS = {
+    Ticket: (('title', 'description'), 'description'),
+    Message: (('msg',), 'msg'),
+    FAQ: (('question', 'answer'), 'answer'),
+}
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def query_terms(query):
+    return [term for term in re.findall(r'\w+', query.lower()) if len(term) > 1]
+
+
+def highlight(text, terms, width=160):
+    # Fallback for ts_headline: a window around the first hit, with every
+    # term wrapped in <mark>. The text is escaped before marking.
+    text = text or ''
+    lowered = text.lower()
+    hits = [lowered.find(term) for term in terms if term in lowered]
+    start = max(min(hits) - width // 4, 0) if hits else 0
+    snippet = text[start:start + width]
+
+    if terms:
+        pattern = re.compile('(%s)' % '|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+        parts = pattern.split(snippet)
+        # split() with a capturing group puts the hits at odd positions
+        marked = ''.join(
+            f'<mark>{escape(part)}</mark>' if i % 2 else escape(part)
+            for i, part in enumerate(parts)
+        )
+    else:
+        marked = escape(snippet)
+    if start > 0:
+        marked = '…' + marked
+    if start + width < len(text):
+        marked += '…'
+    return marked
+
+
+def safe_headline(headline):
+    # ts_headline returns the stored text verbatim; escape it and then
+    # restore only the <mark> tags it added
+    marked = escape(headline or '')
+    return marked.replace('&lt;mark&gt;', '<mark>').replace('&lt;/mark&gt;', '</mark>')
+
+
+def search(queryset, query, limit, offset=0):
+    # Returns (rows, has_more); each row has a `headline` attribute
+    fields, headline_field = SEARCH_FIELDS[queryset.model]
+
+    if uses_postgres():
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        queryset = (
+            queryset.filter(search_vector=search_query)
+            .annotate(
+                rank=SearchRank(F('search_vector'), search_query),
+                headline=SearchHeadline(
+                    headline_field, search_query, config=SEARCH_CONFIG, **HEADLINE_OPTIONS
+                ),
+            )
+            .order_by('-rank', '-id')
+        )
+        rows = list(queryset[offset:offset + limit + 1])
+        for row in rows:
+            row.headline = safe_headline(row.headline)
+    else:
+        terms = query_terms(query)
+        if not terms:
+            return [], False
+        for term in terms:
+            match = Q()
+            for field in fields:
+                match |= Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(match)
+        rows = list(queryset.order_by('-id')[offset:offset + limit + 1])
+        for row in rows:
+            row.headline = highlight(getattr(row, headline_field), terms)
+
+    return rows[:limit], len(rows) > limit
+
+
+def visible_tickets(user, agent):
+    tickets = Ticket.objects.all()
+    return tickets if agent else tickets.filter(creator=user)
+
+
+def visible_messages(user, agent):
+    chat_messages = Message.objects.select_related('ticket').only(
+        'id', 'msg', 'created_at', 'ticket__id', 'ticket__title'
+    )
+    return chat_messages if agent else chat_messages.filter(ticket__creator=user)
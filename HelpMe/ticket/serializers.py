@@ -0,0 +1,18 @@
+# Plain-dict payloads shared by the HTTP JSON endpoints and the WebSocket
+# consumers, so both transports send messages in the same shape.
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def serialize_message(message):
+    is_file = message.is_file_message
+    return {
+        'id': message.id,
+        'message': message.msg,
+        'username': message.user.username,
+        'timestamp': message.created_at.strftime(TIMESTAMP_FORMAT),
+        'is_file': is_file,
+        'file_name': message.file_name if is_file else None,
+        'file_url': message.file_url,
+        'thumbnail_url': message.thumbnail_url if is_file else None,
+    }
@@ -0,0 +1,187 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import assignment, dashboard, faq_cache, jobs, notifications, previews, roles, tasks
+from .models import Attachment, FAQ, Message, Ticket
+from .storage import blob_lock, content_addressed_storage
+
+
+# Roles
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        # user.groups.add/remove/clear(...)
+        roles.invalidate([instance.pk])
+    elif pk_set:
+        # group.user_set.add/remove(...)
+        roles.invalidate(pk_set)
+    else:
+        # group.user_set.clear() does not say which users were affected
+        roles.invalidate()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, **kwargs):
+    roles.invalidate()
+
+
+@receiver(post_delete, sender=User)
+def invalidate_roles_on_user_delete(sender, instance, **kwargs):
+    roles.invalidate([instance.pk])
+
+
+# Content-addressed blobs
+
+def blob_references(name):
+    return (
+        Message.objects.filter(file=name).count()
+        + Attachment.objects.filter(file=name).count()
+    )
+
+
+def release_blob(name):
+    if not name:
+        return
+    with transaction.atomic():
+        # Counted under the lock, so an upload of the same content either
+        # committed its row already or saves the blob again after this
+        blob_lock(name)
+        if blob_references(name):
+            return
+        content_addressed_storage().delete(name)
+        previews.discard(name)
+
+
+@receiver(post_delete, sender=Message)
+def forget_message_file(sender, instance, **kwargs):
+    # Cached by MessageFileView
+    cache.delete(f'message_file:{instance.pk}')
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=Attachment)
+def release_blob_on_delete(sender, instance, **kwargs):
+    name = instance.file.name if instance.file else None
+    if name:
+        # Only once the delete is committed, and the last reference is gone
+        transaction.on_commit(lambda: release_blob(name))
+
+
+# Notifications
+
+@receiver(post_save, sender=Ticket)
+def notify_ticket_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        tasks.enqueue(jobs.ticket_created, instance.pk)
+
+
+@receiver(m2m_changed, sender=Ticket.assign.through)
+def notify_ticket_assigned(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if not reverse:
+        # ticket.assign.add(*users)
+        notifications.ticket_assigned(instance, pk_set)
+    else:
+        # user.assigned_tickets.add(*tickets)
+        for ticket in Ticket.objects.filter(id__in=pk_set).only('id', 'title'):
+            notifications.ticket_assigned(ticket, [instance.pk])
+
+
+# Agent dashboard
+
+@receiver(post_save, sender=Ticket)
+def publish_ticket_change(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        dashboard.ticket_saved(instance, created)
+
+
+@receiver(m2m_changed, sender=Ticket.assign.through)
+def publish_assignment_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        ticket_ids = [instance.pk]
+    else:
+        ticket_ids = pk_set or []
+    through = Ticket.assign.through.objects
+    for ticket_id in ticket_ids:
+        assignees = through.filter(ticket_id=ticket_id).values_list('user_id', flat=True)
+        dashboard.ticket_assignees_changed(ticket_id, list(assignees))
+
+
+# Agent load counters (assignment.py)
+
+@receiver(m2m_changed, sender=Ticket.assign.through)
+def track_assignment_load(sender, instance, action, reverse, pk_set, **kwargs):
+    through = Ticket.assign.through.objects
+    if not reverse:
+        # ticket.assign.add/remove/clear(...)
+        ticket_weight = assignment.weight(instance.status, instance.priority)
+        if action == 'post_add':
+            assignment.adjust(pk_set, ticket_weight)
+        elif action in ('pre_remove', 'pre_clear'):
+            # Before the rows go, so only agents actually assigned lose load
+            removed = through.filter(ticket_id=instance.pk)
+            if action == 'pre_remove':
+                removed = removed.filter(user_id__in=pk_set)
+            assignment.adjust(removed.values_list('user_id', flat=True), -ticket_weight)
+    elif action == 'pre_clear':
+        # user.assigned_tickets.clear(): recount this agent on the next read
+        assignment.forget([instance.pk])
+    elif action in ('post_add', 'pre_remove'):
+        # user.assigned_tickets.add/remove(...)
+        tickets = Ticket.objects.filter(id__in=pk_set)
+        if action == 'pre_remove':
+            tickets = tickets.filter(assign=instance)
+        total = sum(assignment.weight(status, priority) for status, priority in tickets.values_list('status', 'priority'))
+        assignment.adjust([instance.pk], total if action == 'post_add' else -total)
+
+
+@receiver(pre_save, sender=Ticket)
+def remember_ticket_weight(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not {'status', 'priority'} & set(update_fields):
+        return
+    previous = Ticket.objects.filter(pk=instance.pk).values_list('status', 'priority').first()
+    instance._previous_weight = assignment.weight(*previous) if previous else 0
+
+
+@receiver(post_save, sender=Ticket)
+def track_ticket_load(sender, instance, created, raw=False, **kwargs):
+    previous = instance.__dict__.pop('_previous_weight', None)
+    if created or raw or previous is None:
+        return
+    delta = assignment.weight(instance.status, instance.priority) - previous
+    if delta:
+        assignees = Ticket.assign.through.objects.filter(ticket_id=instance.pk).values_list('user_id', flat=True)
+        assignment.adjust(assignees, delta)
+
+
+@receiver(pre_delete, sender=Ticket)
+def release_ticket_load(sender, instance, **kwargs):
+    ticket_weight = assignment.weight(instance.status, instance.priority)
+    if ticket_weight:
+        assignees = Ticket.assign.through.objects.filter(ticket_id=instance.pk).values_list('user_id', flat=True)
+        assignment.adjust(assignees, -ticket_weight)
+
+
+@receiver(post_delete, sender=User)
+def forget_agent_load(sender, instance, **kwargs):
+    assignment.forget([instance.pk])
+
+
+# FAQ cache
+
+@receiver(post_save, sender=FAQ)
+@receiver(post_delete, sender=FAQ)
+def invalidate_faq_cache(sender, **kwargs):
+    transaction.on_commit(faq_cache.invalidate)
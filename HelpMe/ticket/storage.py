@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import os
+import uuid
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Content-addressed storage for chat files and attachments.
+#
+# A blob is stored once under <upload_to>/<aa>/<sha256><ext>, so re-sharing the
+# same file only adds a database row pointing at the existing blob. Blobs are
+# removed when the last Message/Attachment referencing them is deleted
+# (see signals.py).
+#
+# Saving a blob and releasing it take the same per-blob lock (blob_lock), held
+# until the transaction ends: a save inside transaction.atomic() together with
+# its row cannot have the blob deleted under it by a release that counted the
+# references before that row was committed.
+
+HASH_BUFFER = 64 * 1024
+
+
+def file_digest(content):
+    # Callers that already hashed while streaming can set content.sha256
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+
+    hasher = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks(HASH_BUFFER):
+        hasher.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+def blob_name(name, digest):
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, digest[:2], f'{digest}{extension}')
+
+
+def blob_lock(name):
+    # A transaction-scoped advisory lock on the blob's digest (PostgreSQL).
+    # Other backends are development setups and go unlocked.
+    if connection.vendor != 'postgresql':
+        return
+    digest = os.path.splitext(os.path.basename(name))[0]
+    # The first 64 bits of the digest as a signed bigint
+    key = int(digest[:16], 16) - 2 ** 63
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content hash in _save()
+        return name
+
+    def _save(self, name, content):
+        name = blob_name(name, file_digest(content))
+        blob_lock(name)
+        if self.exists(name):
+            return name
+
+        # Write under a unique temporary name and rename into place, so a
+        # concurrent save of the same content never exposes a partial blob
+        temp_name = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temp_name), self.path(name))
+        return name
+
+
+_storage = ContentAddressedStorage()
+
+
+def content_addressed_storage():
+    return _storage
+
+
+# Static files for production: hashed names from ManifestStaticFilesStorage,
+# plus precompressed .gz/.br siblings for the web server to send as-is
+# (nginx gzip_static/brotli_static), so nothing is compressed per request.
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.txt', '.html', '.json', '.map', '.xml'}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    min_compress_size = 256
+
+    def compressors(self):
+        yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+        if brotli is not None:
+            yield '.br', lambda data: brotli.compress(data)
+
+    def compress(self, name):
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        with open(self.path(name), 'rb') as f:
+            data = f.read()
+        if len(data) < self.min_compress_size:
+            return
+        for suffix, compress in self.compressors():
+            compressed = compress(data)
+            # Only keep it if it actually saves bytes
+            if len(compressed) < len(data):
+                with open(self.path(name + suffix), 'wb') as f:
+                    f.write(compressed)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in set(self.hashed_files.values()):
+            self.compress(hashed_name)
@@ -0,0 +1,180 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+# Background tasks for slow work triggered by views and consumers.
+#
+# A task is a row in ticket_task written in the same transaction as the change
+# that queued it, so it exists exactly when that change committed. Workers
+# claim due rows with SELECT ... FOR UPDATE SKIP LOCKED and lease them by
+# moving run_at TASK_LEASE seconds ahead; a worker that dies mid-task gives it
+# back when the lease runs out. Failures are retried with exponential backoff
+# and kept with failed=True after TASK_MAX_ATTEMPTS.
+#
+# Concurrency is TASK_THREADS runner threads per web process (TASK_MODE
+# 'thread') plus however many `manage.py run_tasks` workers are running.
+# Handlers are plain functions registered with @task; their arguments must be
+# JSON-serializable (ids, not model instances).
+
+_registry = {}
+
+
+def task_name(func):
+    return f'{func.__module__}.{func.__name__}'
+
+
+def task(func):
+    _registry[task_name(func)] = func
+    return func
+
+
+def enqueue(func, *args):
+    name = task_name(func)
+    if _registry.get(name) is not func:
+        raise ValueError(f'{name} is not a registered task')
+
+    mode = getattr(settings, 'TASK_MODE', 'thread')
+    if mode == 'inline':
+        transaction.on_commit(lambda: run_inline(func, args))
+        return None
+
+    row = Task.objects.create(name=name, args=list(args))
+    if mode == 'thread':
+        transaction.on_commit(get_runner().wake)
+    return row
+
+
+def run_inline(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Task %s failed", task_name(func))
+
+
+def claim():
+    # The next due task, leased to the caller, or None
+    now = timezone.now()
+    with transaction.atomic():
+        row = (
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(failed=False, run_at__lte=now)
+            .order_by('run_at')
+            .first()
+        )
+        if row is None:
+            return None
+        # Conditional on run_at so backends without SKIP LOCKED (SQLite)
+        # still never hand the same task to two workers
+        claimed = Task.objects.filter(id=row.id, run_at=row.run_at).update(
+            run_at=now + timedelta(seconds=settings.TASK_LEASE),
+            attempts=F('attempts') + 1,
+        )
+    if not claimed:
+        return None
+    row.attempts += 1
+    return row
+
+
+def execute(row):
+    func = _registry.get(row.name)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {row.name}')
+        func(*row.args)
+    except Exception:
+        logger.exception("Task %s (attempt %d) failed", row.name, row.attempts)
+        error = traceback.format_exc()
+        if row.attempts >= settings.TASK_MAX_ATTEMPTS:
+            Task.objects.filter(id=row.id).update(failed=True, last_error=error)
+        else:
+            delay = settings.TASK_RETRY_DELAY * 2 ** (row.attempts - 1)
+            Task.objects.filter(id=row.id).update(
+                run_at=timezone.now() + timedelta(seconds=delay), last_error=error
+            )
+        return False
+    Task.objects.filter(id=row.id).delete()
+    return True
+
+
+def drain(limit=None):
+    # Run due tasks until none are left (or `limit` have run); returns how
+    # many were attempted
+    count = 0
+    while limit is None or count < limit:
+        row = claim()
+        if row is None:
+            break
+        execute(row)
+        count += 1
+    return count
+
+
+class TaskRunner:
+    # Runner threads inside a web process (TASK_MODE 'thread'), started on
+    # the first enqueue and polling for retries and other processes' tasks
+
+    def __init__(self, threads, poll_interval):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.threads):
+                worker = threading.Thread(target=self._loop, name=f'helpme-tasks-{i}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        # Let running tasks finish, then end the threads
+        self._stopping.set()
+        self._wake.set()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                ran = drain(limit=1)
+            except Exception:
+                logger.exception("Task runner failed to claim a task")
+                ran = 0
+            finally:
+                # Hand the pooled connection back between tasks
+                connection.close()
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = TaskRunner(settings.TASK_THREADS, settings.TASK_POLL_INTERVAL)
+    return _runner
@@ -1,3 +1,1838 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .management.commands import bench_suite, seed_bench_data
+from .management.commands.bench_channel_layer import run_fanout
+from . import assignment, faq_suggest, jobs, metrics, notifications, presence, previews, roles, search, tasks, unread, uploads
+from .checks import production_settings
+from .db import BoundedASGIHandler, database_sync_to_async, get_executor
+from .message_buffer import MessageWriteBuffer
+from .models import Attachment, FAQ, Message, Notification, Task, Ticket, TicketReadCursor
+from .routing import websocket_urlpatterns
+from .storage import CompressedManifestStaticFilesStorage, content_addressed_storage
+from .views import AgentTicketListView
+
+try:
+    from fakeredis import TcpFakeServer
+except ImportError:
+    TcpFakeServer = None
+
+try:
+    import lupa  # fakeredis needs it for the Lua scripts channels_redis runs
+except ImportError:
+    lupa = None
+
+
+# Background tasks run right after commit here rather than on runner threads
+# that would race the tests for the database; TaskQueueTests covers the queue
+_inline_tasks = override_settings(TASK_MODE='inline')
+
+
+def setUpModule():
+    _inline_tasks.enable()
+
+
+def tearDownModule():
+    _inline_tasks.disable()
+    # Consumer threads can still hold pooled connections after the socket
+    # tests, which would stop the test database from being dropped
+    bench_suite.release_consumer_connections()
+
+
+class QueryCountMixin:
+    # Render a page at two data sizes and check the number of queries does
+    # not grow with the number of rows (i.e. no N+1 in the view or template).
+    def assertConstantQueries(self, url, add_rows, small=2, large=20):
+        add_rows(small)
+        # Warm per-process caches (roles etc.) so both runs are comparable
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        add_rows(large - small)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(
+            len(few), len(many),
+            f"{url} ran {len(few)} queries for {small} rows but {len(many)} for {large}"
+        )
+
+
+class ViewQueryCountTests(QueryCountMixin, TestCase):
+    def setUp(self):
+        roles.invalidate()
+        agents = Group.objects.create(name='Agents')
+        self.agent = User.objects.create_user('agent', first_name='Ann')
+        self.agent.groups.add(agents)
+        self.customer = User.objects.create_user('customer')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+
+    def add_tickets(self, count):
+        for i in range(count):
+            creator = User.objects.create_user(f'creator{Ticket.objects.count()}')
+            Ticket.objects.create(title=f'Ticket {i}', description='Help', creator=creator)
+
+    def add_own_tickets(self, count):
+        for i in range(count):
+            Ticket.objects.create(title=f'Ticket {i}', description='Help', creator=self.customer)
+
+    def add_messages(self, count):
+        for i in range(count):
+            user = User.objects.create_user(f'author{Message.objects.count()}')
+            Message.objects.create(user=user, ticket=self.ticket, msg=f'Message {i}')
+
+    def add_faqs(self, count):
+        for i in range(count):
+            FAQ.objects.create(question=f'Question {i}', answer='Answer', creator=self.agent)
+
+    def test_agent_view(self):
+        self.client.force_login(self.agent)
+        self.assertConstantQueries(reverse('main_agent'), self.add_tickets)
+
+    def test_main_view(self):
+        self.client.force_login(self.customer)
+        self.assertConstantQueries(reverse('main_user'), self.add_own_tickets)
+
+    def test_chat_view(self):
+        self.client.force_login(self.customer)
+        self.assertConstantQueries(reverse('chat', args=[self.ticket.id]), self.add_messages)
+
+    def test_faq_view(self):
+        self.client.force_login(self.customer)
+        self.assertConstantQueries(reverse('faq'), self.add_faqs)
+
+
+class AgentQueueTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        agents = Group.objects.create(name=roles.AGENTS)
+        self.agent = User.objects.create_user('agent')
+        self.agent.groups.add(agents)
+        self.customer = User.objects.create_user('customer')
+        self.client.force_login(self.agent)
+
+    def page_ids(self, response):
+        return [int(ticket_id) for ticket_id in re.findall(r'data-id="(\d+)"', response.json()['html'])]
+
+    def test_closed_tickets_are_listed_under_closed(self):
+        ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        self.client.post(reverse('close_ticket', args=[ticket.id]))
+
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.status, Ticket.Status.CLOSED)
+        response = self.client.get(reverse('agent_tickets'), {'status': 'CLOSED'})
+        self.assertEqual(self.page_ids(response), [ticket.id])
+
+    def walk(self, **params):
+        # Every page of the queue for `params`, following next_cursor
+        pages = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse('agent_tickets'), {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            pages.append(self.page_ids(response))
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                return pages
+
+    @mock.patch.object(AgentTicketListView, 'page_size', 3)
+    def test_cursor_pages_with_tied_timestamps(self):
+        tickets = [
+            Ticket.objects.create(title=f'Ticket {i}', description='Help', creator=self.customer)
+            for i in range(8)
+        ]
+        # Half of them created in the same instant: only the id breaks ties
+        Ticket.objects.filter(id__in=[ticket.id for ticket in tickets[2:6]]).update(created_at=tickets[2].created_at)
+
+        pages = self.walk()
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+        ids = [ticket_id for page in pages for ticket_id in page]
+        expected = Ticket.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+
+    def test_malformed_cursor_is_rejected(self):
+        for cursor in ('not-a-cursor', 'bm9waXBl', '!!!'):
+            response = self.client.get(reverse('agent_tickets'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+    @mock.patch.object(AgentTicketListView, 'page_size', 2)
+    def test_filters_apply_to_every_page(self):
+        other = User.objects.create_user('other-agent')
+        expected = []
+        for i in range(12):
+            ticket = Ticket.objects.create(
+                title=f'Ticket {i}', description='Help', creator=self.customer,
+                status=Ticket.Status.OPEN if i % 2 else Ticket.Status.CLOSED,
+                priority=Ticket.Priority.HIGH if i % 3 else Ticket.Priority.LOW,
+            )
+            ticket.assign.add(self.agent if i % 4 < 2 else other)
+            if i % 2 and i % 3 and i % 4 < 2:
+                expected.append(ticket.id)
+        unassigned = Ticket.objects.create(title='Nobody', description='Help', creator=self.customer)
+
+        pages = self.walk(status='OPEN', priority='HIGH', assignee='me')
+        self.assertEqual([ticket_id for page in pages for ticket_id in page], expected[::-1])
+        self.assertTrue(all(len(page) <= 2 for page in pages))
+
+        pages = self.walk(status='OPEN', priority='HIGH', assignee=str(self.agent.id))
+        self.assertEqual([ticket_id for page in pages for ticket_id in page], expected[::-1])
+
+        pages = self.walk(assignee='none')
+        self.assertEqual(pages, [[unassigned.id]])
+
+    @mock.patch.object(AgentTicketListView, 'page_size', 2)
+    def test_json_shape(self):
+        for i in range(3):
+            Ticket.objects.create(title=f'Ticket {i}', description='Help', creator=self.customer)
+
+        first = self.client.get(reverse('agent_tickets')).json()
+        self.assertEqual(set(first), {'html', 'count', 'next_cursor'})
+        self.assertEqual(first['count'], 2)
+        self.assertIsInstance(first['next_cursor'], str)
+        self.assertEqual(first['html'].count('class="conversation"'), 2)
+
+        last = self.client.get(reverse('agent_tickets'), {'cursor': first['next_cursor']}).json()
+        self.assertEqual(last['count'], 1)
+        self.assertIsNone(last['next_cursor'])
+
+
+class ChatHistoryTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        self.customer = User.objects.create_user('customer')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        self.messages = [
+            Message.objects.create(user=self.customer, ticket=self.ticket, msg=f'Message {i}')
+            for i in range(7)
+        ]
+        self.client.force_login(self.customer)
+
+    def test_chat_view_renders_latest_page(self):
+        response = self.client.get(reverse('chat', args=[self.ticket.id]))
+        self.assertEqual(len(response.context['messages']), 7)
+        self.assertFalse(response.context['has_older'])
+        self.assertEqual(response.context['messages'][-1].id, self.messages[-1].id)
+
+    def test_history_pages_backwards(self):
+        url = reverse('chat_history', args=[self.ticket.id])
+        data = self.client.get(url, {'before': self.messages[5].id}).json()
+        self.assertEqual([m['id'] for m in data['messages']], [m.id for m in self.messages[:5]])
+        self.assertFalse(data['has_more'])
+
+    def test_history_rejects_other_users(self):
+        self.client.force_login(User.objects.create_user('stranger'))
+        response = self.client.get(reverse('chat_history', args=[self.ticket.id]))
+        self.assertEqual(response.status_code, 403)
+
+
+# Consumers close stale database connections between events, which would
+# break the surrounding transaction of a TestCase on PostgreSQL
+class ChatConsumerTests(TransactionTestCase):
+    def setUp(self):
+        roles.invalidate()
+        self.customer = User.objects.create_user('customer')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/chat/{self.ticket.id}/'
+        )
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    # Consumer queries stay on this thread so they can be captured; the
+    # notification fan-out is only queued
+    @override_settings(DB_THREADS=0, TASK_MODE='worker')
+    def test_message_is_one_insert(self):
+        async def chat(queries):
+            communicator, connected = await self.connect(self.customer)
+            self.assertTrue(connected)
+            after_connect = len(queries)
+
+            await communicator.send_json_to({'message': 'Hello'})
+            event = await communicator.receive_json_from()
+            message_queries = queries.captured_queries[after_connect:]
+            await communicator.disconnect()
+            return event, message_queries
+
+        # The real connection object, not the thread-local proxy, so queries
+        # made on the test's connection are visible from the event loop
+        with CaptureQueriesContext(connections['default']) as queries:
+            event, message_queries = async_to_sync(chat)(queries)
+
+        self.assertEqual(event['message'], 'Hello')
+        self.assertEqual(event['username'], 'customer')
+        # One INSERT for the message and no re-fetch of the ticket; the rest
+        # is its counters and queuing the notifications
+        message_sql = [q['sql'] for q in message_queries if '"ticket_message"' in q['sql']]
+        self.assertEqual([sql.split()[0] for sql in message_sql], ['INSERT'])
+        self.assertFalse([q for q in message_queries if 'FROM "ticket_ticket"' in q['sql']])
+        self.assertTrue(Message.objects.filter(id=event['id'], ticket_id=self.ticket.id).exists())
+
+    @override_settings(CHAT_WRITE_BEHIND=True)
+    def test_write_behind_broadcasts_then_saves(self):
+        async def chat():
+            communicator, _ = await self.connect(self.customer)
+            await communicator.send_json_to({'message': 'Hello'})
+            provisional = await communicator.receive_json_from()
+            saved = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return provisional, saved
+
+        provisional, saved = async_to_sync(chat)()
+
+        self.assertTrue(provisional['id'].startswith('tmp-'))
+        self.assertEqual(saved['type'], 'saved')
+        self.assertEqual(saved['messages'][0]['provisional_id'], provisional['id'])
+        message = Message.objects.get(id=saved['messages'][0]['id'])
+        self.assertEqual(message.msg, 'Hello')
+
+    @override_settings(DB_THREADS=0)
+    def test_bad_buffered_message_does_not_hold_back_the_batch(self):
+        gone = Ticket.objects.create(title='Monitor', description='Flickers', creator=self.customer)
+        gone_id = gone.id
+        gone.delete()
+        buffer = MessageWriteBuffer(max_attempts=2)
+
+        async def write():
+            layer = mock.Mock(group_send=mock.AsyncMock())
+            with mock.patch('ticket.message_buffer.get_channel_layer', return_value=layer):
+                ids = [
+                    buffer.add(
+                        Message(user=self.customer, ticket_id=ticket_id, msg=text, created_at=timezone.now()),
+                        f'chat_{ticket_id}'
+                    )
+                    for ticket_id, text in ((self.ticket.id, 'one'), (gone_id, 'lost'), (self.ticket.id, 'two'))
+                ]
+                written = [await buffer.flush()]
+                requeued = len(buffer)
+                written.append(await buffer.flush())
+            return ids, written, requeued, layer.group_send.await_args_list
+
+        ids, written, requeued, sends = async_to_sync(write)()
+
+        # The valid messages are saved at once, the bad one is retried and
+        # then dropped with its room told
+        self.assertEqual(written, [2, 0])
+        self.assertEqual(requeued, 1)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(list(Message.objects.order_by('id').values_list('msg', flat=True)), ['one', 'two'])
+        self.assertEqual(sends[-1].args, (f'chat_{gone_id}', {'type': 'chat_message_failed', 'messages': [ids[1]]}))
+        self.assertEqual(Ticket.objects.get(id=self.ticket.id).message_count, 2)
+
+    async def test_other_users_are_rejected(self):
+        stranger = await User.objects.acreate(username='stranger')
+        communicator, connected = await self.connect(stranger)
+        self.assertFalse(connected)
+
+
+@override_settings(CHAT_TYPING_INTERVAL=0.2, CHAT_PRESENCE_URL='')
+class PresenceTests(TransactionTestCase):
+    def setUp(self):
+        roles.invalidate()
+        agents = Group.objects.create(name=roles.AGENTS)
+        self.customer = User.objects.create_user('customer')
+        self.first = User.objects.create_user('agent-1')
+        self.second = User.objects.create_user('agent-2')
+        agents.user_set.add(self.first, self.second)
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        presence.get_store().rooms.clear()
+        # Three sockets' worth of consumer threads would keep their pooled
+        # connections (see bench_suite)
+        self.addCleanup(bench_suite.release_consumer_connections)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/chat/{self.ticket.id}/'
+        )
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def frames(self, communicator, timeout=0.5):
+        # Everything the socket gets until it goes quiet
+        frames = []
+        while not await communicator.receive_nothing(timeout):
+            frames.append(await communicator.receive_json_from())
+        return frames
+
+    def test_roster_follows_joins_and_leaves(self):
+        async def chat():
+            customer = await self.connect(self.customer)
+            agent = await self.connect(self.first)
+            joined = await self.frames(customer)
+            await agent.disconnect()
+            left = await self.frames(customer)
+            await customer.disconnect()
+            return joined, left
+
+        joined, left = async_to_sync(chat)()
+
+        # Both joins within one interval arrive as one roster
+        self.assertEqual(joined, [{'type': 'presence', 'users': [
+            {'id': self.first.id, 'username': 'agent-1'},
+            {'id': self.customer.id, 'username': 'customer'},
+        ]}])
+        self.assertEqual(left, [{'type': 'presence', 'users': [{'id': self.customer.id, 'username': 'customer'}]}])
+
+    def test_sockets_that_never_joined_do_not_leave(self):
+        async def chat():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), f'/ws/chat/{self.ticket.id}/'
+            )
+            communicator.scope['user'] = self.customer
+            with mock.patch.object(presence, 'join', side_effect=RuntimeError('down')), \
+                    mock.patch.object(presence, 'leave') as leave:
+                await communicator.connect()
+                await communicator.disconnect()
+            return leave.called
+
+        self.assertFalse(async_to_sync(chat)())
+
+    def test_typing_is_throttled_and_coalesced(self):
+        async def chat():
+            customer = await self.connect(self.customer)
+            typist = await self.connect(self.first)
+            watcher = await self.connect(self.second)
+            for communicator in (customer, typist, watcher):
+                await self.frames(communicator)
+
+            with mock.patch.object(presence, 'get_channel_layer', wraps=presence.get_channel_layer) as layer:
+                for _ in range(20):
+                    await customer.send_json_to({'type': 'typing'})
+                    await typist.send_json_to({'type': 'typing'})
+                seen = await self.frames(watcher)
+                own = await self.frames(customer, timeout=0.1)
+            for communicator in (customer, typist, watcher):
+                await communicator.disconnect()
+            return seen, own, layer.call_count
+
+        seen, own, group_sends = async_to_sync(chat)()
+
+        self.assertEqual(group_sends, 1)
+        self.assertEqual(len(seen), 1)
+        self.assertEqual(seen[0]['type'], 'typing')
+        self.assertEqual({user['username'] for user in seen[0]['users']}, {'customer', 'agent-1'})
+        # Nobody is told about their own typing
+        self.assertEqual([frame['users'] for frame in own], [[{'id': self.first.id, 'username': 'agent-1'}]])
+
+    def test_members_expire_without_heartbeat(self):
+        async def check():
+            store = presence.MemoryPresence()
+            self.assertTrue(await store.add('chat_1', '1:customer:a', ttl=60))
+            self.assertFalse(await store.add('chat_1', '1:customer:a', ttl=60))
+            self.assertTrue(await store.add('chat_1', '2:agent:b', ttl=-1))
+            return await store.members('chat_1')
+
+        self.assertEqual(presence.online(async_to_sync(check)()), [{'id': 1, 'username': 'customer'}])
+
+    @skipUnless(TcpFakeServer, 'fakeredis is not installed')
+    def test_redis_store(self):
+        server = TcpFakeServer(('127.0.0.1', 0))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+
+        async def check():
+            store = presence.RedisPresence(f'redis://{host}:{port}/0')
+            self.assertTrue(await store.add('chat_1', '1:customer:a', ttl=60))
+            self.assertFalse(await store.add('chat_1', '1:customer:a', ttl=60))
+            # A member whose heartbeats stopped a while ago
+            await store.client().zadd(store.key('chat_1'), {'2:agent:b': time.time() - 1})
+            await store.add('chat_1', '3:agent:c', ttl=60)
+            await store.remove('chat_1', '3:agent:c')
+            members = await store.members('chat_1')
+            await store.client().aclose()
+            return members
+
+        self.assertEqual(async_to_sync(check)(), ['1:customer:a'])
+
+
+# Presence updates are held back so every frame a test sees is its own, and
+# consumer queries share one thread so SQLite's in-memory database doesn't
+# refuse concurrent writers
+@override_settings(CHAT_TYPING_INTERVAL=60, DB_THREADS=0)
+class BackpressureTests(TransactionTestCase):
+    def setUp(self):
+        roles.invalidate()
+        self.customer = User.objects.create_user('customer')
+        self.other = User.objects.create_user('other')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        self.quiet = Ticket.objects.create(title='Monitor', description='Flickers', creator=self.other)
+
+    async def connect(self, user, ticket=None):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/chat/{(ticket or self.ticket).id}/'
+        )
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    @override_settings(CHAT_SOCKET_RATE=0.01, CHAT_SOCKET_BURST=3)
+    def test_bursts_beyond_the_bucket_are_refused_once(self):
+        async def chat():
+            communicator = await self.connect(self.customer)
+            for i in range(10):
+                await communicator.send_json_to({'message': f'Hello {i}'})
+            frames = [await communicator.receive_json_from(timeout=2) for _ in range(4)]
+            self.assertTrue(await communicator.receive_nothing(timeout=0.3))
+            await communicator.disconnect()
+            return frames
+
+        frames = async_to_sync(chat)()
+
+        self.assertEqual([frame.get('message') for frame in frames[:3]], ['Hello 0', 'Hello 1', 'Hello 2'])
+        self.assertEqual(frames[3]['error'], 'Rate limit exceeded')
+        self.assertGreater(frames[3]['retry_after'], 0)
+        self.assertEqual(Message.objects.filter(ticket=self.ticket).count(), 3)
+
+    @override_settings(CHAT_USER_RATE=0.01, CHAT_USER_BURST=4)
+    def test_user_limit_spans_sockets(self):
+        async def chat():
+            sockets = [await self.connect(self.customer), await self.connect(self.customer)]
+            for communicator in sockets:
+                for i in range(3):
+                    await communicator.send_json_to({'message': f'Hello {i}'})
+                    await communicator.receive_nothing(timeout=0.05)
+            for communicator in sockets:
+                await communicator.disconnect()
+
+        async_to_sync(chat)()
+        self.assertEqual(Message.objects.filter(ticket=self.ticket).count(), 4)
+
+    @override_settings(CHAT_MAX_FRAME_SIZE=100)
+    def test_oversized_frames_close_the_socket(self):
+        async def chat():
+            communicator = await self.connect(self.customer)
+            await communicator.send_json_to({'message': 'x' * 200})
+            return await communicator.receive_output(timeout=2)
+
+        self.assertEqual(async_to_sync(chat)(), {'type': 'websocket.close', 'code': 1009})
+        self.assertFalse(Message.objects.exists())
+
+    def test_lagging_sockets_are_downgraded_then_closed(self):
+        async def chat():
+            communicator = await self.connect(self.customer)
+            layer = get_channel_layer()
+            group = f'chat_{self.ticket.id}'
+            await layer.group_send(group, {
+                'type': 'chat_presence', 'sent_at': time.time() - 5, 'typing': [{'id': 0, 'username': 'x'}],
+            })
+            skipped = await communicator.receive_nothing(timeout=0.3)
+            await layer.group_send(group, {
+                'type': 'chat_message', 'sent_at': time.time() - 60, 'message': 'Old', 'username': 'x',
+            })
+            return skipped, await communicator.receive_output(timeout=2)
+
+        skipped, closed = async_to_sync(chat)()
+        self.assertTrue(skipped)
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': 4008})
+
+    # Slow enough that no token comes back mid-flood to start a second run
+    # of refusals
+    @override_settings(CHAT_SOCKET_RATE=0.01)
+    def test_flood_in_one_room_leaves_other_rooms_flat(self):
+        async def round_trip(communicator, text):
+            started = time.perf_counter()
+            await communicator.send_json_to({'message': text})
+            frame = await communicator.receive_json_from(timeout=5)
+            self.assertEqual(frame['message'], text)
+            return time.perf_counter() - started
+
+        async def chat():
+            flooder = await self.connect(self.customer)
+            bystander = await self.connect(self.other, self.quiet)
+            before = [await round_trip(bystander, f'before {i}') for i in range(5)]
+
+            for i in range(500):
+                await flooder.send_json_to({'message': f'spam {i}'})
+            during = [await round_trip(bystander, f'during {i}') for i in range(5)]
+
+            # The flooder gets its burst, one error, and is then cut off
+            frames = []
+            while True:
+                output = await flooder.receive_output(timeout=10)
+                if output['type'] == 'websocket.close':
+                    break
+                frames.append(json.loads(output['text']))
+            await bystander.disconnect()
+            return before, during, frames, output
+
+        before, during, frames, closed = async_to_sync(chat)()
+
+        self.assertEqual(closed['code'], 4029)
+        self.assertEqual([frame['error'] for frame in frames if 'error' in frame], ['Rate limit exceeded'])
+        self.assertLessEqual(Message.objects.filter(ticket=self.ticket).count(), settings.CHAT_SOCKET_BURST + 1)
+        # Generous bound for shared CI machines; unthrottled, the flood's 500
+        # inserts would compete with the bystander's for the database
+        self.assertLess(max(during), max(before) * 5 + 0.25)
+
+
+class HealthViewTests(TestCase):
+    def test_reports_ok(self):
+        response = self.client.get(reverse('health'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['checks'], {'database': 'ok', 'cache': 'ok'})
+
+    def test_reports_failures(self):
+        with mock.patch('ticket.views.HealthView.check_database', side_effect=RuntimeError('down')):
+            response = self.client.get(reverse('health'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['database'], 'down')
+
+
+class DatabaseThreadTests(SimpleTestCase):
+    def test_consumer_queries_run_on_the_bounded_pool(self):
+        @database_sync_to_async
+        def thread_name():
+            return threading.current_thread().name
+
+        self.assertTrue(async_to_sync(thread_name)().startswith('helpme-db'))
+        self.assertLessEqual(get_executor()._max_workers, settings.DB_THREADS)
+
+    @override_settings(HTTP_THREADS=2)
+    def test_sync_views_are_capped(self):
+        running = []
+        peak = []
+
+        async def get_response(handler, request):
+            running.append(request)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(request)
+
+        handler = BoundedASGIHandler()
+        with mock.patch('django.core.handlers.asgi.ASGIHandler.run_get_response', get_response):
+            async def requests():
+                await asyncio.gather(*(handler.run_get_response(i) for i in range(5)))
+            async_to_sync(requests)()
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(len(peak), 5)
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.customer = User.objects.create_user('customer')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        self.client.force_login(self.customer)
+
+    def start(self, size, file_name='report.pdf'):
+        response = self.client.post(
+            reverse('upload_init', args=[self.ticket.id]), {'file_name': file_name, 'size': size}
+        )
+        return response
+
+    def put_chunk(self, upload_id, offset, data):
+        return self.client.put(
+            reverse('upload_chunk', args=[self.ticket.id, upload_id]), data,
+            content_type='application/octet-stream', headers={'Upload-Offset': str(offset)}
+        )
+
+    def test_upload_resume_and_finalize(self):
+        content = b'x' * 3000 + b'y' * 2000
+        upload_id = self.start(len(content)).json()['upload_id']
+
+        self.assertEqual(self.put_chunk(upload_id, 0, content[:3000]).json()['offset'], 3000)
+        # A retried chunk at a stale offset is refused with the current offset
+        stale = self.put_chunk(upload_id, 0, content[:3000])
+        self.assertEqual(stale.status_code, 409)
+        self.assertEqual(stale.json()['offset'], 3000)
+
+        status = self.client.get(reverse('upload_chunk', args=[self.ticket.id, upload_id])).json()
+        self.assertEqual(status, {'offset': 3000, 'size': len(content)})
+        self.put_chunk(upload_id, 3000, content[3000:])
+
+        response = self.client.post(reverse('upload_finalize', args=[self.ticket.id, upload_id]))
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['sha256'], hashlib.sha256(content).hexdigest())
+
+        message = Message.objects.get(id=data['message_id'])
+        self.assertEqual(message.file_name, 'report.pdf')
+        with message.file.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+
+    def test_oversized_uploads_are_rejected_early(self):
+        self.assertEqual(self.start(11 * 1024 * 1024).status_code, 400)
+
+        upload_id = self.start(10).json()['upload_id']
+        self.assertEqual(self.put_chunk(upload_id, 0, b'z' * 11).status_code, 413)
+
+    def test_finalize_requires_every_byte(self):
+        upload_id = self.start(10).json()['upload_id']
+        self.put_chunk(upload_id, 0, b'z' * 5)
+        response = self.client.post(reverse('upload_finalize', args=[self.ticket.id, upload_id]))
+        self.assertEqual(response.status_code, 409)
+
+    def test_idle_hashes_are_forgotten_and_rebuilt(self):
+        content = b'x' * 3000 + b'y' * 2000
+        upload_id = self.start(len(content)).json()['upload_id']
+        self.put_chunk(upload_id, 0, content[:3000])
+        self.assertIn(uuid.UUID(upload_id), uploads._hashers)
+
+        later = time.monotonic() + uploads.HASHER_TTL + 1
+        with mock.patch('ticket.uploads.time.monotonic', return_value=later):
+            other_id = self.start(10).json()['upload_id']
+            self.put_chunk(other_id, 0, b'z' * 5)
+        self.assertNotIn(uuid.UUID(upload_id), uploads._hashers)
+
+        # Resumed from the part file
+        self.put_chunk(upload_id, 3000, content[3000:])
+        response = self.client.post(reverse('upload_finalize', args=[self.ticket.id, upload_id]))
+        self.assertEqual(response.json()['sha256'], hashlib.sha256(content).hexdigest())
+        self.assertNotIn(uuid.UUID(upload_id), uploads._hashers)
+
+    def test_malformed_content_length_is_rejected(self):
+        response = self.client.post(
+            reverse('file_upload', args=[self.ticket.id]),
+            {'file': ContentFile(b'log line', name='app.log')}, CONTENT_LENGTH='ten'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(previews.Image and previews.pdfium, 'Pillow and pypdfium2 are needed for previews')
+class PreviewTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root, CHAT_PREVIEW_WORKERS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.customer = User.objects.create_user('customer')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        self.client.force_login(self.customer)
+
+    def png(self, size=(2000, 1000)):
+        data = io.BytesIO()
+        previews.Image.new('RGBA', size, (255, 0, 0, 128)).save(data, 'PNG')
+        return ContentFile(data.getvalue(), name='screenshot.png')
+
+    def pdf(self):
+        document = previews.pdfium.PdfDocument.new()
+        document.new_page(612, 792)
+        data = io.BytesIO()
+        document.save(data)
+        document.close()
+        return ContentFile(data.getvalue(), name='invoice.pdf')
+
+    def upload(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('file_upload', args=[self.ticket.id]), {'file': content})
+        return Message.objects.get(id=response.json()['message_id'])
+
+    def thumbnail(self, message):
+        response = self.client.get(message.thumbnail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        return previews.Image.open(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_image_thumbnail_is_bounded(self):
+        message = self.upload(self.png())
+        self.assertEqual(self.thumbnail(message).size, (320, 160))
+
+        history = self.client.get(reverse('chat_history', args=[self.ticket.id])).json()
+        self.assertEqual(history['messages'][0]['thumbnail_url'], message.thumbnail_url)
+
+    def test_pdf_first_page_preview(self):
+        message = self.upload(self.pdf())
+        image = self.thumbnail(message)
+        self.assertEqual(max(image.size), 320)
+        self.assertGreater(image.size[1], image.size[0])
+
+    def test_other_files_have_no_preview(self):
+        message = self.upload(ContentFile(b'plain text', name='notes.txt'))
+        self.assertIsNone(message.thumbnail_url)
+        response = self.client.get(reverse('message_preview', args=[self.ticket.id, message.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_reshared_file_reuses_preview(self):
+        first = self.upload(self.png())
+        with mock.patch('ticket.previews.render_preview') as render:
+            second = self.upload(self.png())
+        render.assert_not_called()
+        self.assertIsNotNone(second.thumbnail_url)
+
+        name = previews.preview_name(first.file.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(content_addressed_storage().exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(content_addressed_storage().exists(name))
+
+    @override_settings(CHAT_PREVIEW_WORKERS=1)
+    def test_rendering_runs_in_process_pool(self):
+        message = Message.objects.create(
+            user=self.customer, ticket=self.ticket, file=self.png(), file_name='screenshot.png'
+        )
+        with mock.patch('ticket.previews.announce') as announce:
+            future = previews.generate(message)
+            future.result(timeout=30)
+            # The done callback may still be running on the executor's thread
+            for _ in range(100):
+                if announce.called:
+                    break
+                threading.Event().wait(0.05)
+        announce.assert_called_once_with(message)
+        self.assertIsNotNone(message.thumbnail_url)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.customer = User.objects.create_user('customer')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+
+    def share(self, name, content):
+        return Message.objects.create(
+            user=self.customer, ticket=self.ticket, file=ContentFile(content, name=name), file_name=name
+        )
+
+    def test_identical_content_is_stored_once(self):
+        first = self.share('screenshot.png', b'same bytes')
+        second = self.share('screenshot (1).png', b'same bytes')
+        other = self.share('other.png', b'other bytes')
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertIn(hashlib.sha256(b'same bytes').hexdigest(), first.file.name)
+        self.assertNotEqual(first.file.name, other.file.name)
+
+    def test_blob_is_deleted_with_last_reference(self):
+        first = self.share('a.pdf', b'pdf bytes')
+        second = self.share('b.pdf', b'pdf bytes')
+        storage = first.file.storage
+        name = first.file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(name))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'blobs are only locked on PostgreSQL')
+class BlobLockTests(TransactionTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.customer = User.objects.create_user('customer')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+
+    def share(self, name):
+        return Message.objects.create(
+            user=self.customer, ticket=self.ticket, file=ContentFile(b'pdf bytes', name=name), file_name=name
+        )
+
+    def test_release_waits_for_an_upload_of_the_same_blob(self):
+        first = self.share('a.pdf')
+        saved, commit = threading.Event(), threading.Event()
+
+        def upload():
+            try:
+                with transaction.atomic():
+                    self.share('b.pdf')
+                    saved.set()
+                    commit.wait(5)
+            finally:
+                connection.close()
+
+        def delete():
+            try:
+                # Not referenced by a committed row yet, but locked by upload()
+                first.delete()
+            finally:
+                connection.close()
+
+        uploader = threading.Thread(target=upload)
+        uploader.start()
+        self.assertTrue(saved.wait(5))
+        deleter = threading.Thread(target=delete)
+        deleter.start()
+        deleter.join(0.3)
+        self.assertTrue(deleter.is_alive())
+
+        commit.set()
+        uploader.join(5)
+        deleter.join(5)
+        self.assertTrue(content_addressed_storage().exists(first.file.name))
+        self.assertEqual(Message.objects.get().file.name, first.file.name)
+
+
+class MessageFileViewTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.customer = User.objects.create_user('customer')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        self.message = Message.objects.create(
+            user=self.customer, ticket=self.ticket,
+            file=ContentFile(b'0123456789', name='notes.txt'), file_name='notes.txt'
+        )
+        self.url = reverse('message_file', args=[self.ticket.id, self.message.id])
+        self.client.force_login(self.customer)
+
+    def test_full_download_and_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('notes.txt', response['Content-Disposition'])
+
+        response = self.client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, headers={'Range': 'bytes=2-5'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-3'})
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=20-'})
+        self.assertEqual(response.status_code, 416)
+
+    def test_files_are_not_gzipped(self):
+        middleware = ['django.middleware.gzip.GZipMiddleware'] + settings.MIDDLEWARE
+        with override_settings(MIDDLEWARE=middleware):
+            response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+            self.assertEqual(response['Content-Length'], '10')
+
+            response = self.client.get(self.url, headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=2-5'})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+            # Other responses are still compressed
+            response = self.client.get(reverse('faq'), headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_access_is_checked(self):
+        self.client.force_login(User.objects.create_user('stranger'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel')
+    def test_hands_off_to_nginx(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.message.file.name)
+
+    def test_ticket_attachments(self):
+        attachment = Attachment.objects.create(ticket=self.ticket, file=ContentFile(b'report', name='report.pdf'))
+        url = reverse('attachment_file', args=[self.ticket.id, attachment.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'report')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+        other = Ticket.objects.create(title='Other', description='Other', creator=self.customer)
+        self.assertEqual(self.client.get(reverse('attachment_file', args=[other.id, attachment.id])).status_code, 404)
+        self.client.force_login(User.objects.create_user('stranger'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class NotificationTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        cache.clear()
+        agents = Group.objects.create(name=roles.AGENTS)
+        self.agent = User.objects.create_user('agent')
+        self.agent.groups.add(agents)
+        self.other_agent = User.objects.create_user('other_agent')
+        self.other_agent.groups.add(agents)
+        self.customer = User.objects.create_user('customer')
+
+    def test_new_ticket_notifies_agents(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        self.assertEqual(
+            set(Notification.objects.filter(ticket=ticket).values_list('recipient_id', flat=True)),
+            {self.agent.id, self.other_agent.id}
+        )
+        self.assertEqual(notifications.unread_count(self.agent), 1)
+
+    def test_unread_counter_is_cached(self):
+        ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        self.assertEqual(notifications.unread_count(self.customer), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.assign.add(self.agent)
+            notifications.message_posted(ticket, self.agent, 'On it')
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_count(self.customer), 1)
+
+        notifications.mark_read(self.customer)
+        with self.assertNumQueries(0):
+            self.assertEqual(notifications.unread_count(self.customer), 0)
+
+    def test_assignment_and_close_notify_watchers(self):
+        ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        ticket.assign.add(self.agent)
+        self.assertTrue(Notification.objects.filter(recipient=self.agent, msg__startswith='You were assigned').exists())
+
+        notifications.ticket_closed(ticket, self.agent)
+        self.assertTrue(Notification.objects.filter(recipient=self.customer, msg__startswith='Ticket closed').exists())
+
+
+@override_settings(DB_THREADS=0)
+class NotificationConsumerTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create_user('customer')
+        ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+        self.notification = Notification.objects.create(recipient=self.customer, ticket=ticket, msg='Hello')
+
+    def test_malformed_mark_read_is_ignored(self):
+        async def session():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/notifications/')
+            communicator.scope['user'] = self.customer
+            await communicator.connect()
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'unread', 'count': 1})
+
+            for payload in ['{"type": "mark_read", "ids": 5}', '{"type": "mark_read", "ids": {"1": 1}}',
+                            '{"type": "mark_read", "ids": "12"}', '[1, 2]']:
+                await communicator.send_to(text_data=payload)
+            # Still connected, and nothing was marked read
+            await communicator.send_json_to({'type': 'ping'})
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'pong'})
+
+            await communicator.send_json_to({'type': 'mark_read', 'ids': [self.notification.id, 'x', None]})
+            self.assertEqual(await communicator.receive_json_from(), {'type': 'unread', 'count': 0})
+            await communicator.disconnect()
+
+        async_to_sync(session)()
+
+
+class UnreadTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        agents = Group.objects.create(name=roles.AGENTS)
+        self.agent = User.objects.create_user('agent')
+        self.agent.groups.add(agents)
+        self.customer = User.objects.create_user('customer')
+        self.tickets = [
+            Ticket.objects.create(title=f'Ticket {i}', description='Help', creator=self.customer)
+            for i in range(3)
+        ]
+
+    def post(self, user, ticket, count=1):
+        return [unread.post_message(user=user, ticket=ticket, msg='Hi') for _ in range(count)]
+
+    def unread_counts(self, url, **params):
+        response = self.client.get(reverse(url), params)
+        self.assertEqual(response.status_code, 200)
+        return [(ticket.id, ticket.unread_count) for ticket in response.context['tickets']]
+
+    def test_posting_maintains_ticket_counters(self):
+        first = self.post(self.customer, self.tickets[0], 2)
+        unread.post_messages([
+            Message(user=self.agent, ticket=self.tickets[0], msg='Reply'),
+            Message(user=self.agent, ticket=self.tickets[1], msg='Reply'),
+        ])
+        counted = {ticket.id: (ticket.message_count, ticket.last_message_at) for ticket in Ticket.objects.all()}
+        self.assertEqual(counted[self.tickets[0].id][0], 3)
+        latest = Message.objects.filter(ticket=self.tickets[0]).latest('id')
+        self.assertEqual(counted[self.tickets[0].id][1], latest.created_at)
+        self.assertGreaterEqual(counted[self.tickets[0].id][1], first[-1].created_at)
+        self.assertEqual(counted[self.tickets[1].id][0], 1)
+        self.assertEqual(counted[self.tickets[2].id], (0, None))
+
+        Ticket.objects.update(message_count=0, last_message_at=None)
+        unread.recount()
+        self.assertEqual(
+            {ticket.id: (ticket.message_count, ticket.last_message_at) for ticket in Ticket.objects.all()},
+            counted
+        )
+
+    def test_reading_the_chat_clears_the_badge(self):
+        ticket = self.tickets[0]
+        self.client.force_login(self.agent)
+        self.client.get(reverse('chat', args=[ticket.id]))
+        self.post(self.customer, ticket, 2)
+        self.assertIn((ticket.id, 2), self.unread_counts('main_agent'))
+
+        self.client.get(reverse('chat', args=[ticket.id]))
+        self.assertIn((ticket.id, 0), self.unread_counts('main_agent'))
+        cursor = TicketReadCursor.objects.get(user=self.agent, ticket=ticket)
+        self.assertEqual(cursor.last_read_message_id, Message.objects.latest('id').id)
+
+    def test_own_messages_are_not_unread(self):
+        ticket = self.tickets[1]
+        self.client.force_login(self.customer)
+        self.client.get(reverse('chat', args=[ticket.id]))
+        self.post(self.customer, ticket)
+        self.post(self.agent, self.tickets[2], 2)
+        # Replies waiting for the customer come first
+        self.assertEqual(self.unread_counts('main_user')[:2], [(self.tickets[2].id, 2), (ticket.id, 0)])
+
+    def test_agent_queue_sorts_by_latest_message(self):
+        for ticket in (self.tickets[1], self.tickets[0], self.tickets[2], self.tickets[1]):
+            self.post(self.customer, ticket)
+        self.client.force_login(self.agent)
+        with mock.patch('ticket.views.AgentView.page_size', 2):
+            response = self.client.get(reverse('main_agent'), {'sort': 'activity'})
+            page = self.client.get(reverse('agent_tickets'), {
+                'sort': 'activity', 'cursor': response.context['next_cursor']
+            }).json()
+        self.assertEqual(
+            [ticket.id for ticket in response.context['tickets']],
+            [self.tickets[1].id, self.tickets[2].id]
+        )
+        self.assertEqual(page['count'], 1)
+        self.assertIn(f'data-id="{self.tickets[0].id}"', page['html'])
+
+
+class AssignmentTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        cache.clear()
+        agents = Group.objects.create(name=roles.AGENTS)
+        self.first = User.objects.create_user('first')
+        self.second = User.objects.create_user('second')
+        agents.user_set.add(self.first, self.second)
+        self.customer = User.objects.create_user('customer')
+        self.client.force_login(self.customer)
+
+    def create(self, priority='MEDIUM'):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_ticket'), {
+                'title': 'Printer', 'description': 'Broken', 'priority': priority
+            })
+        return Ticket.objects.latest('id')
+
+    def assignees(self, ticket):
+        return list(ticket.assign.values_list('username', flat=True))
+
+    def test_new_tickets_are_spread_round_robin(self):
+        owners = [self.assignees(self.create())[0] for _ in range(4)]
+        self.assertEqual(sorted(owners), ['first', 'first', 'second', 'second'])
+        self.assertNotEqual(owners[0], owners[1])
+        self.assertEqual(assignment.loads([self.first.id, self.second.id]), {self.first.id: 4, self.second.id: 4})
+
+    def test_priority_counts_towards_load(self):
+        high = Ticket.objects.create(title='Outage', description='Down', creator=self.customer, priority='HIGH')
+        low = [Ticket.objects.create(title='Typo', description='Minor', creator=self.customer, priority='LOW')
+               for _ in range(2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            high.assign.add(self.first)
+            self.second.assigned_tickets.add(*low)
+        # 3 for one high-priority ticket beats 2 for two low ones
+        self.assertEqual(self.assignees(self.create()), ['second'])
+
+    def test_counters_follow_changes_without_counting_rows(self):
+        ticket = self.create('HIGH')
+        agent = ticket.assign.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(assignment.loads([agent.id]), {agent.id: 3})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.priority = Ticket.Priority.LOW
+            ticket.save()
+        self.assertEqual(assignment.loads([agent.id]), {agent.id: 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.status = Ticket.Status.CLOSED
+            ticket.save()
+        self.assertEqual(assignment.loads([agent.id]), {agent.id: 0})
+
+        another = self.create()
+        owner = another.assign.get()
+        self.assertEqual(assignment.loads([owner.id]), {owner.id: 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            another.assign.clear()
+        self.assertEqual(assignment.loads([owner.id]), {owner.id: 0})
+
+    def test_cold_counters_are_rebuilt_from_the_database(self):
+        for _ in range(3):
+            self.create()
+        expected = assignment.loads([self.first.id, self.second.id])
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(assignment.loads([self.first.id, self.second.id]), expected)
+
+    def test_assigned_to_me_lists_only_own_tickets(self):
+        tickets = [self.create() for _ in range(4)]
+        self.client.force_login(self.first)
+        response = self.client.get(reverse('agent_mine'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['mine'])
+        own = {ticket.id for ticket in tickets if self.first in ticket.assign.all()}
+        self.assertEqual({ticket.id for ticket in response.context['tickets']}, own)
+        self.assertEqual(len(own), 2)
+
+
+class DashboardConsumerTests(TransactionTestCase):
+    def setUp(self):
+        roles.invalidate()
+        agents = Group.objects.create(name=roles.AGENTS)
+        self.agent = User.objects.create_user('agent')
+        self.agent.groups.add(agents)
+        self.customer = User.objects.create_user('customer')
+        self.ticket = Ticket.objects.create(title='Printer', description='Broken', creator=self.customer)
+
+    def save_ticket(self, *statuses):
+        for status in statuses:
+            self.ticket.status = status
+            self.ticket.save()
+
+    def test_changes_are_coalesced_into_one_diff(self):
+        async def watch():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/dashboard/')
+            communicator.scope['user'] = self.agent
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            await sync_to_async(self.save_ticket)(Ticket.Status.IN_PROGRESS, Ticket.Status.CLOSED)
+            frame = await communicator.receive_json_from(timeout=2)
+            self.assertTrue(await communicator.receive_nothing(timeout=0.6))
+
+            # Saving again without changes produces no frame at all
+            await sync_to_async(self.save_ticket)(Ticket.Status.CLOSED)
+            self.assertTrue(await communicator.receive_nothing(timeout=0.8))
+            await communicator.disconnect()
+            return frame
+
+        frame = async_to_sync(watch)()
+        self.assertEqual(frame['type'], 'tickets')
+        self.assertEqual(len(frame['changes']), 1)
+        self.assertEqual(frame['changes'][0]['status'], Ticket.Status.CLOSED)
+
+    def test_customers_cannot_subscribe(self):
+        async def watch():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/dashboard/')
+            communicator.scope['user'] = self.customer
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(async_to_sync(watch)())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        cache.clear()
+        agents = Group.objects.create(name=roles.AGENTS)
+        self.agent = User.objects.create_user('agent', password='pw')
+        self.agent.groups.add(agents)
+        self.customer = User.objects.create_user('customer', password='pw')
+        other = User.objects.create_user('other')
+        self.ticket = Ticket.objects.create(title='Printer jam', description='Paper stuck in tray 2', creator=self.customer)
+        self.hidden = Ticket.objects.create(title='Printer offline', description='No network', creator=other)
+        Message.objects.create(ticket=self.ticket, user=self.customer, msg='The <b>printer</b> beeps twice')
+        FAQ.objects.create(question='How do I reset my password?', answer='Use the profile page.', creator=self.agent)
+
+    def search(self, user, **params):
+        self.client.force_login(user)
+        return self.client.get(reverse('search'), params)
+
+    def test_agents_search_all_tickets(self):
+        response = self.search(self.agent, q='printer')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({r['id'] for r in response.json()['results']}, {self.ticket.id, self.hidden.id})
+
+    def test_customers_only_find_their_own_tickets(self):
+        response = self.search(self.customer, q='printer')
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.ticket.id])
+
+        response = self.search(self.customer, q='network')
+        self.assertEqual(response.json()['results'], [])
+
+    def test_message_headlines_are_escaped(self):
+        response = self.search(self.customer, q='printer beeps', type='messages')
+        result, = response.json()['results']
+        self.assertEqual(result['ticket_id'], self.ticket.id)
+        self.assertIn('<mark>printer</mark>', result['headline'])
+        self.assertIn('<mark>beeps</mark>', result['headline'])
+        self.assertNotIn('<b>', result['headline'])
+
+    def test_faq_search_and_pagination(self):
+        response = self.search(self.customer, q='password', type='faqs')
+        data = response.json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertIsNone(data['next_page'])
+
+    def test_fallback_search_without_postgres(self):
+        with mock.patch.object(search, 'uses_postgres', return_value=False):
+            response = self.search(self.customer, q='printer beeps', type='messages')
+            self.assertEqual(
+                response.json()['results'][0]['headline'],
+                'The &lt;b&gt;<mark>printer</mark>&lt;/b&gt; <mark>beeps</mark> twice'
+            )
+            response = self.search(self.customer, q='printer')
+            self.assertEqual([r['id'] for r in response.json()['results']], [self.ticket.id])
+
+    def test_highlight(self):
+        self.assertEqual(
+            search.highlight('Fish & <i>Chips</i>', ['chips']),
+            'Fish &amp; &lt;i&gt;<mark>Chips</mark>&lt;/i&gt;'
+        )
+        # A window around the first hit, with ellipses where text was cut
+        text = 'a' * 100 + ' printer ' + 'b' * 200
+        marked = search.highlight(text, ['printer'], width=40)
+        self.assertTrue(marked.startswith('…'))
+        self.assertTrue(marked.endswith('…'))
+        self.assertIn('<mark>printer</mark>', marked)
+        self.assertEqual(search.highlight('<b>', []), '&lt;b&gt;')
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.search(self.agent, q='').status_code, 400)
+        self.assertEqual(self.search(self.agent, q='printer', type='users').status_code, 400)
+        self.assertEqual(self.search(self.agent, q='printer', page='0').status_code, 400)
+
+
+class FAQCacheTests(TestCase):
+    def setUp(self):
+        roles.invalidate()
+        cache.clear()
+        self.agent = User.objects.create_user('agent')
+        self.customer = User.objects.create_user('customer')
+        self.faq = FAQ.objects.create(question='How do I reset my password?', answer='Use the profile page.', creator=self.agent)
+        self.client.force_login(self.customer)
+
+    def faq_queries(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, headers=headers)
+        return response, [q['sql'] for q in ctx.captured_queries if 'ticket_faq' in q['sql']]
+
+    def test_pages_are_served_from_cache(self):
+        for url in (reverse('faq'), reverse('faq_details', args=[self.faq.id])):
+            response, queries = self.faq_queries(url)
+            self.assertContains(response, 'How do I reset my password?')
+            response, queries = self.faq_queries(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(queries, [])
+
+    def test_conditional_requests_get_304(self):
+        # The first visit sets the CSRF cookie, which is part of the ETag
+        self.client.get(reverse('faq'))
+        response = self.client.get(reverse('faq'))
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(reverse('faq'), headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_the_cache(self):
+        etag = self.client.get(reverse('faq'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            FAQ.objects.create(question='Where are invoices?', answer='Billing tab.', category='ACCOUNT', creator=self.agent)
+
+        response = self.client.get(reverse('faq'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Where are invoices?')
+
+        url = reverse('faq_details', args=[self.faq.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq.delete()
+        response = self.client.get(url)
+        self.assertRedirects(response, reverse('faq'))
+
+
+class FAQSuggestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user('agent')
+        self.customer = User.objects.create_user('customer')
+        self.password = FAQ.objects.create(question='How do I reset my password?', answer='Use the link on the login page.', creator=self.agent)
+        self.invoice = FAQ.objects.create(question='Where can I download invoices?', answer='Invoices are under Billing.', creator=self.agent)
+        self.client.force_login(self.customer)
+
+    def suggest(self, q, **params):
+        return self.client.get(reverse('faq_suggest'), {'q': q, **params})
+
+    def test_best_match_comes_first(self):
+        response = self.suggest('cannot login, forgot my passwords')
+        suggestions = response.json()['suggestions']
+        self.assertEqual(suggestions[0]['id'], self.password.id)
+        self.assertEqual(suggestions[0]['url'], reverse('faq_details', args=[self.password.id]))
+
+    def test_last_word_is_prefix_matched(self):
+        suggestions = self.suggest('need my invo').json()['suggestions']
+        self.assertEqual([s['id'] for s in suggestions], [self.invoice.id])
+        # A finished word is not expanded
+        self.assertEqual(self.suggest('need my invo ').json()['suggestions'], [])
+
+    def test_index_follows_faq_changes(self):
+        self.assertEqual(self.suggest('refund').json()['suggestions'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.answer = 'Invoices and refunds are under Billing.'
+            self.invoice.save()
+        self.assertEqual([s['id'] for s in self.suggest('refund').json()['suggestions']], [self.invoice.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.delete()
+        self.assertEqual(self.suggest('refund').json()['suggestions'], [])
+
+    def test_incremental_update_only_touches_changed_faqs(self):
+        index = faq_suggest.SuggestionIndex()
+        faqs = {
+            1: {'question': 'Reset password', 'answer': 'Use the link.', 'category_display': 'Account'},
+            2: {'question': 'Download invoices', 'answer': 'Billing tab.', 'category_display': 'Account'},
+        }
+        index.apply(faqs)
+        untouched = index.doc_terms[2]
+        index.apply({**faqs, 1: {**faqs[1], 'answer': 'Ask support.'}})
+        self.assertIs(index.doc_terms[2], untouched)
+        self.assertEqual([faq_id for score, faq_id in index.query('support')], [1])
+
+    def test_invalid_limit(self):
+        self.assertEqual(self.suggest('password', limit='0').status_code, 400)
+        self.assertEqual(self.suggest('password', limit='50').status_code, 400)
+
+
+PROD_SETTINGS = dict(
+    HELPME_ENV='prod',
+    DEBUG=False,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/0'}},
+    DB_ENGINE='postgresql',
+    DB_CONNECTION_MODE='pool',
+    TASK_MODE='thread',
+    CHAT_PRESENCE_URL='redis://localhost:6379/0',
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'ticket.storage.CompressedManifestStaticFilesStorage'},
+    },
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer'}},
+    MEDIA_SERVE_MODE='x-accel',
+    METRICS_TOKEN='secret',
+)
+
+
+class ProductionSettingsTests(SimpleTestCase):
+    @override_settings(**PROD_SETTINGS)
+    def test_production_profile_passes(self):
+        self.assertEqual(production_settings(), [])
+
+    @override_settings(**{
+        **PROD_SETTINGS,
+        'DEBUG': True,
+        'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        'DB_ENGINE': 'sqlite',
+        'DB_CONNECTION_MODE': 'per-request',
+        'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+        'TASK_MODE': 'inline',
+        'CHAT_PRESENCE_URL': '',
+        'METRICS_TOKEN': '',
+    })
+    def test_slow_settings_are_errors(self):
+        ids = {error.id for error in production_settings() if error.is_serious()}
+        self.assertEqual(ids, {
+            'helpme.E001', 'helpme.E002', 'helpme.E003', 'helpme.E006', 'helpme.E007', 'helpme.E008',
+            'helpme.E009', 'helpme.E010',
+        })
+
+    def test_development_is_not_checked(self):
+        self.assertEqual(production_settings(), [])
+
+    def test_static_files_are_precompressed(self):
+        source = tempfile.mkdtemp()
+        target = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        self.addCleanup(shutil.rmtree, target)
+        with open(f'{source}/app.css', 'w') as f:
+            f.write('body { color: black; }\n' * 100)
+
+        with override_settings(STATICFILES_DIRS=[source], STATIC_ROOT=target, **PROD_SETTINGS):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            storage = CompressedManifestStaticFilesStorage()
+            hashed = storage.stored_name('app.css')
+
+        with open(f'{target}/{hashed}', 'rb') as original, gzip.open(f'{target}/{hashed}.gz') as compressed:
+            self.assertEqual(compressed.read(), original.read())
+
+
+completed_tasks = []
+
+
+@tasks.task
+def record_task(value):
+    completed_tasks.append(value)
+
+
+@tasks.task
+def failing_task():
+    raise RuntimeError('still broken')
+
+
+@override_settings(TASK_MODE='worker', TASK_MAX_ATTEMPTS=2, TASK_RETRY_DELAY=60)
+class TaskQueueTests(TransactionTestCase):
+    def setUp(self):
+        completed_tasks.clear()
+
+    def test_tasks_are_queued_with_the_transaction(self):
+        with transaction.atomic():
+            tasks.enqueue(record_task, 'kept')
+        try:
+            with transaction.atomic():
+                tasks.enqueue(record_task, 'rolled back')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(list(Task.objects.values_list('args', flat=True)), [['kept']])
+        self.assertEqual(tasks.drain(), 1)
+        self.assertEqual(completed_tasks, ['kept'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_only_registered_functions_are_queued(self):
+        with self.assertRaises(ValueError):
+            tasks.enqueue(print, 'hello')
+
+    def test_claimed_task_is_leased(self):
+        tasks.enqueue(record_task, 'once')
+        row = tasks.claim()
+        self.assertEqual(row.attempts, 1)
+        # Another worker finds nothing due until the lease runs out
+        self.assertIsNone(tasks.claim())
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(tasks.claim().attempts, 2)
+
+    def test_failures_back_off_then_give_up(self):
+        row = tasks.enqueue(failing_task)
+        self.assertEqual(tasks.drain(), 1)
+        row.refresh_from_db()
+        self.assertEqual(row.attempts, 1)
+        self.assertGreater(row.run_at, timezone.now() + timedelta(seconds=50))
+        self.assertIn('still broken', row.last_error)
+        self.assertEqual(tasks.drain(), 0)
+
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(tasks.drain(), 1)
+        row.refresh_from_db()
+        self.assertTrue(row.failed)
+        self.assertEqual(row.attempts, 2)
+
+    def test_runner_threads_drain_the_queue(self):
+        for i in range(5):
+            tasks.enqueue(record_task, i)
+        runner = tasks.TaskRunner(threads=2, poll_interval=0.05)
+        runner.wake()
+        try:
+            for _ in range(100):
+                if not Task.objects.exists():
+                    break
+                threading.Event().wait(0.05)
+        finally:
+            runner.stop(timeout=5)
+        self.assertEqual(sorted(completed_tasks), [0, 1, 2, 3, 4])
+
+    def test_file_upload_queues_the_follow_up(self):
+        customer = User.objects.create_user('customer')
+        ticket = Ticket.objects.create(title='Printer', description='Broken', creator=customer)
+        self.assertEqual(tasks.drain(), 1)  # its ticket_created notification
+        self.client.force_login(customer)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post(reverse('file_upload', args=[ticket.id]), {
+                'file': ContentFile(b'log line', name='app.log')
+            })
+            message_id = response.json()['message_id']
+            self.assertEqual(
+                list(Task.objects.order_by('id').values_list('name', 'args')),
+                [
+                    (tasks.task_name(jobs.file_shared), [message_id]),
+                    (tasks.task_name(jobs.file_notification), [message_id]),
+                    (tasks.task_name(jobs.file_preview), [message_id]),
+                ]
+            )
+            self.assertEqual(tasks.drain(), 3)
+        self.assertFalse(Task.objects.exists())
+
+    def test_file_share_steps_retry_separately(self):
+        customer = User.objects.create_user('customer')
+        ticket = Ticket.objects.create(title='Printer', description='Broken', creator=customer)
+        self.assertEqual(tasks.drain(), 1)
+        message = Message.objects.create(ticket=ticket, user=customer, msg='📎 app.log')
+        tasks.enqueue(jobs.file_shared, message.id)
+        tasks.enqueue(jobs.file_notification, message.id)
+
+        with mock.patch('ticket.notifications.message_posted', side_effect=RuntimeError('down')), \
+                mock.patch('ticket.jobs.get_channel_layer') as layer:
+            layer.return_value.group_send = mock.AsyncMock()
+            self.assertEqual(tasks.drain(), 2)
+            Task.objects.update(run_at=timezone.now())
+            self.assertEqual(tasks.drain(), 1)
+        # The broadcast went out once; only the notification was retried
+        self.assertEqual(layer.return_value.group_send.await_count, 1)
+        self.assertEqual(Task.objects.get().attempts, 2)
+
+    def test_ticket_notifications_are_queued(self):
+        roles.invalidate()
+        agent = User.objects.create_user('agent')
+        agent.groups.add(Group.objects.create(name=roles.AGENTS))
+        customer = User.objects.create_user('customer')
+
+        ticket = Ticket.objects.create(title='Printer', description='Broken', creator=customer)
+        self.assertEqual(
+            list(Task.objects.values_list('name', 'args')),
+            [(tasks.task_name(jobs.ticket_created), [ticket.id])]
+        )
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(tasks.drain(), 1)
+        self.assertTrue(Notification.objects.filter(recipient=agent, msg='New ticket: Printer').exists())
+
+        self.client.force_login(agent)
+        self.client.post(reverse('close_ticket', args=[ticket.id]))
+        self.assertEqual(
+            list(Task.objects.values_list('name', 'args')),
+            [(tasks.task_name(jobs.ticket_closed), [ticket.id, agent.id])]
+        )
+        self.assertFalse(Notification.objects.filter(recipient=customer).exists())
+        self.assertEqual(tasks.drain(), 1)
+        self.assertTrue(Notification.objects.filter(recipient=customer, msg='Ticket closed: Printer').exists())
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTests(TransactionTestCase):
+    def setUp(self):
+        roles.invalidate()
+        cache.clear()
+        self.user = User.objects.create_user('customer')
+        self.client.force_login(self.user)
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), headers={'authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def sample(self, text, prefix):
+        for line in text.splitlines():
+            if line.startswith(prefix):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_views_are_timed_with_queries_and_cache_lookups(self):
+        before = self.scrape()
+        self.client.get(reverse('faq'))
+        after = self.scrape()
+
+        count = 'helpme_http_request_duration_seconds_count{view="faq",method="GET",status="200"}'
+        self.assertEqual(self.sample(after, count) - self.sample(before, count), 1)
+        self.assertGreater(self.sample(after, 'helpme_http_db_queries_sum{view="faq"}'), 0)
+        hits = 'helpme_http_cache_lookups_total{view="faq",result="hit"}'
+        misses = 'helpme_http_cache_lookups_total{view="faq",result="miss"}'
+        self.assertGreater(self.sample(after, hits) + self.sample(after, misses), 0)
+
+    def test_consumer_events_are_timed(self):
+        async def ping():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/notifications/')
+            communicator.scope['user'] = self.user
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.send_json_to({'type': 'ping'})
+            await communicator.receive_json_from()
+            await communicator.disconnect()
+
+        async_to_sync(ping)()
+        text = self.scrape()
+        self.assertGreater(self.sample(
+            text, 'helpme_ws_event_duration_seconds_count{consumer="NotificationConsumer",event="websocket.receive"}'
+        ), 0)
+
+    def test_access_control(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), headers={'authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 403)
+        self.scrape()
+
+        # Off without a token, even from loopback (which is also where a
+        # local reverse proxy's requests come from)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 404)
+
+    def test_histogram_format(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', ('view',), buckets=(0.1, 1))
+        metrics.REGISTRY.remove(histogram)
+        histogram.observe(0.05, view='a')
+        histogram.observe(0.5, view='a')
+        histogram.observe(5, view='a')
+        self.assertEqual(list(histogram.samples()), [
+            'test_seconds_bucket{view="a",le="0.1"} 1',
+            'test_seconds_bucket{view="a",le="1"} 2',
+            'test_seconds_bucket{view="a",le="+Inf"} 3',
+            'test_seconds_sum{view="a"} 5.55',
+            'test_seconds_count{view="a"} 3',
+        ])
+
+
+class BenchmarkSuiteTests(TransactionTestCase):
+    counts = {'orgs': 2, 'customers': 5, 'agents': 2, 'tickets': 10, 'messages': 60, 'faqs': 5}
+    # SQLite's shared-cache test database refuses concurrent writers outright
+    # ("database table is locked") instead of waiting for them
+    params = {
+        'requests': 4, 'concurrency': 1 if connection.vendor == 'sqlite' else 2,
+        'sockets': 3, 'messages': 2, 'uploads': 1,
+    }
+
+    def setUp(self):
+        roles.invalidate()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_seed_is_deterministic(self):
+        seed_bench_data.seed(self.counts)
+        self.assertEqual(seed_bench_data.seeded_tickets().count(), 10)
+        self.assertEqual(Message.objects.count(), 60)
+        self.assertEqual(User.objects.filter(groups__name=roles.AGENTS).count(), 2)
+        first = list(Message.objects.order_by('id').values_list('ticket__title', 'msg'))
+
+        seed_bench_data.flush()
+        self.assertFalse(seed_bench_data.seeded_users().exists())
+        self.assertEqual(Message.objects.count(), 0)
+        seed_bench_data.seed(self.counts)
+        self.assertEqual(list(Message.objects.order_by('id').values_list('ticket__title', 'msg')), first)
+
+    def test_scenarios_report_latency_and_queries(self):
+        seed_bench_data.seed(self.counts)
+        results = bench_suite.Command().run(bench_suite.SCENARIOS, self.params)
+
+        self.assertEqual(set(results), set(bench_suite.SCENARIOS))
+        for name, result in results.items():
+            self.assertGreater(result['ops'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'], name)
+            self.assertGreater(result['queries'], 0, name)
+        # The throwaway chat room and everything posted to it is gone
+        self.assertEqual(seed_bench_data.seeded_tickets().count(), 10)
+        self.assertEqual(Message.objects.count(), 60)
+
+    def test_regressions_against_baseline(self):
+        baseline = {'http_faq': {'throughput': 100, 'p99_ms': 10, 'queries': 2}}
+        same = {'http_faq': {'throughput': 80, 'p99_ms': 12, 'queries': 2}}
+        self.assertEqual(bench_suite.compare(same, baseline, 0.25), ([], []))
+
+        worse = {'http_faq': {'throughput': 50, 'p99_ms': 20, 'queries': 3}, 'ws_connect': {}}
+        regressions, drift = bench_suite.compare(worse, baseline, 0.25)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('3 queries/op', regressions[0])
+        self.assertEqual(len(drift), 2)
+
+
+class RoleCacheTests(TestCase):
+    def setUp(self):
+        # Primary keys are reused between tests, so start from a cold cache
+        roles.invalidate()
+        self.agents = Group.objects.create(name=roles.AGENTS)
+        self.user = User.objects.create_user('user')
+
+    def test_roles_are_cached_across_requests(self):
+        self.assertFalse(roles.is_agent(self.user))
+        fresh = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(roles.is_agent(fresh))
+            self.assertFalse(roles.is_admin(fresh))
+
+    def test_group_changes_invalidate_cache(self):
+        self.assertFalse(roles.is_agent(self.user))
+        self.user.groups.add(self.agents)
+        self.assertTrue(roles.is_agent(User.objects.get(pk=self.user.pk)))
+
+        self.agents.user_set.remove(self.user)
+        self.assertFalse(roles.is_agent(User.objects.get(pk=self.user.pk)))
+
+
+@skipUnless(TcpFakeServer, 'fakeredis is not installed')
+class RedisChannelLayerFanoutTests(SimpleTestCase):
+    # Each receiver runs in its own process with its own channel layer, the
+    # way separate Daphne workers would.
+    receivers = 3
+    messages = 200
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servers = []
+        for _ in range(2):
+            server = TcpFakeServer(('127.0.0.1', 0))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cls.servers.append(server)
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.shutdown()
+        super().tearDownClass()
+
+    def redis_url(self, server):
+        host, port = server.server_address
+        return f'redis://{host}:{port}/0'
+
+    def assertFanout(self, mode, redis_urls):
+        reports = run_fanout(mode, redis_urls, receivers=self.receivers, messages=self.messages)
+        self.assertEqual(len(reports), self.receivers)
+        self.assertEqual(len({pid for pid, _, _ in reports}), self.receivers)
+        for _, received, _ in reports:
+            self.assertEqual(received, self.messages)
+
+    def test_pubsub_fanout_across_processes(self):
+        self.assertFanout('redis', self.redis_url(self.servers[0]))
+
+    @skipUnless(lupa, 'lupa is not installed')
+    def test_sharded_fanout_across_processes(self):
+        urls = ','.join(self.redis_url(server) for server in self.servers)
+        self.assertFanout('redis-sharded', urls)
@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Message, Ticket, TicketReadCursor
+
+
+# Unread messages per (user, ticket) without counting Message rows.
+#
+# Ticket.message_count and Ticket.last_message_at are bumped in the same
+# transaction as every message insert. A TicketReadCursor remembers the
+# message_count (and last message id) a user had seen, so the unread count
+# is a subtraction: see TicketQuerySet.with_unread(). Authors have read
+# their own messages, so their cursor moves along with each post.
+
+
+def record_messages(messages):
+    # Call inside the transaction that inserted `messages` (saved, with ids)
+    by_ticket = {}
+    for message in messages:
+        by_ticket.setdefault(message.ticket_id, []).append(message)
+
+    for ticket_id, posted in by_ticket.items():
+        latest = Value(max(message.created_at for message in posted))
+        Ticket.objects.filter(id=ticket_id).update(
+            message_count=F('message_count') + len(posted),
+            last_message_at=Greatest(Coalesce(F('last_message_at'), latest), latest),
+        )
+
+        by_author = {}
+        for message in posted:
+            by_author.setdefault(message.user_id, []).append(message)
+        for user_id, own in by_author.items():
+            TicketReadCursor.objects.filter(user_id=user_id, ticket_id=ticket_id).update(
+                read_count=F('read_count') + len(own),
+                last_read_message_id=Greatest(F('last_read_message_id'), max(message.id or 0 for message in own)),
+            )
+
+
+def post_message(**fields):
+    with transaction.atomic():
+        message = Message.objects.create(**fields)
+        record_messages([message])
+    return message
+
+
+def post_messages(messages):
+    # bulk_create counterpart of post_message (write-behind chat buffer)
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        record_messages(messages)
+    return messages
+
+
+def mark_read(user, ticket_id, read_count=None, last_message_id=None):
+    # Move the user's cursor to the end of the chat. Callers that already
+    # loaded the ticket and its latest message pass them in to save a query.
+    if read_count is None:
+        latest = Message.objects.filter(ticket_id=OuterRef('pk')).order_by('-id').values('id')[:1]
+        read_count, last_message_id = (
+            Ticket.objects.filter(id=ticket_id)
+            .values_list('message_count', Subquery(latest))
+            .get()
+        )
+    TicketReadCursor.objects.bulk_create(
+        [TicketReadCursor(
+            user=user, ticket_id=ticket_id, read_count=read_count, last_read_message_id=last_message_id or 0
+        )],
+        update_conflicts=True,
+        unique_fields=['user', 'ticket'],
+        update_fields=['read_count', 'last_read_message_id', 'updated_at'],
+    )
+
+
+def recount(tickets=None):
+    # Rebuild the denormalized columns from Message, e.g. after bulk loads
+    # that bypassed post_message()
+    tickets = Ticket.objects.all() if tickets is None else tickets
+    messages = Message.objects.filter(ticket=OuterRef('pk')).order_by().values('ticket')
+    return tickets.update(
+        message_count=Coalesce(Subquery(messages.annotate(count=Count('id')).values('count')), 0),
+        last_message_at=Subquery(messages.annotate(last=Max('created_at')).values('last')),
+    )
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+
+
+# Chunked, resumable uploads.
+#
+# A client opens an upload with the final size, sends the file as a series of
+# raw-body chunks at increasing offsets and then finalizes it. Each chunk is
+# streamed straight to a part file in STREAM_BUFFER pieces, so memory use per
+# request is bounded by the buffer no matter how large the file is. SHA-256
+# is computed while streaming; the running hash lives in process memory and
+# is rebuilt from the part file if the upload resumes on another worker.
+# Uploads idle for HASHER_TTL seconds, and the least recently used ones
+# beyond HASHER_CACHE_SIZE, lose their cached hash the same way, so uploads
+# that are abandoned or purged elsewhere do not pile up here.
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_CHUNK_SIZE = 1024 * 1024  # 1MB
+STREAM_BUFFER = 64 * 1024
+HASHER_CACHE_SIZE = 1000
+HASHER_TTL = 60 * 60
+
+_hashers = OrderedDict()  # upload id -> (offset, hasher, last used)
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(upload):
+    directory = Path(settings.MEDIA_ROOT) / 'chunked_uploads'
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f'{upload.id}.part'
+
+
+def _hasher_at(upload, offset):
+    # Running SHA-256 of the first `offset` bytes of the part file
+    with _hashers_lock:
+        entry = _hashers.get(upload.id)
+    if entry and entry[0] == offset:
+        return entry[1]
+
+    hasher = hashlib.sha256()
+    path = part_path(upload)
+    if offset:
+        with open(path, 'rb') as part:
+            remaining = offset
+            while remaining:
+                block = part.read(min(STREAM_BUFFER, remaining))
+                if not block:
+                    raise UploadError('Upload data is missing, restart the upload', status=409)
+                hasher.update(block)
+                remaining -= len(block)
+    return hasher
+
+
+def append_chunk(upload, stream, length):
+    # Caller holds a row lock on `upload` and has checked the offset
+    if length <= 0:
+        raise UploadError('Empty chunk')
+    if length > MAX_CHUNK_SIZE:
+        raise UploadError(f'Chunks are limited to {MAX_CHUNK_SIZE} bytes', status=413)
+    if upload.offset + length > upload.size:
+        raise UploadError('Chunk runs past the declared file size', status=413)
+
+    hasher = _hasher_at(upload, upload.offset).copy()
+    path = part_path(upload)
+    written = 0
+    with open(path, 'r+b' if path.exists() else 'wb') as part:
+        part.seek(upload.offset)
+        part.truncate()
+        while written < length:
+            block = stream.read(min(STREAM_BUFFER, length - written))
+            if not block:
+                break
+            part.write(block)
+            hasher.update(block)
+            written += len(block)
+
+    if written != length:
+        # Drop the partial chunk so the client can retry from the same offset
+        with open(path, 'r+b') as part:
+            part.truncate(upload.offset)
+        raise UploadError('Chunk was shorter than its Content-Length')
+
+    upload.offset += written
+    remember_hasher(upload, hasher)
+    return written
+
+
+def remember_hasher(upload, hasher):
+    now = time.monotonic()
+    with _hashers_lock:
+        _hashers[upload.id] = (upload.offset, hasher, now)
+        _hashers.move_to_end(upload.id)
+        # Oldest first, so expired entries are always at the front
+        while _hashers:
+            oldest = next(iter(_hashers.values()))
+            if len(_hashers) <= HASHER_CACHE_SIZE and now - oldest[2] < HASHER_TTL:
+                break
+            _hashers.popitem(last=False)
+
+
+def finish(upload):
+    # Returns (path, sha256 hex digest) of a fully received upload
+    if upload.offset != upload.size:
+        raise UploadError(f'Upload incomplete: {upload.offset} of {upload.size} bytes received', status=409)
+    digest = _hasher_at(upload, upload.offset).hexdigest()
+    return part_path(upload), digest
+
+
+def discard(upload):
+    with _hashers_lock:
+        _hashers.pop(upload.id, None)
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
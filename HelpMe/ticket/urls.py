@@ -8,10 +8,24 @@ urlpatterns = [
     path('main/', views.MainView.as_view(), name='main_user'),
     path('ticket/create/', views.CreateTicketView.as_view(), name='create_ticket'),
     path('ticket/<int:ticket_id>/chat/', views.ChatView.as_view(), name='chat'),
+    path('ticket/<int:ticket_id>/messages/', views.ChatHistoryView.as_view(), name='chat_history'),
+    path('ticket/<int:ticket_id>/files/<int:message_id>/', views.MessageFileView.as_view(), name='message_file'),
+    path('ticket/<int:ticket_id>/files/<int:message_id>/preview/', views.MessagePreviewView.as_view(), name='message_preview'),
+    path('ticket/<int:ticket_id>/attachments/<int:attachment_id>/', views.AttachmentFileView.as_view(), name='attachment_file'),
     path('ticket/<int:ticket_id>/upload/', views.FileUploadView.as_view(), name='file_upload'),
+    path('ticket/<int:ticket_id>/uploads/', views.UploadInitView.as_view(), name='upload_init'),
+    path('ticket/<int:ticket_id>/uploads/<uuid:upload_id>/', views.UploadChunkView.as_view(), name='upload_chunk'),
+    path('ticket/<int:ticket_id>/uploads/<uuid:upload_id>/finalize/', views.UploadFinalizeView.as_view(), name='upload_finalize'),
     path('agent/', views.AgentView.as_view(), name='main_agent'),
+    path('agent/tickets/', views.AgentTicketListView.as_view(), name='agent_tickets'),
+    path('agent/mine/', views.AssignedTicketView.as_view(), name='agent_mine'),
     path('close_ticket/<int:ticket_id>/', views.CloseTicketView.as_view(), name='close_ticket'),
+    path('notifications/', views.NotificationListView.as_view(), name='notifications'),
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('health/', views.HealthView.as_view(), name='health'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
     path('faq/', views.FAQView.as_view(), name='faq'),
+    path('faq/suggest/', views.FAQSuggestView.as_view(), name='faq_suggest'),
     path('faq/<int:faq_id>/', views.FAQDetailView.as_view(), name='faq_details'),
     path('profile/', views.ProfileView.as_view(), name='profile'),
 ]
@@ -1,16 +1,84 @@
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import connection, transaction
 from django.shortcuts import render, redirect
 from django.views import View
 from django.contrib.auth import login, logout
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from .forms import *
 from .models import *
+from . import assignment, faq_cache, faq_suggest, jobs, metrics, notifications, previews, tasks, unread
+from .media import serve_file
+from .pagination import keyset_page, message_history
+from .roles import AGENTS, can_access_ticket, is_admin, is_agent
+from . import search
+from .serializers import TIMESTAMP_FORMAT, serialize_message
+from .storage import content_addressed_storage
+from .uploads import MAX_CHUNK_SIZE, MAX_UPLOAD_SIZE, UploadError, append_chunk, discard, finish
+
+class HealthView(View):
+    # Liveness/readiness probe for load balancers; no login required
+
+    def check_database(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+
+    def check_cache(self):
+        cache.set('health_check', 1, 10)
+        if cache.get('health_check') != 1:
+            raise RuntimeError('cache did not return the value just written')
+
+    def get(self, request):
+        checks = {}
+        healthy = True
+        for name, check in (('database', self.check_database), ('cache', self.check_cache)):
+            try:
+                check()
+                checks[name] = 'ok'
+            except Exception as e:
+                checks[name] = str(e) or e.__class__.__name__
+                healthy = False
+
+        data = {'status': 'ok' if healthy else 'error', 'checks': checks}
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            stats = pool.get_stats()
+            data['database_pool'] = {
+                'size': stats.get('pool_size', 0),
+                'available': stats.get('pool_available', 0),
+                'waiting': stats.get('requests_waiting', 0),
+            }
+        return JsonResponse(data, status=200 if healthy else 503)
+
+class MetricsView(View):
+    # Prometheus text format; see metrics.py
+
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        if not token:
+            # Off without a token: behind a local proxy every request would
+            # come from loopback
+            return JsonResponse({'error': 'Not found'}, status=404)
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return JsonResponse({'error': 'Access denied'}, status=403)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 class LoginView(View):
     def get(self, request):
         if request.user.is_authenticated:
-            if request.user.groups.filter(name='Agents').exists():
+            if is_agent(request.user):
                 return redirect('main_agent')
             return redirect('main_user')
         form = LoginForm()
@@ -22,7 +90,7 @@ class LoginView(View):
             user = form.get_user()
             login(request, user)
             messages.success(request, 'Successfully logged in!')
-            if user.groups.filter(name='Agents').exists() or user.groups.filter(name='Admin').exists():
+            if is_agent(user) or is_admin(user):
                 return redirect('main_agent')
             return redirect('main_user')
         else:
@@ -55,13 +123,21 @@ class LogoutView(View):
         return redirect('login')
 
 
+def customer_tickets(user):
+    # Tickets with unanswered replies first
+    return (
+        Ticket.objects.for_list().with_unread(user)
+        .filter(creator=user)
+        .order_by('-unread_count', '-created_at')
+    )
+
 class MainView(LoginRequiredMixin, View):
     login_url = 'login'
 
     def get(self, request):
-        if request.user.groups.filter(name='Agents').exists():
+        if is_agent(request.user):
             return redirect('main_agent')
-        tickets = Ticket.objects.filter(creator=request.user).order_by('-created_at')
+        tickets = customer_tickets(request.user)
         form = TicketForm()
         return render(request, 'main_user.html', {
             'tickets': tickets,
@@ -72,16 +148,99 @@ class AgentView(LoginRequiredMixin, UserPassesTestMixin, View):
     login_url = 'login'
 
     def test_func(self):
-        return self.request.user.groups.filter(name='Agents').exists()
+        return is_agent(self.request.user)
 
     def handle_no_permission(self):
         messages.error(self.request, 'Access denied. Agent privileges required.')
         return redirect('login')
 
+    page_size = 25
+    mine = False
+    # Keyset column per sort: newest tickets, or latest message first
+    sort_fields = {'': 'created_at', 'activity': 'last_message_at'}
+
+    def get_filters(self):
+        filters = {
+            'status': self.request.GET.get('status', ''),
+            'priority': self.request.GET.get('priority', ''),
+            'assignee': self.request.GET.get('assignee', ''),
+            'sort': self.request.GET.get('sort', ''),
+        }
+        if filters['status'] not in Ticket.Status.values:
+            filters['status'] = ''
+        if filters['priority'] not in Ticket.Priority.values:
+            filters['priority'] = ''
+        if filters['sort'] not in self.sort_fields:
+            filters['sort'] = ''
+        return filters
+
+    def get_queryset(self, filters):
+        tickets = Ticket.objects.for_list().with_unread(self.request.user)
+        if filters['sort'] == 'activity':
+            # Tickets nobody has written in yet have no place in this order
+            tickets = tickets.filter(last_message_at__isnull=False)
+        if filters['status']:
+            tickets = tickets.filter(status=filters['status'])
+        if filters['priority']:
+            tickets = tickets.filter(priority=filters['priority'])
+
+        assignee = filters['assignee']
+        if assignee == 'me':
+            # Start from the agent's slice of the assignment table
+            # (ticket_assign_user_ticket_idx) rather than the whole queue
+            mine = Ticket.assign.through.objects.filter(user_id=self.request.user.id).values('ticket_id')
+            tickets = tickets.filter(id__in=mine)
+        elif assignee == 'none':
+            tickets = tickets.filter(assign__isnull=True)
+        elif assignee.isdigit():
+            tickets = tickets.filter(assign__id=int(assignee))
+        return tickets
+
     def get(self, request):
-        tickets = Ticket.objects.all().order_by('-created_at')
+        filters = self.get_filters()
+        tickets, next_cursor = keyset_page(
+            self.get_queryset(filters), page_size=self.page_size, field=self.sort_fields[filters['sort']]
+        )
         return render(request, 'main_agent.html', {
-            'tickets': tickets
+            'tickets': tickets,
+            'next_cursor': next_cursor,
+            'filters': filters,
+            'mine': self.mine,
+            'agents': User.objects.filter(groups__name=AGENTS).order_by('username'),
+        })
+
+class AssignedTicketView(AgentView):
+    # "Assigned to me": the agent queue locked to the agent's own tickets
+    mine = True
+
+    def get_filters(self):
+        filters = super().get_filters()
+        filters['assignee'] = 'me'
+        return filters
+
+class AgentTicketListView(AgentView):
+    # JSON endpoint used by the agent queue for infinite scroll
+
+    def handle_no_permission(self):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+
+    def get(self, request):
+        filters = self.get_filters()
+        try:
+            tickets, next_cursor = keyset_page(
+                self.get_queryset(filters),
+                cursor=request.GET.get('cursor'),
+                page_size=self.page_size,
+                field=self.sort_fields[filters['sort']]
+            )
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+        html = render_to_string('_agent_ticket_rows.html', {'tickets': tickets}, request=request)
+        return JsonResponse({
+            'html': html,
+            'count': len(tickets),
+            'next_cursor': next_cursor
         })
 
 class CreateTicketView(LoginRequiredMixin, View):
@@ -92,10 +251,13 @@ class CreateTicketView(LoginRequiredMixin, View):
         if form.is_valid():
             ticket = form.save(commit=False)
             ticket.creator = request.user
-            ticket.save()
+            with transaction.atomic():
+                ticket.save()
+                if settings.TICKET_AUTO_ASSIGN:
+                    assignment.assign(ticket)
             return redirect('chat', ticket_id=ticket.id)
         else:
-            tickets = Ticket.objects.filter(creator=request.user).order_by('-created_at')
+            tickets = customer_tickets(request.user)
             messages.error(request, 'Please correct the errors below.')
             return render(request, 'main_user.html', {
                 'tickets': tickets,
@@ -106,13 +268,15 @@ class CloseTicketView(LoginRequiredMixin, UserPassesTestMixin, View):
     login_url = 'login'
 
     def test_func(self):
-        return self.request.user.groups.filter(name='Agents').exists()
+        return is_agent(self.request.user)
 
     def post(self, request, ticket_id):
         try:
             ticket = Ticket.objects.get(id=ticket_id)
-            ticket.status = 'closed'
-            ticket.save()
+            ticket.status = Ticket.Status.CLOSED
+            # Leave the message counters to concurrent chat inserts
+            ticket.save(update_fields=['status', 'updated_at'])
+            tasks.enqueue(jobs.ticket_closed, ticket.id, request.user.id)
             messages.success(request, 'Ticket has been closed successfully.')
             return redirect('chat', ticket_id=ticket_id)
         except Ticket.DoesNotExist:
@@ -121,35 +285,246 @@ class CloseTicketView(LoginRequiredMixin, UserPassesTestMixin, View):
 
 class ChatView(LoginRequiredMixin, View):
     login_url = 'login'
+    page_size = 50
 
     def get(self, request, ticket_id):
         try:
-            ticket = Ticket.objects.get(id=ticket_id)
-            if not (request.user.groups.filter(name='Agents').exists() or ticket.creator == request.user):
+            ticket = Ticket.objects.with_creator().get(id=ticket_id)
+            if not can_access_ticket(request.user, ticket):
                 messages.error(request, 'Access denied. You do not have permission to view this ticket.')
                 return redirect('main_user')
-            chat_messages = ticket.messages.all().order_by('created_at')
+            chat_messages, has_older = message_history(ticket.id, limit=self.page_size)
+            unread.mark_read(
+                request.user, ticket.id, ticket.message_count,
+                chat_messages[-1].id if chat_messages else None
+            )
             return render(request, 'chat.html', {
                 'ticket': ticket,
-                'messages': chat_messages
+                'messages': chat_messages,
+                'has_older': has_older
             })
         except Ticket.DoesNotExist:
             messages.error(request, 'Ticket not found.')
             return redirect('main_user')
 
+class ChatHistoryView(LoginRequiredMixin, View):
+    login_url = 'login'
+    page_size = 50
+
+    def get(self, request, ticket_id):
+        try:
+            ticket = Ticket.objects.only('id', 'creator_id').get(id=ticket_id)
+        except Ticket.DoesNotExist:
+            return JsonResponse({'error': 'Ticket not found'}, status=404)
+        if not can_access_ticket(request.user, ticket):
+            return JsonResponse({'error': 'Access denied'}, status=403)
+
+        before = request.GET.get('before')
+        if before is not None and not before.isdigit():
+            return JsonResponse({'error': 'Invalid message id'}, status=400)
+
+        chat_messages, has_more = message_history(
+            ticket.id, before=int(before) if before else None, limit=self.page_size
+        )
+        return JsonResponse({
+            'messages': [serialize_message(message) for message in chat_messages],
+            'has_more': has_more
+        })
+
+class MessageFileView(LoginRequiredMixin, View):
+    login_url = 'login'
+    cache_timeout = 300
+
+    def get_file_info(self, ticket_id, message_id):
+        # (ticket, stored name, display name), cached so repeated range
+        # requests from PDF/image viewers don't touch the database; the
+        # ticket only carries what can_access_ticket needs
+        key = f'message_file:{message_id}'
+        info = cache.get(key)
+        if info is None:
+            row = (
+                Message.objects.filter(id=message_id, ticket_id=ticket_id)
+                .exclude(file='')
+                .values_list('ticket__creator_id', 'file', 'file_name')
+                .first()
+            )
+            if row is None:
+                return None
+            info = row
+            cache.set(key, info, self.cache_timeout)
+        creator_id, name, file_name = info
+        return Ticket(id=ticket_id, creator_id=creator_id), name, file_name
+
+    def get(self, request, ticket_id, message_id):
+        info = self.get_file_info(ticket_id, message_id)
+        if info is None:
+            return JsonResponse({'error': 'File not found'}, status=404)
+
+        ticket, name, file_name = info
+        if not can_access_ticket(request.user, ticket):
+            return JsonResponse({'error': 'Access denied'}, status=403)
+
+        storage = content_addressed_storage()
+        if not storage.exists(name):
+            return JsonResponse({'error': 'File not found'}, status=404)
+        return serve_file(request, storage, name, file_name or os.path.basename(name))
+
+class MessagePreviewView(MessageFileView):
+    # Thumbnail of a shared image or PDF (previews.py), same access rules
+
+    def get(self, request, ticket_id, message_id):
+        info = self.get_file_info(ticket_id, message_id)
+        if info is None:
+            return JsonResponse({'error': 'File not found'}, status=404)
+
+        ticket, name, file_name = info
+        if not can_access_ticket(request.user, ticket):
+            return JsonResponse({'error': 'Access denied'}, status=403)
+
+        storage = content_addressed_storage()
+        preview = previews.preview_name(name)
+        if not previews.preview_kind(name) or not storage.exists(preview):
+            return JsonResponse({'error': 'Preview not available'}, status=404)
+        stem = os.path.splitext(file_name or os.path.basename(name))[0]
+        return serve_file(request, storage, preview, f'{stem}.jpg')
+
+class AttachmentFileView(LoginRequiredMixin, View):
+    # Ticket attachments, under the same rules as chat files
+    login_url = 'login'
+
+    def get(self, request, ticket_id, attachment_id):
+        attachment = (
+            Attachment.objects.select_related('ticket')
+            .filter(id=attachment_id, ticket_id=ticket_id)
+            .exclude(file='')
+            .first()
+        )
+        if attachment is None:
+            return JsonResponse({'error': 'File not found'}, status=404)
+        if not can_access_ticket(request.user, attachment.ticket):
+            return JsonResponse({'error': 'Access denied'}, status=403)
+
+        storage = content_addressed_storage()
+        name = attachment.file.name
+        if not storage.exists(name):
+            return JsonResponse({'error': 'File not found'}, status=404)
+        return serve_file(request, storage, name, os.path.basename(name))
+
+class NotificationListView(LoginRequiredMixin, View):
+    login_url = 'login'
+    page_size = 20
+
+    def get(self, request):
+        items = (
+            Notification.objects.filter(recipient=request.user)
+            .values('id', 'ticket_id', 'msg', 'read', 'created_at')[:self.page_size]
+        )
+        return JsonResponse({
+            'notifications': list(items),
+            'unread': notifications.unread_count(request.user)
+        })
+
+    def post(self, request):
+        ids = request.POST.getlist('ids')
+        if ids and not all(i.isdigit() for i in ids):
+            return JsonResponse({'error': 'Invalid notification id'}, status=400)
+        notifications.mark_read(request.user, [int(i) for i in ids] if ids else None)
+        return JsonResponse({'unread': notifications.unread_count(request.user)})
+
+class SearchView(LoginRequiredMixin, View):
+    login_url = 'login'
+    page_size = 20
+    max_pages = 50
+
+    def serialize(self, kind, row):
+        if kind == 'tickets':
+            return {
+                'id': row.id,
+                'title': row.title,
+                'status': row.status,
+                'headline': row.headline,
+                'url': reverse('chat', args=[row.id]),
+            }
+        if kind == 'messages':
+            return {
+                'id': row.id,
+                'ticket_id': row.ticket.id,
+                'ticket_title': row.ticket.title,
+                'headline': row.headline,
+                'timestamp': row.created_at.strftime(TIMESTAMP_FORMAT),
+                'url': reverse('chat', args=[row.ticket.id]),
+            }
+        return {
+            'id': row.id,
+            'question': row.question,
+            'category': row.category,
+            'headline': row.headline,
+            'url': reverse('faq_details', args=[row.id]),
+        }
+
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        kind = request.GET.get('type', 'tickets')
+        page = request.GET.get('page', '1')
+        if not query:
+            return JsonResponse({'error': 'Search query is required'}, status=400)
+        if len(query) > search.MAX_QUERY_LENGTH:
+            return JsonResponse({'error': 'Search query is too long'}, status=400)
+        if not page.isdigit() or not 1 <= int(page) <= self.max_pages:
+            return JsonResponse({'error': 'Invalid page'}, status=400)
+
+        agent = is_agent(request.user)
+        if kind == 'tickets':
+            queryset = search.visible_tickets(request.user, agent).only('id', 'title', 'status', 'description')
+        elif kind == 'messages':
+            queryset = search.visible_messages(request.user, agent)
+        elif kind == 'faqs':
+            queryset = FAQ.objects.only('id', 'question', 'answer', 'category')
+        else:
+            return JsonResponse({'error': 'Invalid search type'}, status=400)
+
+        page = int(page)
+        rows, has_more = search.search(
+            queryset, query, limit=self.page_size, offset=(page - 1) * self.page_size
+        )
+        return JsonResponse({
+            'results': [self.serialize(kind, row) for row in rows],
+            'next_page': page + 1 if has_more and page < self.max_pages else None
+        })
+
+# FAQ pages are built from faq_cache and revalidated with ETag/Last-Modified.
+# The ETag also covers the per-user parts of the page (agent controls, unread
+# badge, CSRF secret); pages carrying flash messages are never conditional.
+
+def faq_etag(request, faq_id=None):
+    if len(messages.get_messages(request)):
+        return None
+    user = request.user
+    return faq_cache.etag(
+        faq_id, user.id, is_agent(user), notifications.unread_count(user),
+        request.META.get('CSRF_COOKIE', '')
+    )
+
+def faq_last_modified(request, faq_id=None):
+    if len(messages.get_messages(request)):
+        return None
+    return faq_cache.last_modified()
+
 class FAQView(LoginRequiredMixin, View):
     login_url = 'login'
 
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=faq_etag, last_modified_func=faq_last_modified))
     def get(self, request):
-        faqs = FAQ.objects.all().order_by('category', '-created_at')
         return render(request, 'FAQ.html', {
-            'faqs': faqs,
-            'is_agent': request.user.groups.filter(name='Agents').exists(),
+            'categories': faq_cache.categories(),
+            'faq_version': faq_cache.version(),
+            'faq_timeout': faq_cache.FAQ_TIMEOUT,
             'category_choices': FAQ.CATEGORY_CHOICES
         })
 
     def post(self, request):
-        if not request.user.groups.filter(name='Agents').exists():
+        if not is_agent(request.user):
             messages.error(request, 'Only agents can create FAQs')
             return redirect('faq')
         
@@ -170,16 +545,34 @@ class FAQView(LoginRequiredMixin, View):
         
         return redirect('faq')
 
+class FAQSuggestView(LoginRequiredMixin, View):
+    login_url = 'login'
+    max_results = 10
+    max_query_length = 2000
+
+    def get(self, request):
+        # `q` is the ticket draft with the field being typed last
+        query = request.GET.get('q', '')[-self.max_query_length:]
+        limit = request.GET.get('limit', '5')
+        if not limit.isdigit() or not 1 <= int(limit) <= self.max_results:
+            return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+        suggestions = faq_suggest.suggest(query, int(limit))
+        for suggestion in suggestions:
+            suggestion['url'] = reverse('faq_details', args=[suggestion['id']])
+        return JsonResponse({'suggestions': suggestions})
+
 class FAQDetailView(LoginRequiredMixin, View):
     login_url = 'login'
 
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=faq_etag, last_modified_func=faq_last_modified))
     def get(self, request, faq_id):
-        try:
-            faq = FAQ.objects.get(id=faq_id)
-            return render(request, 'faq_details.html', {'faq': faq})
-        except FAQ.DoesNotExist:
+        faq = faq_cache.get_faq(faq_id)
+        if faq is None:
             messages.error(request, 'FAQ not found')
             return redirect('faq')
+        return render(request, 'faq_details.html', {'faq': faq})
 
 class ProfileView(LoginRequiredMixin, View):
     login_url = 'login'
@@ -233,50 +626,50 @@ class ProfileView(LoginRequiredMixin, View):
                 'profile_form': profile_form
             })
 
+def create_file_message(user, ticket, file, file_name):
+    # Store a shared file as a chat message. Pushing it to the room,
+    # notifications and its preview are queued as separate jobs, so the
+    # upload returns as soon as the file is written.
+    with transaction.atomic():
+        message = unread.post_message(
+            user=user,
+            ticket=ticket,
+            file=file,
+            file_name=file_name,
+            msg=f"📎 {file_name}"
+        )
+        tasks.enqueue(jobs.file_shared, message.id)
+        tasks.enqueue(jobs.file_notification, message.id)
+        tasks.enqueue(jobs.file_preview, message.id)
+    return message
+
 class FileUploadView(LoginRequiredMixin, View):
     login_url = 'login'
+    # Room for multipart boundaries and headers around the file itself
+    multipart_overhead = 64 * 1024
 
     def post(self, request, ticket_id):
         try:
-            from channels.layers import get_channel_layer
-            from asgiref.sync import async_to_sync
-
             ticket = Ticket.objects.get(id=ticket_id)
             # Check access
-            if not (request.user.groups.filter(name='Agents').exists() or ticket.creator == request.user):
+            if not can_access_ticket(request.user, ticket):
                 return JsonResponse({'error': 'Access denied'}, status=403)
 
+            # Reject oversized bodies before Django parses them
+            content_length = request.META.get('CONTENT_LENGTH') or '0'
+            if not content_length.isdigit():
+                return JsonResponse({'error': 'Invalid Content-Length'}, status=400)
+            if int(content_length) > MAX_UPLOAD_SIZE + self.multipart_overhead:
+                return JsonResponse({'error': 'File size too large. Maximum 10MB allowed.'}, status=400)
+
             uploaded_file = request.FILES.get('file')
             if not uploaded_file:
                 return JsonResponse({'error': 'No file uploaded'}, status=400)
 
-            max_size = 10 * 1024 * 1024  # 10MB
-            if uploaded_file.size > max_size:
+            if uploaded_file.size > MAX_UPLOAD_SIZE:
                 return JsonResponse({'error': 'File size too large. Maximum 10MB allowed.'}, status=400)
 
-            message = Message.objects.create(
-                user=request.user,
-                ticket=ticket,
-                file=uploaded_file,
-                file_name=uploaded_file.name,
-                msg=f"📎 {uploaded_file.name}"
-            )
-
-            channel_layer = get_channel_layer()
-            room_group_name = f'chat_{ticket_id}'
-
-            async_to_sync(channel_layer.group_send)(
-                room_group_name,
-                {
-                    'type': 'chat_message',
-                    'message': f"📎 {uploaded_file.name}",
-                    'username': request.user.username,
-                    'timestamp': message.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    'is_file': True,
-                    'file_name': uploaded_file.name,
-                    'file_url': message.file.url
-                }
-            )
+            message = create_file_message(request.user, ticket, uploaded_file, uploaded_file.name)
 
             return JsonResponse({
                 'success': True,
@@ -288,3 +681,106 @@ class FileUploadView(LoginRequiredMixin, View):
             return JsonResponse({'error': 'Ticket not found'}, status=404)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
+
+class UploadInitView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def post(self, request, ticket_id):
+        try:
+            ticket = Ticket.objects.only('id', 'creator_id').get(id=ticket_id)
+        except Ticket.DoesNotExist:
+            return JsonResponse({'error': 'Ticket not found'}, status=404)
+        if not can_access_ticket(request.user, ticket):
+            return JsonResponse({'error': 'Access denied'}, status=403)
+
+        file_name = os.path.basename(request.POST.get('file_name', '').strip())
+        size = request.POST.get('size', '')
+        if not file_name or not size.isdigit() or int(size) == 0:
+            return JsonResponse({'error': 'file_name and size are required'}, status=400)
+        if int(size) > MAX_UPLOAD_SIZE:
+            return JsonResponse({'error': 'File size too large. Maximum 10MB allowed.'}, status=400)
+
+        upload = ChunkedUpload.objects.create(
+            user=request.user,
+            ticket=ticket,
+            file_name=file_name[:255],
+            size=int(size)
+        )
+        return JsonResponse({
+            'upload_id': str(upload.id),
+            'offset': upload.offset,
+            'chunk_size': MAX_CHUNK_SIZE
+        }, status=201)
+
+class ChunkedUploadMixin:
+
+    def get_upload(self, request, ticket_id, upload_id, lock=False):
+        uploads = ChunkedUpload.objects.select_for_update() if lock else ChunkedUpload.objects
+        return uploads.get(id=upload_id, ticket_id=ticket_id, user=request.user)
+
+class UploadChunkView(LoginRequiredMixin, ChunkedUploadMixin, View):
+    login_url = 'login'
+
+    # Resume: where should the next chunk start?
+    def get(self, request, ticket_id, upload_id):
+        try:
+            upload = self.get_upload(request, ticket_id, upload_id)
+        except ChunkedUpload.DoesNotExist:
+            return JsonResponse({'error': 'Upload not found'}, status=404)
+        return JsonResponse({'offset': upload.offset, 'size': upload.size})
+
+    def put(self, request, ticket_id, upload_id):
+        content_length = request.META.get('CONTENT_LENGTH')
+        offset = request.headers.get('Upload-Offset', '')
+        if not content_length or not content_length.isdigit():
+            return JsonResponse({'error': 'Content-Length is required'}, status=411)
+        if not offset.isdigit():
+            return JsonResponse({'error': 'Upload-Offset header is required'}, status=400)
+
+        try:
+            with transaction.atomic():
+                upload = self.get_upload(request, ticket_id, upload_id, lock=True)
+                if int(offset) != upload.offset:
+                    return JsonResponse({'error': 'Offset mismatch', 'offset': upload.offset}, status=409)
+                append_chunk(upload, request, int(content_length))
+                upload.save(update_fields=['offset', 'updated_at'])
+        except ChunkedUpload.DoesNotExist:
+            return JsonResponse({'error': 'Upload not found'}, status=404)
+        except UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+
+        return JsonResponse({'offset': upload.offset, 'size': upload.size})
+
+class UploadFinalizeView(LoginRequiredMixin, ChunkedUploadMixin, View):
+    login_url = 'login'
+
+    def post(self, request, ticket_id, upload_id):
+        try:
+            with transaction.atomic():
+                upload = self.get_upload(request, ticket_id, upload_id, lock=True)
+                path, digest = finish(upload)
+
+                expected = request.POST.get('sha256')
+                if expected and expected.lower() != digest:
+                    discard(upload)
+                    upload.delete()
+                    return JsonResponse({'error': 'Checksum mismatch, upload discarded'}, status=422)
+
+                with open(path, 'rb') as part:
+                    content = File(part, name=upload.file_name)
+                    # Already hashed while streaming; storage reuses it
+                    content.sha256 = digest
+                    message = create_file_message(request.user, upload.ticket, content, upload.file_name)
+                discard(upload)
+                upload.delete()
+        except ChunkedUpload.DoesNotExist:
+            return JsonResponse({'error': 'Upload not found'}, status=404)
+        except UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+
+        return JsonResponse({
+            'success': True,
+            'message_id': message.id,
+            'file_name': message.file_name,
+            'sha256': digest
+        })